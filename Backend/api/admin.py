@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, Cart, CartItem, Order, OrderItem
+from .models import Category, Product, Cart, CartItem, AbandonedCartDay, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, Job, RequestProfile, SlowQuery
 
 class ProductInline(admin.TabularInline):
     model = Product
@@ -22,9 +22,17 @@ class CartItemInline(admin.TabularInline):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'created_at', 'total_items', 'total_price')
+    list_display = ('user', 'created_at', 'updated_at', 'total_items', 'total_price')
     inlines = [CartItemInline]
 
+@admin.register(AbandonedCartDay)
+class AbandonedCartDayAdmin(admin.ModelAdmin):
+    list_display = ('date', 'carts', 'items', 'units', 'value')
+    readonly_fields = [field.name for field in AbandonedCartDay._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
@@ -33,4 +41,49 @@ class OrderItemInline(admin.TabularInline):
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'total_amount', 'status', 'created_at')
     list_filter = ('status', 'created_at')
-    inlines = [OrderItemInline]
\ No newline at end of file
+    inlines = [OrderItemInline]
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    readonly_fields = [field.name for field in ArchivedOrderItem._meta.fields]
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'total_amount', 'status', 'created_at', 'archived_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('=id', 'tracking_number', 'payment_transaction_id')
+    readonly_fields = [field.name for field in ArchivedOrder._meta.fields]
+    inlines = [ArchivedOrderItemInline]
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at')
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('id', 'method', 'path', 'status_code', 'mode', 'duration_ms', 'sql_count', 'sql_ms', 'serializer_ms', 'user', 'created_at')
+    list_filter = ('mode', 'method')
+    search_fields = ('path',)
+    readonly_fields = [field.name for field in RequestProfile._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('fingerprint', 'location', 'view', 'count', 'total_ms', 'max_ms', 'last_seen')
+    list_filter = ('view',)
+    search_fields = ('statement', 'location', 'fingerprint')
+    readonly_fields = [field.name for field in SlowQuery._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
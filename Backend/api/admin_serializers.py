@@ -1,10 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Category, Product, Order, OrderItem
+from .models import Category, Product, Order, OrderItem, RequestProfile
 from .serializers import OrderItemSerializer
+from .fieldsets import SparseFieldsetMixin
 
 
-class AdminUserSerializer(serializers.ModelSerializer):
+class AdminUserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for admin user management"""
     total_orders = serializers.SerializerMethodField()
     total_spent = serializers.SerializerMethodField()
@@ -15,16 +16,18 @@ class AdminUserSerializer(serializers.ModelSerializer):
                  'is_staff', 'is_active', 'date_joined', 'last_login',
                  'total_orders', 'total_spent')
         read_only_fields = ('date_joined', 'last_login')
+        sparse_sources = {'total_orders': (), 'total_spent': ()}
     
     def get_total_orders(self, obj):
-        return obj.orders.count()
+        return obj.orders.count() + obj.archived_orders.count()
     
     def get_total_spent(self, obj):
         total = sum(order.total_amount for order in obj.orders.all())
+        total += sum(order.total_amount for order in obj.archived_orders.all())
         return float(total)
 
 
-class AdminCategorySerializer(serializers.ModelSerializer):
+class AdminCategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for admin category management"""
     product_count = serializers.SerializerMethodField()
     
@@ -32,6 +35,7 @@ class AdminCategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = '__all__'
         read_only_fields = ('created_at',)
+        sparse_sources = {'product_count': ()}
     
     def get_product_count(self, obj):
         return obj.products.count()
@@ -39,6 +43,8 @@ class AdminCategorySerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         """Customize the representation to include full image URL"""
         data = super().to_representation(instance)
+        if 'image' not in data:
+            return data
         if instance.image:
             request = self.context.get('request')
             if request is not None:
@@ -50,19 +56,21 @@ class AdminCategorySerializer(serializers.ModelSerializer):
         return data
 
 
-class AdminProductSerializer(serializers.ModelSerializer):
+class AdminProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for admin product management"""
     category_name = serializers.CharField(source='category.name', read_only=True)
     discounted_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
         model = Product
-        fields = '__all__'
+        # The version is sent as the ETag header
+        exclude = ('effective_price', 'version')
+        sparse_sources = {'discounted_price': ('price', 'discount_percent')}
     
     def to_representation(self, instance):
         """Customize the representation to include full image URL"""
         data = super().to_representation(instance)
-        if instance.image:
+        if 'image' in data and instance.image:
             request = self.context.get('request')
             if request is not None:
                 data['image'] = request.build_absolute_uri(instance.image.url)
@@ -71,7 +79,7 @@ class AdminProductSerializer(serializers.ModelSerializer):
         return data
 
 
-class AdminOrderSerializer(serializers.ModelSerializer):
+class AdminOrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for admin order management"""
     items = OrderItemSerializer(many=True, read_only=True)
     user_username = serializers.CharField(source='user.username', read_only=True)
@@ -79,6 +87,15 @@ class AdminOrderSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Order
+        exclude = ('sales_recorded', 'related_recorded', 'version')
+
+
+class AdminRequestProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Serializer for stored request profiles"""
+    user_username = serializers.CharField(source='user.username', read_only=True, default=None)
+    
+    class Meta:
+        model = RequestProfile
         fields = '__all__'
 
 
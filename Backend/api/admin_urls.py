@@ -7,9 +7,13 @@ router.register(r'users', admin_views.AdminUserViewSet, basename='admin-user')
 router.register(r'categories', admin_views.AdminCategoryViewSet, basename='admin-category')
 router.register(r'products', admin_views.AdminProductViewSet, basename='admin-product')
 router.register(r'orders', admin_views.AdminOrderViewSet, basename='admin-order')
+router.register(r'profiles', admin_views.AdminRequestProfileViewSet, basename='admin-profile')
 
 urlpatterns = [
     path('stats/', admin_views.dashboard_stats, name='admin-stats'),
+    path('stats/events/', admin_views.dashboard_events_view, name='admin-stats-events'),
+    path('jobs/', admin_views.job_stats, name='admin-job-stats'),
+    path('carts/abandoned/', admin_views.abandoned_carts, name='admin-abandoned-carts'),
     path('sales-report/', admin_views.sales_report, name='admin-sales-report'),
     path('', include(router.urls)),
 ]
@@ -1,20 +1,34 @@
 from rest_framework import generics, status, viewsets
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAdminUser
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, SAFE_METHODS
 from django.contrib.auth.models import User
 from django.db.models import Sum, Count, Q, F
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import Category, Product, Order, OrderItem
+from .models import Category, Product, Order, OrderItem, RequestProfile, ArchivedOrder
 from .admin_serializers import (
     AdminUserSerializer, 
     AdminCategorySerializer, 
     AdminProductSerializer, 
     AdminOrderSerializer,
+    AdminRequestProfileSerializer,
     DashboardStatsSerializer
 )
+from .fieldsets import SparseFieldsetViewMixin
+from .streaming import StreamingListMixin, stream_format
+from .sales import top_products as top_selling_products
+from .jobs import queue_stats
+from .carts import abandoned_cart_stats
+from .concurrency import ETagMixin, if_match, retry_on_conflict
+from .search import search_orders, search_archived_orders, search_users
+from .archive import TieredOrders, archive_totals
+from .events import event_stream, authenticate_stream, parse_last_event_id
+from .dashboard import dashboard_events, latest_dashboard_event, replay_dashboard_events, DASHBOARD_KEY, LOW_STOCK_THRESHOLD
+from .bulk import select_ids, bulk_update_orders, bulk_update_products, ORDER_FILTERS, PRODUCT_FILTERS
 
 
 # Dashboard Statistics
@@ -22,14 +36,18 @@ from .admin_serializers import (
 @permission_classes([IsAdminUser])
 def dashboard_stats(request):
     """Get dashboard statistics"""
+    # Read first, so a stream resumed from this id misses nothing counted after it
+    last_event_id = latest_dashboard_event()
     total_users = User.objects.count()
     total_products = Product.objects.count()
-    total_orders = Order.objects.count()
-    total_revenue = Order.objects.aggregate(
+    # Archived orders are counted from their running totals, not scanned
+    archived_orders, archived_revenue = archive_totals()
+    total_orders = Order.objects.count() + archived_orders
+    total_revenue = (Order.objects.aggregate(
         total=Sum('total_amount')
-    )['total'] or 0
+    )['total'] or 0) + archived_revenue
     pending_orders = Order.objects.filter(status='pending').count()
-    low_stock_products = Product.objects.filter(stock__lt=10).count()
+    low_stock_products = Product.objects.filter(stock__lt=LOW_STOCK_THRESHOLD).count()
     recent_orders = Order.objects.all().order_by('-created_at')[:5]
     
     stats = {
@@ -43,7 +61,47 @@ def dashboard_stats(request):
     }
     
     serializer = DashboardStatsSerializer(stats)
-    return Response(serializer.data)
+    return Response({**serializer.data, 'last_event_id': last_event_id})
+
+
+async def dashboard_events_view(request):
+    """Server-sent events with deltas to the dashboard statistics
+
+    Load ``dashboard_stats`` once, then connect with its ``last_event_id``
+    and apply each event's ``deltas``.
+    """
+    user = await authenticate_stream(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    if not user.is_staff:
+        return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=403)
+    response = StreamingHttpResponse(
+        event_stream(dashboard_events, DASHBOARD_KEY, replay_dashboard_events, parse_last_event_id(request)),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Background Jobs
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def job_stats(request):
+    """Get background job queue depth and throughput"""
+    return Response(queue_stats())
+
+
+# Abandoned Carts
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def abandoned_carts(request):
+    """Get carts expired with items in them, per day"""
+    try:
+        days = min(max(int(request.query_params.get('days', 30)), 1), 365)
+    except ValueError:
+        return Response({'error': 'days must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(abandoned_cart_stats(days))
 
 
 # Sales Report
@@ -67,42 +125,52 @@ def sales_report(request):
     else:
         end_date = timezone.now()
     
-    # Filter orders by date range and completed payments
-    orders = Order.objects.filter(
-        created_at__gte=start_date,
-        created_at__lte=end_date,
-        payment_status='completed'
-    )
+    # Filter orders by date range and completed payments, in both tiers
+    tiers = [
+        model.objects.filter(
+            created_at__gte=start_date,
+            created_at__lte=end_date,
+            payment_status='completed'
+        )
+        for model in (Order, ArchivedOrder)
+    ]
     
     # Calculate sales metrics
-    total_revenue = orders.aggregate(total=Sum('total_amount'))['total'] or 0
-    total_orders = orders.count()
+    total_revenue = sum(orders.aggregate(total=Sum('total_amount'))['total'] or 0 for orders in tiers)
+    total_orders = sum(orders.count() for orders in tiers)
     avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
     
     # Group by date for sales chart
-    daily_sales = orders.extra({'date': "date(created_at)"}).values('date').annotate(
-        total_revenue=Sum('total_amount'),
-        total_orders=Count('id')
-    ).order_by('date')
+    daily_sales = {}
+    for orders in tiers:
+        for day in orders.extra({'date': "date(created_at)"}).values('date').annotate(
+            total_revenue=Sum('total_amount'),
+            total_orders=Count('id')
+        ):
+            totals = daily_sales.setdefault(day['date'], {'date': day['date'], 'total_revenue': 0, 'total_orders': 0})
+            totals['total_revenue'] += day['total_revenue']
+            totals['total_orders'] += day['total_orders']
     
-    # Top selling products
-    top_products = OrderItem.objects.filter(order__in=orders).values(
-        'product__name'
-    ).annotate(
-        total_quantity=Sum('quantity'),
-        total_revenue=Sum(models.F('price') * models.F('quantity'))
-    ).order_by('-total_quantity')[:10]
+    # Top selling products, read from the daily sales counters
+    if request.query_params.get('end_date'):
+        last_day = (end_date - timedelta(days=1)).date()
+    else:
+        last_day = timezone.localdate()
+    top_products = top_selling_products(start_date.date(), last_day)
     
     # Orders by status
-    orders_by_status = orders.values('status').annotate(count=Count('id'))
+    orders_by_status = {}
+    for orders in tiers:
+        for row in orders.values('status').annotate(count=Count('id')):
+            orders_by_status[row['status']] = orders_by_status.get(row['status'], 0) + row['count']
     
     report_data = {
         'total_revenue': total_revenue,
         'total_orders': total_orders,
         'avg_order_value': avg_order_value,
-        'daily_sales': list(daily_sales),
-        'top_products': list(top_products),
-        'orders_by_status': list(orders_by_status),
+        'daily_sales': [daily_sales[day] for day in sorted(daily_sales)],
+        'top_products': top_products,
+        'orders_by_status': [{'status': key, 'count': count} for key, count in orders_by_status.items()],
         'date_range': {
             'start': start_date.strftime('%Y-%m-%d'),
             'end': (end_date - timedelta(days=1)).strftime('%Y-%m-%d')
@@ -113,7 +181,7 @@ def sales_report(request):
 
 
 # User Management ViewSet
-class AdminUserViewSet(viewsets.ModelViewSet):
+class AdminUserViewSet(SparseFieldsetViewMixin, StreamingListMixin, viewsets.ModelViewSet):
     """ViewSet for managing users"""
     queryset = User.objects.all().order_by('-date_joined')
     serializer_class = AdminUserSerializer
@@ -122,15 +190,11 @@ class AdminUserViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = User.objects.all().order_by('-date_joined')
         
-        # Search by username or email
+        # Search by username, email or name, best matches first
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(username__icontains=search) | 
-                Q(email__icontains=search) |
-                Q(first_name__icontains=search) |
-                Q(last_name__icontains=search)
-            )
+            queryset, complete = search_users(queryset, search)
+            self.search_partial = not complete
         
         # Filter by staff status
         is_staff = self.request.query_params.get('is_staff', None)
@@ -144,6 +208,13 @@ class AdminUserViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'search_partial', False):
+            # Substring matching stopped at its scan budget; more users may match
+            response['Search-Partial'] = 'true'
+        return response
+    
     @action(detail=True, methods=['post'])
     def toggle_staff(self, request, pk=None):
         """Toggle staff status for a user"""
@@ -164,7 +235,7 @@ class AdminUserViewSet(viewsets.ModelViewSet):
 
 
 # Category Management ViewSet
-class AdminCategoryViewSet(viewsets.ModelViewSet):
+class AdminCategoryViewSet(SparseFieldsetViewMixin, StreamingListMixin, viewsets.ModelViewSet):
     """ViewSet for managing categories"""
     queryset = Category.objects.all().order_by('-created_at')
     serializer_class = AdminCategorySerializer
@@ -206,7 +277,7 @@ class AdminCategoryViewSet(viewsets.ModelViewSet):
 
 
 # Product Management ViewSet
-class AdminProductViewSet(viewsets.ModelViewSet):
+class AdminProductViewSet(ETagMixin, SparseFieldsetViewMixin, StreamingListMixin, viewsets.ModelViewSet):
     """ViewSet for managing products"""
     queryset = Product.objects.all().order_by('-created_at')
     serializer_class = AdminProductSerializer
@@ -239,30 +310,54 @@ class AdminProductViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def update_stock(self, request, pk=None):
-        """Update product stock"""
+        """Set product stock, or adjust it by stock_delta
+
+        A delta without If-Match is retried on the current row when another
+        update got in first, since deltas can be applied in any order.
+        """
         product = self.get_object()
         stock = request.data.get('stock')
+        delta = request.data.get('stock_delta')
         
-        if stock is None:
+        if (stock is None) == (delta is None):
             return Response(
-                {'error': 'Stock value is required'},
+                {'error': 'Either stock or stock_delta is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         try:
-            product.stock = int(stock)
-            product.save()
-            serializer = self.get_serializer(product)
-            return Response(serializer.data)
-        except ValueError:
+            value = int(stock if delta is None else delta)
+        except (TypeError, ValueError):
             return Response(
                 {'error': 'Invalid stock value'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        
+        def apply(product):
+            new_stock = value if delta is None else product.stock + value
+            if new_stock < 0:
+                raise ValidationError({'error': 'Stock cannot go below zero'})
+            product.stock = new_stock
+            product.save(update_fields=['stock'])
+        
+        if delta is not None and 'If-Match' not in request.headers:
+            product = self.versioned_object = retry_on_conflict(product, apply)
+        else:
+            with if_match(request, product):
+                apply(product)
+        serializer = self.get_serializer(product)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_update(self, request):
+        """Set stock, adjust it by stock_delta, or set discount_percent on many products"""
+        ids, not_found = select_ids(Product.objects.all(), request.data, PRODUCT_FILTERS)
+        bulk_update_products(ids, request.data)
+        return Response({'updated': ids, 'not_found': not_found})
 
 
 # Order Management ViewSet
-class AdminOrderViewSet(viewsets.ModelViewSet):
+class AdminOrderViewSet(ETagMixin, SparseFieldsetViewMixin, StreamingListMixin, viewsets.ModelViewSet):
     """ViewSet for managing orders"""
     queryset = Order.objects.all().order_by('-created_at')
     serializer_class = AdminOrderSerializer
@@ -270,8 +365,12 @@ class AdminOrderViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'put', 'patch', 'delete']  # Added POST for actions
     
     def get_queryset(self):
-        queryset = Order.objects.all().order_by('-created_at')
-        
+        return self.filter_orders(Order.objects.all().order_by('-created_at'), search_orders)
+    
+    def get_archived_queryset(self):
+        return self.filter_orders(ArchivedOrder.objects.all().order_by('-created_at'), search_archived_orders)
+    
+    def filter_orders(self, queryset, search_function):
         # Filter by status
         status_filter = self.request.query_params.get('status', None)
         if status_filter:
@@ -282,17 +381,50 @@ class AdminOrderViewSet(viewsets.ModelViewSet):
         if user_id:
             queryset = queryset.filter(user_id=user_id)
         
-        # Search by order ID or user
+        # Search by order ID, tracking number, user or transaction ID
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(id__icontains=search) |
-                Q(user__username__icontains=search) |
-                Q(user__email__icontains=search)
-            )
+            queryset = search_function(queryset, search)
         
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """Current orders, then archived ones, in one paginated list"""
+        fmt = stream_format(request)
+        if fmt is not None:
+            return self.stream(fmt)
+        orders = TieredOrders(*self.get_stream_querysets())
+        page = self.paginate_queryset(orders)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(orders, many=True).data)
+    
+    def get_stream_querysets(self):
+        return [self.filter_queryset(self.get_queryset()), self.filter_queryset(self.get_archived_queryset())]
+    
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            # Archived orders can be read but not changed
+            if self.request.method not in SAFE_METHODS:
+                raise
+        order = get_object_or_404(self.get_archived_queryset(), pk=self.kwargs['pk'])
+        self.check_object_permissions(self.request, order)
+        return order
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream all matching orders as an NDJSON (default) or JSON download"""
+        return self.stream(stream_format(request, default='ndjson'), filename='orders')
+    
+    @action(detail=False, methods=['post'])
+    def bulk_update(self, request):
+        """Set status and/or tracking_number on many orders"""
+        ids, not_found = select_ids(Order.objects.all(), request.data, ORDER_FILTERS)
+        bulk_update_orders(ids, request.data)
+        return Response({'updated': ids, 'not_found': not_found})
+    
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
         """Update order status"""
@@ -305,7 +437,16 @@ class AdminOrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        order.status = new_status
-        order.save()
+        with if_match(request, order):
+            order.status = new_status
+            order.save(update_fields=['status'])
         serializer = self.get_serializer(order)
         return Response(serializer.data)
+
+
+# Request Profiles ViewSet
+class AdminRequestProfileViewSet(SparseFieldsetViewMixin, viewsets.ReadOnlyModelViewSet):
+    """ViewSet for browsing the latest request profiles"""
+    queryset = RequestProfile.objects.all()
+    serializer_class = AdminRequestProfileSerializer
+    permission_classes = [IsAdminUser]
@@ -1,15 +1,10 @@
-import logging
 from django.apps import AppConfig
 
-logger = logging.getLogger(__name__)
-logger.debug("Loading api.apps")
-
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
     
     def ready(self):
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.debug("ApiConfig.ready() called")
\ No newline at end of file
+        # Signals, and the modules that register background tasks
+        from . import signals, idempotency, carts, metrics, slow_queries  # noqa: F401
\ No newline at end of file
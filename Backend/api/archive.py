@@ -0,0 +1,126 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderArchiveTotals, OrderEvent, OrderItem, OrderSearchTerm
+
+ARCHIVED_STATUSES = ('delivered', 'cancelled')
+
+ORDER_FIELDS = [field.attname for field in ArchivedOrder._meta.concrete_fields if field.name != 'archived_at']
+ITEM_FIELDS = [field.attname for field in ArchivedOrderItem._meta.concrete_fields]
+
+
+def archivable_orders(cutoff):
+    """Finished orders last changed before ``cutoff`` that the counter jobs are done with
+
+    An order still waiting for the sales or related-products job stays
+    until the job has run, since the jobs only read the hot tables.
+    """
+    counted = Q(payment_status='completed') & ~Q(status='cancelled')
+    return Order.objects.filter(status__in=ARCHIVED_STATUSES, updated_at__lt=cutoff).filter(
+        (counted & Q(sales_recorded=True)) | (~counted & Q(sales_recorded=False)),
+        Q(related_recorded=True) | ~Q(payment_status='completed'),
+    )
+
+
+def archive_batch(cutoff, batch_size):
+    """Move one batch of orders and their items to the archive; returns the number moved
+
+    Each batch is one transaction, so an interrupted run leaves every order
+    in exactly one tier and the next run carries on from there.
+    """
+    with transaction.atomic():
+        ids = list(
+            archivable_orders(cutoff).select_for_update().order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        orders = list(Order.objects.filter(pk__in=ids).values(*ORDER_FIELDS))
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(**item) for item in OrderItem.objects.filter(order_id__in=ids).values(*ITEM_FIELDS)
+        ], batch_size=500)
+
+        OrderArchiveTotals.objects.get_or_create(pk=1)
+        OrderArchiveTotals.objects.filter(pk=1).update(
+            orders=F('orders') + len(orders),
+            revenue=F('revenue') + sum(order['total_amount'] for order in orders)
+        )
+
+        OrderItem.objects.filter(order_id__in=ids).delete()
+        OrderSearchTerm.objects.filter(order_id__in=ids).delete()
+        OrderEvent.objects.filter(order_id__in=ids).delete()
+        # Set-based, like the bulk updates: a per-order post_delete would take
+        # the orders off the dashboard totals, which still count them
+        queryset = Order.objects.filter(pk__in=ids)
+        queryset._raw_delete(queryset.db)
+        return len(orders)
+
+
+def archive_orders(days, batch_size, max_batches=None, progress=None):
+    """Archive every finished order older than ``days``, a batch at a time; returns the total moved"""
+    cutoff = timezone.now() - timedelta(days=days)
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(cutoff, batch_size)
+        if not count:
+            break
+        moved += count
+        batches += 1
+        if progress is not None:
+            progress(moved)
+    return moved
+
+
+def archive_totals():
+    """(orders, revenue) of the archive"""
+    totals = OrderArchiveTotals.objects.filter(pk=1).values_list('orders', 'revenue').first()
+    return totals or (0, 0)
+
+
+def uncount_archived_order(order):
+    OrderArchiveTotals.objects.filter(pk=1).update(
+        orders=F('orders') - 1,
+        revenue=F('revenue') - order.total_amount
+    )
+
+
+class TieredOrders:
+    """Hot orders followed by archived ones, as one list a paginator can slice
+
+    Archived orders are all finished and older than the archive cutoff, so
+    listing them after the hot tier stays close to newest first without
+    merging the tables. Each page only queries the tiers it covers.
+    """
+    ordered = True
+
+    def __init__(self, hot, archived):
+        self.hot = hot
+        self.archived = archived
+        self._hot_count = None
+
+    def hot_count(self):
+        if self._hot_count is None:
+            self._hot_count = self.hot.count()
+        return self._hot_count
+
+    def count(self):
+        return self.hot_count() + self.archived.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        yield from self.hot
+        yield from self.archived
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        hot = self.hot_count()
+        rows = list(self.hot[start:min(stop, hot)]) if start < hot else []
+        if stop > hot:
+            rows += list(self.archived[max(start - hot, 0):stop - hot])
+        return rows
@@ -0,0 +1,138 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.http import Http404, HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+# Headers of the batch request that must not reach its sub-requests
+DROPPED_META = (
+    'CONTENT_TYPE',
+    'CONTENT_LENGTH',
+    'HTTP_IF_NONE_MATCH',
+    'HTTP_IF_MODIFIED_SINCE',
+    'HTTP_IDEMPOTENCY_KEY',
+    'HTTP_X_PROFILE',
+)
+
+
+class BatchError(Exception):
+    """A sub-request that cannot be run, with the status it is reported under"""
+
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def parse_items(data):
+    """Validate a batch body, ``{"requests": [...], "parallel": bool}``; returns (items, parallel)
+
+    Each item is a path with its query string, or ``{"path": ..., "method": "GET"}``.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list):
+        raise ValueError('requests must be a list')
+    items = data['requests']
+    if not items:
+        raise ValueError('requests must not be empty')
+    if len(items) > settings.BATCH_MAX_REQUESTS:
+        raise ValueError(f'At most {settings.BATCH_MAX_REQUESTS} requests are allowed per batch')
+    return [item if isinstance(item, dict) else {'path': item} for item in items], bool(data.get('parallel'))
+
+
+def resolve_view(path):
+    """The resolver match of a path that may be batched"""
+    if not isinstance(path, str) or not path.startswith('/api/'):
+        raise BatchError(400, 'Only /api/ paths can be batched')
+    try:
+        match = resolve(path)
+    except Resolver404:
+        raise BatchError(404, 'Not found.')
+    view_class = getattr(match.func, 'cls', None)
+    # Plain Django views (event streams, the batch endpoint itself) are left out
+    if view_class is None or not issubclass(view_class, APIView) or match.url_name == 'batch':
+        raise BatchError(400, f'{path} cannot be batched')
+    return match
+
+
+def build_request(request, path, query):
+    """A GET sub-request carrying the batch request's headers and its authenticated user
+
+    DRF takes ``_force_auth_user`` instead of running the authenticators
+    again, so the credentials are checked once for the whole batch.
+    """
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = path
+    sub.META = {key: value for key, value in request.META.items() if key not in DROPPED_META}
+    sub.META.update({
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'HTTP_ACCEPT': 'application/json',
+    })
+    sub.GET = QueryDict(query)
+    sub.COOKIES = request.COOKIES
+    sub.user = request.user
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    return sub
+
+
+def response_body(response):
+    if getattr(response, 'streaming', False):
+        raise BatchError(400, 'Streaming responses cannot be batched')
+    if isinstance(response, Response):
+        # Rendered once, with the batch response
+        return response.data
+    if not response.content:
+        return None
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(response.content)
+    return response.content.decode(response.charset)
+
+
+def run_item(request, item):
+    """Run one sub-request; returns ``{"path", "status", "body"}``"""
+    path = item.get('path')
+    try:
+        if str(item.get('method', 'GET')).upper() != 'GET':
+            raise BatchError(405, 'Only GET requests can be batched')
+        parts = urlsplit(path if isinstance(path, str) else '')
+        match = resolve_view(parts.path)
+        sub = build_request(request, parts.path, parts.query)
+        sub.resolver_match = match
+        response = match.func(sub, *match.args, **match.kwargs)
+        return {'path': path, 'status': response.status_code, 'body': response_body(response)}
+    except BatchError as error:
+        return {'path': path, 'status': error.status, 'body': {'detail': error.detail}}
+    except Http404:
+        return {'path': path, 'status': 404, 'body': {'detail': 'Not found.'}}
+    except PermissionDenied:
+        return {'path': path, 'status': 403, 'body': {'detail': 'You do not have permission to perform this action.'}}
+    except Exception:
+        logger.exception('Batched request to %s failed', path)
+        return {'path': path, 'status': 500, 'body': {'detail': 'Internal server error.'}}
+
+
+def _run_in_thread(request, item):
+    try:
+        return run_item(request, item)
+    finally:
+        # Connections are per thread; the pool's threads do not outlive the batch
+        connections.close_all()
+
+
+def run_batch(request, items, parallel=False):
+    """Run sub-requests in order, or on up to ``BATCH_MAX_WORKERS`` threads; results keep the order"""
+    if not parallel or len(items) == 1:
+        return [run_item(request, item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(settings.BATCH_MAX_WORKERS, len(items))) as pool:
+        return list(pool.map(lambda item: _run_in_thread(request, item), items))
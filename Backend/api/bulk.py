@@ -0,0 +1,201 @@
+from datetime import timedelta
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Case, When, Value, F, CharField, DateTimeField, DecimalField, IntegerField
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .models import Order, Product
+from .catalog import catalog_changed
+from .sales import queue_orders_sales
+from .search import index_orders
+from .events import record_order_events
+from .dashboard import order_totals_by_id, record_orders_change, product_stocks, record_stocks_change
+
+# Most rows a single bulk request may change
+BULK_MAX_ROWS = 1000
+
+# Lookups accepted in a bulk request's "filter" object
+ORDER_FILTERS = ('status', 'payment_status', 'user', 'created_at__gte', 'created_at__lte')
+PRODUCT_FILTERS = (
+    'category', 'stock', 'stock__lt', 'stock__lte', 'discount_percent', 'price__gte', 'price__lte'
+)
+
+
+def select_ids(queryset, data, allowed_filters):
+    """Resolve the ``ids`` or ``filter`` of a bulk request to (found, not_found)"""
+    ids = data.get('ids')
+    lookups = data.get('filter')
+    if (ids is None) == (lookups is None):
+        raise ValidationError({'error': 'Provide either ids or filter'})
+
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+            raise ValidationError({'ids': 'Must be a list of integers'})
+        requested = list(dict.fromkeys(ids))
+        if len(requested) > BULK_MAX_ROWS:
+            raise ValidationError({'ids': f'At most {BULK_MAX_ROWS} ids per request'})
+        found = set(queryset.filter(pk__in=requested).values_list('pk', flat=True))
+        return [pk for pk in requested if pk in found], [pk for pk in requested if pk not in found]
+
+    if not isinstance(lookups, dict) or not lookups:
+        raise ValidationError({'filter': 'Must be a non-empty object'})
+    unknown = sorted(set(lookups) - set(allowed_filters))
+    if unknown:
+        raise ValidationError({'filter': f"Unsupported lookups: {', '.join(unknown)}"})
+    try:
+        found = list(
+            queryset.filter(**lookups).order_by('pk').values_list('pk', flat=True)[:BULK_MAX_ROWS + 1]
+        )
+    except (TypeError, ValueError, DjangoValidationError):
+        raise ValidationError({'filter': 'Invalid filter value'})
+    if len(found) > BULK_MAX_ROWS:
+        raise ValidationError({'filter': f'Matches more than {BULK_MAX_ROWS} rows'})
+    return found, []
+
+
+def _parse(data, name, convert):
+    """Return None, one value for every row, or a dict of id -> value"""
+    if name not in data:
+        return None
+    value = data[name]
+    try:
+        if isinstance(value, dict):
+            return {int(pk): convert(item) for pk, item in value.items()}
+        return convert(value)
+    except (TypeError, ValueError) as exc:
+        raise ValidationError({name: str(exc) or 'Invalid value'})
+
+
+def _choice(choices):
+    def convert(value):
+        if value not in dict(choices):
+            raise ValueError(f'Invalid choice: {value}')
+        return value
+    return convert
+
+
+def _text(max_length):
+    def convert(value):
+        value = str(value)
+        if len(value) > max_length:
+            raise ValueError(f'At most {max_length} characters')
+        return value
+    return convert
+
+
+def _integer(minimum=None, maximum=None):
+    def convert(value):
+        if isinstance(value, bool):
+            raise ValueError('Must be an integer')
+        value = int(value)
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            raise ValueError(f'Must be between {minimum} and {maximum}')
+        return value
+    return convert
+
+
+def _for_rows(value, field, output_field, expression=None):
+    """Turn a parsed value into an UPDATE expression for ``field``
+
+    A dict becomes a ``CASE`` on the primary key; rows without an entry
+    keep their current value.
+    """
+    expression = expression or (lambda item: Value(item, output_field=output_field))
+    if not isinstance(value, dict):
+        return expression(value)
+    return Case(
+        *[When(pk=pk, then=expression(item)) for pk, item in value.items()],
+        default=F(field),
+        output_field=output_field
+    )
+
+
+def _value_for(value, pk):
+    return value.get(pk) if isinstance(value, dict) else value
+
+
+def bulk_update_orders(ids, data):
+    """Set status and tracking numbers on many orders with one UPDATE"""
+    new_status = _parse(data, 'status', _choice(Order.STATUS_CHOICES))
+    tracking = _parse(data, 'tracking_number', _text(100))
+    if new_status is None and tracking is None:
+        raise ValidationError({'error': 'Nothing to update'})
+
+    now = timezone.now()
+    # The version bump makes ETags handed out before the update stop matching
+    changes = {'updated_at': Value(now, output_field=DateTimeField()), 'version': F('version') + 1}
+    if tracking is not None:
+        changes['tracking_number'] = _for_rows(tracking, 'tracking_number', CharField())
+    if new_status is not None:
+        changes['status'] = _for_rows(new_status, 'status', CharField())
+        # Same shipping dates as update_shipping_status
+        shipped = [pk for pk in ids if _value_for(new_status, pk) == 'shipped']
+        if shipped:
+            changes['shipped_date'] = Case(
+                When(pk__in=shipped, then=Coalesce(F('shipped_date'), Value(now))),
+                default=F('shipped_date'),
+                output_field=DateTimeField()
+            )
+            changes['estimated_delivery_date'] = Case(
+                When(pk__in=shipped, then=Coalesce(
+                    F('estimated_delivery_date'),
+                    Coalesce(F('shipped_date'), Value(now)) + Value(timedelta(days=5))
+                )),
+                default=F('estimated_delivery_date'),
+                output_field=DateTimeField()
+            )
+
+    with transaction.atomic():
+        totals = order_totals_by_id(ids) if new_status is not None else None
+        Order.objects.filter(pk__in=ids).update(**changes)
+        if tracking is not None:
+            index_orders(ids)
+        # Pushed to the owners' order event streams and, as one update, the admin dashboard
+        record_order_events(ids)
+        if totals is not None:
+            record_orders_change(totals, order_totals_by_id(ids))
+        if new_status is not None and ids:
+            # The UPDATE skips the post_save signal, so the sales counters are synced here
+            queue_orders_sales(ids)
+
+
+def bulk_update_products(ids, data):
+    """Set or adjust stock and discounts on many products with one UPDATE"""
+    stock = _parse(data, 'stock', _integer(minimum=0))
+    stock_delta = _parse(data, 'stock_delta', _integer())
+    discount = _parse(data, 'discount_percent', _integer(0, 100))
+    if stock is not None and stock_delta is not None:
+        raise ValidationError({'error': 'Use either stock or stock_delta'})
+    if stock is None and stock_delta is None and discount is None:
+        raise ValidationError({'error': 'Nothing to update'})
+
+    changes = {'updated_at': Value(timezone.now(), output_field=DateTimeField()), 'version': F('version') + 1}
+    if stock is not None:
+        changes['stock'] = _for_rows(stock, 'stock', IntegerField())
+    if stock_delta is not None:
+        changes['stock'] = _for_rows(
+            stock_delta, 'stock', IntegerField(),
+            lambda delta: Greatest(F('stock') + Value(delta), Value(0))
+        )
+
+    with transaction.atomic():
+        if discount is not None:
+            changes['discount_percent'] = _for_rows(discount, 'discount_percent', IntegerField())
+            # Effective prices are worked out like Product.save() and written in the same UPDATE
+            prices = Product.objects.select_for_update().filter(pk__in=ids).values_list(
+                'pk', 'price', 'discount_percent'
+            )
+            effective = {}
+            for pk, price, current in prices:
+                percent = _value_for(discount, pk)
+                effective[pk] = Product.compute_effective_price(price, current if percent is None else percent)
+            changes['effective_price'] = _for_rows(
+                effective, 'effective_price', DecimalField(max_digits=10, decimal_places=2)
+            )
+        stocks = product_stocks(ids) if 'stock' in changes else None
+        Product.objects.filter(pk__in=ids).update(**changes)
+        if stocks is not None:
+            record_stocks_change(ids, stocks)
+        # Invalidate facets and rebuild the snapshot once for the whole batch
+        catalog_changed()
@@ -0,0 +1,124 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from .jobs import task
+from .models import AbandonedCartDay, Cart, CartItem
+from .pricing import product_table
+
+
+def touch_cart(cart):
+    """Push back the expiry of a cart whose items changed"""
+    Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+
+
+def record_abandoned(lines):
+    """Add carts expired with items, given as (cart, product, quantity) lines, to today's statistics"""
+    if not lines:
+        return
+    prices = product_table.get_many({product_id for cart_id, product_id, quantity in lines})
+    value = sum(
+        prices[product_id].discounted_price * quantity
+        for cart_id, product_id, quantity in lines if product_id in prices
+    )
+    day = timezone.localdate()
+    AbandonedCartDay.objects.get_or_create(date=day)
+    AbandonedCartDay.objects.filter(date=day).update(
+        carts=F('carts') + len({cart_id for cart_id, product_id, quantity in lines}),
+        items=F('items') + len(lines),
+        units=F('units') + sum(quantity for cart_id, product_id, quantity in lines),
+        value=F('value') + value
+    )
+
+
+def expire_batch(cutoff, batch_size):
+    """Delete one batch of carts untouched since ``cutoff``; returns (carts picked, carts deleted)"""
+    with transaction.atomic():
+        ids = list(
+            Cart.objects.select_for_update().filter(updated_at__lt=cutoff)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0, 0
+        # Checked again: a cart touched since it was picked (where the lock
+        # above does nothing, as on SQLite) is neither counted nor deleted
+        expired = Cart.objects.filter(pk__in=ids, updated_at__lt=cutoff)
+        record_abandoned(list(CartItem.objects.filter(cart__in=expired).values_list('cart_id', 'product_id', 'quantity')))
+        # Nothing listens for cart deletes, so the items go in one DELETE too
+        deleted, per_model = expired.delete()
+        return len(ids), per_model.get(Cart._meta.label, 0)
+
+
+def duplicate_lines():
+    """(cart, product) pairs with more than one line, which add_to_cart can create under concurrency"""
+    return (
+        CartItem.objects.order_by().values_list('cart_id', 'product_id')
+        .annotate(lines=Count('id')).filter(lines__gt=1)
+    )
+
+
+def compact_batch(pairs):
+    """Merge the lines of each (cart, product) pair into its oldest; returns the lines removed"""
+    removed = 0
+    with transaction.atomic():
+        for cart_id, product_id in pairs:
+            lines = list(
+                CartItem.objects.select_for_update().filter(cart_id=cart_id, product_id=product_id)
+                .order_by('id').values_list('id', 'quantity')
+            )
+            if len(lines) < 2:
+                continue
+            keep = lines[0][0]
+            CartItem.objects.filter(pk=keep).update(quantity=sum(quantity for pk, quantity in lines))
+            removed += CartItem.objects.filter(pk__in=[pk for pk, quantity in lines[1:]]).delete()[0]
+    return removed
+
+
+def _pause():
+    # Lets waiting writers take the database lock between batches
+    time.sleep(settings.CART_CLEANUP_PAUSE)
+
+
+@task('carts.clean_up', every=3600)
+def clean_up_carts():
+    """Expire carts untouched for ``CART_EXPIRY_DAYS`` and merge duplicate lines
+
+    Work is done in short transactions of ``CART_CLEANUP_BATCH_SIZE`` carts
+    with a pause after each, and at most ``CART_CLEANUP_MAX_BATCHES`` per
+    run of each step; a larger backlog is left for the next run. Returns
+    (carts expired, lines merged away).
+    """
+    batch_size = settings.CART_CLEANUP_BATCH_SIZE
+    max_batches = settings.CART_CLEANUP_MAX_BATCHES
+    cutoff = timezone.now() - timedelta(days=settings.CART_EXPIRY_DAYS)
+    expired = 0
+    for batch in range(max_batches):
+        if batch:
+            _pause()
+        picked, deleted = expire_batch(cutoff, batch_size)
+        expired += deleted
+        if picked < batch_size:
+            break
+
+    merged = 0
+    pairs = [(cart_id, product_id) for cart_id, product_id, lines in duplicate_lines()[:batch_size * max_batches]]
+    for start in range(0, len(pairs), batch_size):
+        if start:
+            _pause()
+        merged += compact_batch(pairs[start:start + batch_size])
+    return expired, merged
+
+
+def abandoned_cart_stats(days=30):
+    """Daily abandonment statistics for the last ``days`` days, with their totals and the carts still open"""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = AbandonedCartDay.objects.filter(date__gte=since).order_by('date')
+    totals = rows.aggregate(carts=Sum('carts'), items=Sum('items'), units=Sum('units'), value=Sum('value'))
+    return {
+        'days': list(rows.values('date', 'carts', 'items', 'units', 'value')),
+        'totals': {name: total or 0 for name, total in totals.items()},
+        'open_carts': Cart.objects.filter(items__isnull=False).distinct().count(),
+        'expiry_days': settings.CART_EXPIRY_DAYS,
+    }
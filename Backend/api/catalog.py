@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from whitenoise.compress import Compressor
+from .models import Category, Product, CatalogVersion
+from .serializers import CategorySerializer, ProductSerializer
+from .fastpath import compile_serializer
+from .jobs import task, enqueue
+from .pricing import product_table
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+SNAPSHOT_NAME_RE = re.compile(r'^catalog\.(?P<version>[0-9a-f]{12})\.json(\.gz|\.br)?$')
+
+_build_lock = threading.Lock()
+_manifest_cache = (None, None)
+
+
+def snapshot_root():
+    return settings.CATALOG_SNAPSHOT_ROOT
+
+
+def snapshot_url(version):
+    return f'{settings.CATALOG_SNAPSHOT_URL}catalog.{version}.json'
+
+
+def _write_atomic(path, data):
+    temp_path = f'{path}.tmp{os.getpid()}'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def render_catalog():
+    """Render all categories and products with the storefront serializers"""
+    renderer = JSONRenderer()
+    categories = CategorySerializer(Category.objects.order_by('id'), many=True).data
+    compiled = compile_serializer(ProductSerializer(context={}))
+    rows = Product.objects.order_by('id').values(*compiled.columns).iterator(chunk_size=1000)
+    products = compiled.bind({}).render_rows(rows)
+    return renderer.render({'categories': categories, 'products': products})
+
+
+@task('catalog.build_snapshot')
+def build_snapshot():
+    """Write a versioned catalog snapshot with precompressed copies
+
+    The version is a hash of the content, so unchanged catalogs map onto the
+    same file and the file can be cached forever. The manifest is replaced
+    last, after every file it points at exists.
+    """
+    with _build_lock:
+        root = snapshot_root()
+        os.makedirs(root, exist_ok=True)
+        data = render_catalog()
+        version = hashlib.sha256(data).hexdigest()[:12]
+        path = os.path.join(root, f'catalog.{version}.json')
+
+        if not os.path.exists(path):
+            compressor = Compressor(quiet=True)
+            if compressor.use_brotli:
+                _write_atomic(f'{path}.br', compressor.compress_brotli(data))
+            _write_atomic(f'{path}.gz', compressor.compress_gzip(data))
+            _write_atomic(path, data)
+
+        manifest = {
+            'version': version,
+            'url': snapshot_url(version),
+            'generated_at': timezone.now().isoformat(),
+        }
+        _write_atomic(os.path.join(root, MANIFEST_NAME), json.dumps(manifest).encode())
+        prune_snapshots(keep=version)
+        logger.info("Built catalog snapshot %s", version)
+        return manifest
+
+
+def prune_snapshots(keep):
+    """Delete all but the newest snapshots, always keeping ``keep``"""
+    root = snapshot_root()
+    versions = {}
+    for name in os.listdir(root):
+        match = SNAPSHOT_NAME_RE.match(name)
+        if match:
+            versions.setdefault(match.group('version'), []).append(name)
+
+    def modified(version):
+        return max(os.path.getmtime(os.path.join(root, name)) for name in versions[version])
+
+    older = sorted((v for v in versions if v != keep), key=modified, reverse=True)
+    for version in older[max(settings.CATALOG_SNAPSHOT_KEEP - 1, 0):]:
+        for name in versions[version]:
+            os.remove(os.path.join(root, name))
+
+
+def read_manifest():
+    """Return the current manifest, re-reading the file only when it changes"""
+    global _manifest_cache
+    path = os.path.join(snapshot_root(), MANIFEST_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached_mtime, manifest = _manifest_cache
+    if cached_mtime != mtime:
+        with open(path) as f:
+            manifest = json.load(f)
+        _manifest_cache = (mtime, manifest)
+    return manifest
+
+
+def schedule_snapshot():
+    """Queue a rebuild once changes have been quiet for the debounce delay
+
+    Under a steady stream of changes the rebuild still runs within
+    ``CATALOG_SNAPSHOT_MAX_DELAY`` seconds of the first one.
+    """
+    delay = settings.CATALOG_SNAPSHOT_DEBOUNCE
+    if delay is None:
+        return
+    enqueue(
+        'catalog.build_snapshot', delay=delay, unique_key='catalog:snapshot', debounce=True,
+        max_delay=settings.CATALOG_SNAPSHOT_MAX_DELAY
+    )
+
+
+def catalog_version():
+    """Return the current catalog version shared by all workers"""
+    return CatalogVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+def bump_catalog_version():
+    updated = CatalogVersion.objects.filter(pk=1).update(
+        version=F('version') + 1,
+        updated_at=timezone.now()
+    )
+    if not updated:
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+def catalog_changed(**kwargs):
+    """Signal receiver for product and category changes"""
+    bump_catalog_version()
+    product_table.expire()
+    schedule_snapshot()
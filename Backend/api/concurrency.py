@@ -0,0 +1,110 @@
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .models import VersionConflict
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource has changed since it was read; reload it and try again.'
+    default_code = 'precondition_failed'
+
+
+class EditConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The resource is being changed by others; try again.'
+    default_code = 'conflict'
+
+
+def etag(instance):
+    return quote_etag(f'{instance.pk}-{instance.version}')
+
+
+def if_match_version(request, instance):
+    """The version an ``If-Match`` header pins ``instance`` to, or None without one
+
+    Raises PreconditionFailed when the header names none of the current
+    version. Weak ETags never match, as ``If-Match`` compares strongly.
+    """
+    header = request.headers.get('If-Match')
+    if not header:
+        return None
+    tags = parse_etags(header)
+    if tags == ['*']:
+        return None
+    if etag(instance) not in tags:
+        raise PreconditionFailed()
+    return instance.version
+
+
+@contextmanager
+def if_match(request, instance):
+    """Make the saves of ``instance`` in the block conditional on the request's ``If-Match``
+
+    The header is checked against the loaded row first, and the UPDATE
+    then only applies if no other save got in between.
+    """
+    version = if_match_version(request, instance)
+    if version is not None:
+        instance.expected_version = version
+    try:
+        yield
+    except VersionConflict:
+        raise PreconditionFailed()
+    finally:
+        instance.__dict__.pop('expected_version', None)
+
+
+def retry_on_conflict(instance, change):
+    """Apply ``change(instance)`` with a conditional save, retrying on a fresh copy after a conflict
+
+    Only for changes that commute, such as stock deltas: each retry reapplies
+    the change to whatever the row holds by then. ``change`` must save the
+    instance. Returns the saved copy.
+    """
+    model = type(instance)
+    for attempt in range(settings.OPTIMISTIC_LOCK_RETRIES):
+        if attempt:
+            instance = model._default_manager.get(pk=instance.pk)
+        instance.expected_version = instance.version
+        try:
+            with transaction.atomic():
+                change(instance)
+            return instance
+        except VersionConflict:
+            continue
+        finally:
+            instance.__dict__.pop('expected_version', None)
+    raise EditConflict()
+
+
+class ETagMixin:
+    """View mixin that sends the version of the object as its ETag and honours ``If-Match`` on updates"""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields, defer = queryset.query.deferred_loading
+        if getattr(self, 'detail', False) and fields and not defer:
+            # Narrowed by sparse fieldsets; the ETag still needs the version
+            queryset = queryset.only(*fields, 'version')
+        return queryset
+
+    def get_object(self):
+        instance = super().get_object()
+        self.versioned_object = instance
+        return instance
+
+    def perform_update(self, serializer):
+        with if_match(self.request, serializer.instance):
+            super().perform_update(serializer)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        instance = getattr(self, 'versioned_object', None)
+        if (instance is not None and request.method != 'DELETE' and status.is_success(response.status_code)
+                and hasattr(instance, 'version')):
+            response['ETag'] = etag(instance)
+        return response
@@ -0,0 +1,159 @@
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .events import EventBroker, MAX_REPLAY
+from .jobs import task
+from .models import DashboardEvent, Order, Product
+
+# Same threshold as dashboard_stats and the admin product stock filter
+LOW_STOCK_THRESHOLD = 10
+
+# Every admin gets the same events, so they all share one broker key
+DASHBOARD_KEY = 'dashboard'
+
+
+def order_totals(order):
+    """The fields of an order the dashboard totals depend on, or None if any is deferred"""
+    state = tuple(order.__dict__.get(field) for field in ('status', 'payment_status', 'total_amount'))
+    return None if None in state else state
+
+
+def order_deltas(before, after):
+    """Changes to the dashboard totals when an order goes from ``before`` to ``after``
+
+    Either state is None for an order that does not exist on that side.
+    Revenue is counted like ``dashboard_stats`` (every order) and, as
+    ``paid_revenue``, like the sales report (completed payments).
+    """
+    deltas = Counter()
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        status, payment_status, total = state
+        total = Decimal(total)
+        deltas['total_orders'] += sign
+        deltas['total_revenue'] += sign * total
+        deltas['pending_orders'] += sign * (status == 'pending')
+        deltas['paid_revenue'] += sign * total * (payment_status == 'completed')
+    return deltas
+
+
+def stock_deltas(before, after):
+    """Changes to the product totals when stock goes from ``before`` to ``after``"""
+    deltas = Counter()
+    for stock, sign in ((before, -1), (after, 1)):
+        if stock is None:
+            continue
+        deltas['total_products'] += sign
+        deltas['low_stock_products'] += sign * (stock < LOW_STOCK_THRESHOLD)
+    return deltas
+
+
+def is_low_stock_alert(before, after):
+    return after is not None and after < LOW_STOCK_THRESHOLD and (before is None or before >= LOW_STOCK_THRESHOLD)
+
+
+def record_dashboard_event(kind, deltas, **data):
+    """Store one dashboard update and wake the stream once it commits
+
+    Deltas are worked out here, once per change, and the stored payload
+    is what every connected admin receives.
+    """
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas and not data:
+        return
+    DashboardEvent.objects.create(data={'kind': kind, 'deltas': deltas, **data})
+    transaction.on_commit(dashboard_events.notify)
+
+
+def order_summary(order):
+    return {
+        'id': order.id,
+        'user': order.user_id,
+        'total_amount': order.total_amount,
+        'status': order.status,
+        'created_at': order.created_at,
+    }
+
+
+def record_order_change(order, before, created=False, deleted=False):
+    after = None if deleted else order_totals(order)
+    if not created and before is None:
+        # Loaded with deferred fields; the previous totals are unknown
+        return
+    data = {'new_order': order_summary(order)} if created else {}
+    record_dashboard_event('order', order_deltas(before, after), **data)
+
+
+def order_totals_by_id(ids):
+    return {
+        pk: tuple(state) for pk, *state in Order.objects.select_for_update().filter(pk__in=ids)
+        .values_list('pk', 'status', 'payment_status', 'total_amount')
+    }
+
+
+def record_orders_change(before, after):
+    """One event for a set-based UPDATE, from {id: state} before and after it"""
+    deltas = Counter()
+    for pk, state in after.items():
+        deltas.update(order_deltas(before.get(pk), state))
+    record_dashboard_event('orders', deltas)
+
+
+def product_summary(product, stock):
+    return {'id': product.pk, 'name': product.name, 'stock': stock}
+
+
+def record_stock_change(product, before, after):
+    data = {'low_stock': [product_summary(product, after)]} if is_low_stock_alert(before, after) else {}
+    record_dashboard_event('product', stock_deltas(before, after), **data)
+
+
+def product_stocks(ids):
+    return dict(Product.objects.select_for_update().filter(pk__in=ids).values_list('pk', 'stock'))
+
+
+def record_stocks_change(ids, before):
+    """One event for a set-based UPDATE, from {id: stock} before it"""
+    deltas = Counter()
+    alerts = []
+    for product in Product.objects.filter(pk__in=ids).only('pk', 'name', 'stock'):
+        deltas.update(stock_deltas(before.get(product.pk), product.stock))
+        if is_low_stock_alert(before.get(product.pk), product.stock):
+            alerts.append(product_summary(product, product.stock))
+    record_dashboard_event('products', deltas, **({'low_stock': alerts} if alerts else {}))
+
+
+def record_signup(user, deleted=False):
+    data = {} if deleted else {'new_user': {'id': user.pk, 'username': user.username}}
+    record_dashboard_event('user', {'total_users': -1 if deleted else 1}, **data)
+
+
+def _fetch_dashboard_events(after_id):
+    return [
+        (event_id, DASHBOARD_KEY, data)
+        for event_id, data in DashboardEvent.objects.filter(id__gt=after_id)
+        .order_by('id')
+        .values_list('id', 'data')[:MAX_REPLAY]
+    ]
+
+
+def latest_dashboard_event():
+    return DashboardEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def replay_dashboard_events(key, after_id):
+    return [(event_id, data) for event_id, key, data in _fetch_dashboard_events(after_id)]
+
+
+dashboard_events = EventBroker(_fetch_dashboard_events, latest_dashboard_event)
+
+
+@task('dashboard.prune', every=3600)
+def prune_dashboard_events():
+    """Delete events too old to be replayed"""
+    cutoff = timezone.now() - timedelta(seconds=settings.EVENT_STREAM_RETENTION)
+    DashboardEvent.objects.filter(created_at__lt=cutoff).delete()
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from .jobs import task
+from .models import Order, OrderEvent
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per subscriber before it is disconnected to catch up on reconnect
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Most events replayed to a client reconnecting with Last-Event-ID
+MAX_REPLAY = 500
+
+ORDER_EVENT_FIELDS = ('status', 'payment_status', 'tracking_number')
+
+
+class Subscription:
+    __slots__ = ('key', 'queue', 'overflowed')
+
+    def __init__(self, key):
+        self.key = key
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+
+class EventBroker:
+    """In-process fan-out of events stored in the database
+
+    One pump task per process reads new events with a single query and
+    hands them to the queues of local subscribers, so the cost of a new
+    event does not depend on how many clients are connected. Events
+    committed in this process wake the pump straight away; events from
+    other processes are picked up within ``poll_interval`` seconds.
+
+    ``fetch(after_id)`` returns ``(id, key, data)`` tuples in id order and
+    ``latest()`` the newest id; both are synchronous.
+    """
+
+    def __init__(self, fetch, latest, poll_interval=2.0):
+        self.fetch = fetch
+        self.latest = latest
+        self.poll_interval = poll_interval
+        self.subscribers = defaultdict(set)
+        self.loop = None
+        self.wakeup = None
+        self.pump_task = None
+
+    def subscribe(self, key):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # A new event loop (e.g. a fresh test loop) gets a fresh pump
+            self.loop = loop
+            self.wakeup = asyncio.Event()
+            self.pump_task = None
+        subscription = Subscription(key)
+        self.subscribers[key].add(subscription)
+        if self.pump_task is None or self.pump_task.done():
+            self.pump_task = loop.create_task(self._pump())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscribers = self.subscribers.get(subscription.key)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscribers[subscription.key]
+        if not self.subscribers and self.pump_task is not None:
+            # Nobody left to deliver to; the next subscriber starts a new pump
+            if not self.pump_task.done() and not self.loop.is_closed():
+                self.pump_task.cancel()
+            self.pump_task = None
+
+    def notify(self):
+        """Wake the pump; safe to call from any thread"""
+        loop, wakeup = self.loop, self.wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def publish(self, event_id, key, data):
+        for subscription in list(self.subscribers.get(key, ())):
+            try:
+                subscription.queue.put_nowait((event_id, data))
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+
+    async def _pump(self):
+        last_id = await sync_to_async(self.latest)()
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                events = await sync_to_async(self.fetch)(last_id)
+            except Exception:
+                logger.exception("Event pump failed to read new events")
+                continue
+            for event_id, key, data in events:
+                last_id = event_id
+                self.publish(event_id, key, data)
+            if len(events) == MAX_REPLAY:
+                # More are waiting; read them without sleeping
+                self.wakeup.set()
+
+
+def format_event(event_id, data, event='message'):
+    payload = json.dumps(data, cls=DjangoJSONEncoder)
+    return f'id: {event_id}\nevent: {event}\ndata: {payload}\n\n'
+
+
+async def event_stream(broker, key, replay, last_event_id=None, event='message'):
+    """Async iterator of SSE messages for one client
+
+    The client subscribes before anything is replayed, so events arriving
+    during the replay are queued rather than lost; ids already sent are
+    skipped. ``replay(key, after_id)`` returns stored events after an id.
+
+    Django does not notice clients that went away, so a stream ends after
+    ``EVENT_STREAM_MAX_AGE`` seconds and live clients reconnect with
+    ``Last-Event-ID``; abandoned ones release their subscription.
+    """
+    subscription = broker.subscribe(key)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.EVENT_STREAM_MAX_AGE
+    try:
+        yield f'retry: {settings.EVENT_STREAM_RETRY_MS}\n\n'
+        last_sent = last_event_id or 0
+        if last_event_id is not None:
+            for event_id, data in await sync_to_async(replay)(key, last_event_id):
+                last_sent = event_id
+                yield format_event(event_id, data, event)
+
+        while True:
+            if subscription.overflowed and subscription.queue.empty():
+                # Fell behind; the client reconnects and replays from last_sent
+                return
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                event_id, data = await asyncio.wait_for(
+                    subscription.queue.get(), min(settings.EVENT_STREAM_HEARTBEAT, remaining)
+                )
+            except asyncio.TimeoutError:
+                if loop.time() < deadline:
+                    yield ': heartbeat\n\n'
+                continue
+            if event_id > last_sent:
+                last_sent = event_id
+                yield format_event(event_id, data, event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def authenticate_stream(request):
+    """Return the user of a stream request, or None
+
+    Browsers' EventSource cannot set headers, so the token may also be
+    passed as ``?token=``; session authentication works as usual.
+    """
+    header = request.headers.get('Authorization', '')
+    key = header[6:].strip() if header.startswith('Token ') else request.GET.get('token')
+    if key:
+        token = await Token.objects.select_related('user').filter(key=key).afirst()
+        if token is not None and token.user.is_active:
+            return token.user
+        return None
+    return await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+
+
+def parse_last_event_id(request):
+    value = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def order_state(order):
+    """The streamed fields of an order, without loading deferred ones"""
+    return tuple(order.__dict__.get(field) for field in ORDER_EVENT_FIELDS)
+
+
+def order_event_data(order):
+    return {
+        'order_id': order.id,
+        'status': order.status,
+        'payment_status': order.payment_status,
+        'tracking_number': order.tracking_number,
+        'payment_date': order.payment_date,
+        'shipped_date': order.shipped_date,
+        'estimated_delivery_date': order.estimated_delivery_date,
+        'updated_at': order.updated_at,
+    }
+
+
+def record_order_event(order):
+    """Store an event for an order and wake the stream once it commits"""
+    OrderEvent.objects.create(user_id=order.user_id, order=order, data=order_event_data(order))
+    transaction.on_commit(order_events.notify)
+
+
+def record_order_events(order_ids):
+    """Store events for orders changed by a set-based UPDATE"""
+    OrderEvent.objects.bulk_create([
+        OrderEvent(user_id=order.user_id, order=order, data=order_event_data(order))
+        for order in Order.objects.filter(pk__in=order_ids)
+    ], batch_size=500)
+    transaction.on_commit(order_events.notify)
+
+
+def _fetch_order_events(after_id):
+    return list(
+        OrderEvent.objects.filter(id__gt=after_id)
+        .order_by('id')
+        .values_list('id', 'user_id', 'data')[:MAX_REPLAY]
+    )
+
+
+def _latest_order_event():
+    return OrderEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def replay_order_events(user_id, after_id):
+    return list(
+        OrderEvent.objects.filter(user_id=user_id, id__gt=after_id)
+        .order_by('id')
+        .values_list('id', 'data')[:MAX_REPLAY]
+    )
+
+
+order_events = EventBroker(_fetch_order_events, _latest_order_event)
+
+
+@task('events.prune', every=3600)
+def prune_order_events():
+    """Delete events too old to be replayed"""
+    cutoff = timezone.now() - timedelta(seconds=settings.EVENT_STREAM_RETENTION)
+    OrderEvent.objects.filter(created_at__lt=cutoff).delete()
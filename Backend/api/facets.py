@@ -0,0 +1,83 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from .catalog import catalog_version
+from .metrics import record_cache
+
+# Facet results are keyed on the catalog version, so this only bounds memory
+FACET_CACHE_TIMEOUT = 60 * 60
+
+
+def _ranges(bounds):
+    """Turn ascending boundaries into (min, max) pairs, the last one open-ended"""
+    return list(zip(bounds, list(bounds[1:]) + [None]))
+
+
+def _range_q(field, low, high):
+    q = Q(**{f'{field}__gte': low})
+    if high is not None:
+        q &= Q(**{f'{field}__lt': high})
+    return q
+
+
+def compute_facets(queryset):
+    """Count products per category, price range, availability and discount
+
+    Every facet is a conditional count in the same grouped query, so the
+    whole sidebar costs one round trip regardless of how many buckets exist.
+    """
+    price_ranges = _ranges(settings.PRODUCT_PRICE_BUCKETS)
+    discount_ranges = _ranges(settings.PRODUCT_DISCOUNT_BUCKETS)
+
+    annotations = {
+        'count': Count('id'),
+        'in_stock': Count('id', filter=Q(stock__gt=0)),
+    }
+    for index, (low, high) in enumerate(price_ranges):
+        annotations[f'price_{index}'] = Count('id', filter=_range_q('effective_price', low, high))
+    for index, (low, high) in enumerate(discount_ranges):
+        annotations[f'discount_{index}'] = Count('id', filter=_range_q('discount_percent', low, high))
+
+    rows = list(
+        queryset.order_by()
+        .values('category_id', 'category__name')
+        .annotate(**annotations)
+        .order_by('category__name')
+    )
+
+    def total(key):
+        return sum(row[key] for row in rows)
+
+    count = total('count')
+    in_stock = total('in_stock')
+    return {
+        'total': count,
+        'categories': [
+            {'id': row['category_id'], 'name': row['category__name'], 'count': row['count']}
+            for row in rows
+        ],
+        'price_ranges': [
+            {'min': low, 'max': high, 'count': total(f'price_{index}')}
+            for index, (low, high) in enumerate(price_ranges)
+        ],
+        'availability': {'in_stock': in_stock, 'out_of_stock': count - in_stock},
+        'discounts': [
+            {'min': low, 'max': high, 'count': total(f'discount_{index}')}
+            for index, (low, high) in enumerate(discount_ranges)
+        ],
+    }
+
+
+def cached_facets(queryset, params):
+    """Return facets for ``queryset``, cached per catalog version and filter set"""
+    version = catalog_version()
+    filters = '&'.join(f'{key}={params[key]}' for key in sorted(params))
+    key = 'facets:%s:%s' % (version, hashlib.md5(filters.encode()).hexdigest())
+    facets = cache.get(key)
+    record_cache('facets', facets is not None)
+    if facets is None:
+        facets = compute_facets(queryset)
+        facets['version'] = version
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
@@ -0,0 +1,347 @@
+import copy
+from operator import attrgetter
+
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.utils.encoding import filepath_to_uri
+from rest_framework import fields as drf_fields
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .fieldsets import resolve_source
+
+# Fields whose to_representation is a no-op for the values the database returns
+PASSTHROUGH_FIELDS = (drf_fields.IntegerField, drf_fields.CharField, drf_fields.BooleanField)
+
+# Bounds the cache against arbitrary ?fields= combinations
+MAX_COMPILED = 256
+
+_compiled = {}
+
+
+class _RowView:
+    """Attribute access over a values() row, so model properties can run on it"""
+    __slots__ = ('row', 'prefix')
+
+    def __init__(self, row, prefix):
+        self.row = row
+        self.prefix = prefix
+
+    def __getattr__(self, name):
+        return self.row[self.prefix + name]
+
+
+class MediaURLs:
+    """Build file URLs the way DRF's FileField does, caching the absolute prefix
+
+    ``request.build_absolute_uri()`` re-parses the URL for every file; for
+    file system storage the scheme, host and media prefix are the same for
+    the whole request, so they are resolved once and the name is appended.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.prefixes = {}
+
+    def _prefix(self, storage):
+        key = id(storage)
+        if key not in self.prefixes:
+            base_url = getattr(storage, 'base_url', None)
+            if (
+                isinstance(storage, FileSystemStorage)
+                and base_url
+                and base_url.startswith('/')
+                and base_url.endswith('/')
+            ):
+                if self.request is not None:
+                    base_url = self.request.build_absolute_uri(base_url)
+                self.prefixes[key] = base_url
+            else:
+                self.prefixes[key] = None
+        return self.prefixes[key]
+
+    def url(self, storage, name):
+        if not name:
+            return None
+        prefix = self._prefix(storage)
+        path = filepath_to_uri(name).lstrip('/')
+        if prefix is None or ':' in path or '/.' in '/' + path:
+            # Anything urljoin() could rewrite takes the regular route
+            url = storage.url(name)
+            if self.request is not None:
+                return self.request.build_absolute_uri(url)
+            return url
+        return prefix + path
+
+
+class _Entry:
+    """How one serializer field is read and formatted"""
+    __slots__ = ('key', 'kind', 'column', 'attr', 'format', 'storage', 'fget', 'child')
+
+    def __init__(self, key, kind, column=None, attr=None, format=None,
+                 storage=None, fget=None, child=None):
+        self.key = key
+        self.kind = kind
+        self.column = column
+        self.attr = attr
+        self.format = format
+        self.storage = storage
+        self.fget = fget
+        self.child = child
+
+
+class CompiledSerializer:
+    """Field extractors for a serializer, worked out once per field layout
+
+    Rows are rendered either from ``values()`` dicts or from model
+    instances, and produce the same data as the serializer's own
+    ``to_representation``.
+    """
+
+    def __init__(self, entries, columns):
+        self.entries = entries
+        self.columns = columns
+
+    def bind(self, context):
+        return BoundSerializer(self, MediaURLs(context.get('request')))
+
+
+class BoundSerializer:
+    """A compiled serializer tied to the media URL cache of one request"""
+
+    def __init__(self, compiled, media):
+        self.row_getters = self._row_getters(compiled.entries, '', media)
+        self.instance_getters = self._instance_getters(compiled.entries, media)
+
+    def _row_getters(self, entries, prefix, media):
+        getters = []
+        for entry in entries:
+            column = prefix + entry.column if entry.column else None
+            if entry.kind == 'value':
+                getters.append((entry.key, _row_value(column, entry.format)))
+            elif entry.kind == 'media':
+                getters.append((entry.key, _row_media(column, entry.storage, media)))
+            elif entry.kind == 'property':
+                getters.append((entry.key, _row_property(prefix, entry.fget, entry.format)))
+            else:
+                child = self._row_getters(entry.child.entries, column + '__', media)
+                getters.append((entry.key, _row_nested(column, child)))
+        return getters
+
+    def _instance_getters(self, entries, media):
+        getters = []
+        for entry in entries:
+            if entry.kind == 'media':
+                getters.append((entry.key, _instance_media(entry.attr, entry.storage, media)))
+            elif entry.kind == 'nested':
+                child = self._instance_getters(entry.child.entries, media)
+                getters.append((entry.key, _instance_nested(entry.attr, child)))
+            else:
+                getters.append((entry.key, _instance_value(entry.attr, entry.format)))
+        return getters
+
+    def render_rows(self, rows):
+        getters = self.row_getters
+        return [{key: getter(row) for key, getter in getters} for row in rows]
+
+    def render_instances(self, instances):
+        getters = self.instance_getters
+        return [{key: getter(obj) for key, getter in getters} for obj in instances]
+
+
+def _row_value(column, format):
+    if format is None:
+        return lambda row: row[column]
+
+    def getter(row):
+        value = row[column]
+        return None if value is None else format(value)
+    return getter
+
+
+def _row_media(column, storage, media):
+    return lambda row: media.url(storage, row[column])
+
+
+def _row_property(prefix, fget, format):
+    def getter(row):
+        value = fget(_RowView(row, prefix))
+        return None if value is None else format(value)
+    return getter
+
+
+def _row_nested(column, getters):
+    def getter(row):
+        if row[column] is None:
+            return None
+        return {key: get(row) for key, get in getters}
+    return getter
+
+
+def _instance_value(attr, format):
+    read = attrgetter(attr)
+    if format is None:
+        return read
+
+    def getter(obj):
+        value = read(obj)
+        return None if value is None else format(value)
+    return getter
+
+
+def _instance_media(attr, storage, media):
+    return lambda obj: media.url(storage, getattr(obj, attr).name)
+
+
+def _instance_nested(attr, getters):
+    def getter(obj):
+        related = getattr(obj, attr)
+        if related is None:
+            return None
+        return {key: get(related) for key, get in getters}
+    return getter
+
+
+def _formatter(field):
+    if type(field) in PASSTHROUGH_FIELDS:
+        return None
+    # An unbound copy keeps the cache from holding on to request contexts
+    return copy.deepcopy(field).to_representation
+
+
+def _compile_entries(serializer, model):
+    entries, columns = [], []
+    media_fields = getattr(getattr(serializer, 'Meta', None), 'fast_media_fields', ())
+    sources = getattr(getattr(serializer, 'Meta', None), 'sparse_sources', {})
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+
+        if isinstance(field, serializers.SerializerMethodField):
+            if name not in media_fields or len(sources.get(name, ())) != 1:
+                return None
+            column = sources[name][0]
+            model_field = model._meta.get_field(column)
+            entries.append(_Entry(name, 'media', column=column, attr=column,
+                                  storage=model_field.storage))
+            columns.append(column)
+            continue
+
+        if isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField)):
+            return None
+
+        if len(field.source_attrs) != 1 and isinstance(field, (
+                serializers.BaseSerializer, serializers.RelatedField, drf_fields.FileField)):
+            return None
+
+        if isinstance(field, serializers.BaseSerializer):
+            source = field.source_attrs[0]
+            relation = model._meta.get_field(source)
+            if not relation.concrete or not relation.many_to_one:
+                return None
+            child = _compile_entries(field, relation.related_model)
+            if child is None:
+                return None
+            entries.append(_Entry(name, 'nested', column=source, attr=source,
+                                  child=CompiledSerializer(*child)))
+            columns.append(source)
+            columns.extend(f'{source}__{column}' for column in child[1])
+            continue
+
+        if isinstance(field, serializers.RelatedField):
+            if type(field) is not serializers.PrimaryKeyRelatedField or field.pk_field is not None:
+                return None
+            relation = model._meta.get_field(field.source_attrs[0])
+            entries.append(_Entry(name, 'value', column=relation.name, attr=relation.attname))
+            columns.append(relation.name)
+            continue
+
+        if isinstance(field, drf_fields.FileField):
+            column = field.source_attrs[0]
+            model_field = model._meta.get_field(column)
+            entries.append(_Entry(name, 'media', column=column, attr=column,
+                                  storage=model_field.storage))
+            columns.append(column)
+            continue
+
+        resolved = resolve_source(model, field.source_attrs)
+        if resolved is not None:
+            column = resolved[0]
+            entries.append(_Entry(name, 'value', column=column,
+                                  attr='.'.join(field.source_attrs), format=_formatter(field)))
+            columns.append(column)
+            continue
+
+        # Model properties computed from plain columns of the same row
+        prop = getattr(model, field.source, None)
+        needed = sources.get(name)
+        if (
+            len(field.source_attrs) != 1
+            or not isinstance(prop, property)
+            or not needed
+            or any('__' in column for column in needed)
+        ):
+            return None
+        entries.append(_Entry(name, 'property', attr=field.source,
+                              fget=prop.fget, format=copy.deepcopy(field).to_representation))
+        columns.extend(needed)
+
+    return entries, list(dict.fromkeys(columns))
+
+
+def _signature(serializer):
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    return (type(serializer), tuple(
+        (name, type(field), _signature(field) if isinstance(field, serializers.BaseSerializer) else None)
+        for name, field in serializer.fields.items()
+    ))
+
+
+def compile_serializer(serializer):
+    """Return the compiled form of a model serializer, or None if unsupported
+
+    Compilation is cached per serializer class and field layout, so sparse
+    fieldsets each get their own compiled form.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if not isinstance(serializer, serializers.ModelSerializer):
+        return None
+    key = _signature(serializer)
+    if key not in _compiled:
+        if len(_compiled) >= MAX_COMPILED:
+            _compiled.clear()
+        result = _compile_entries(serializer, serializer.Meta.model)
+        _compiled[key] = None if result is None else CompiledSerializer(*result)
+    return _compiled[key]
+
+
+class CompiledListSerializer(serializers.ListSerializer):
+    """List serializer that renders through the compiled fast path when it can"""
+
+    def to_representation(self, data):
+        compiled = compile_serializer(self.child)
+        if compiled is None:
+            return super().to_representation(data)
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        return compiled.bind(self.context).render_instances(iterable)
+
+
+class CompiledListMixin:
+    """List view mixin that pages over values() rows and renders them directly"""
+
+    def list(self, request, *args, **kwargs):
+        compiled = compile_serializer(self.get_serializer())
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.prefetch_related(None).values(*compiled.columns)
+        renderer = compiled.bind(self.get_serializer_context())
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(renderer.render_rows(page))
+        return Response(renderer.render_rows(rows))
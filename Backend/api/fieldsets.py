@@ -0,0 +1,261 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class Fieldset:
+    """Field selection parsed from the ``fields`` and ``expand`` query parameters
+
+    ``fields`` is a comma separated list of field names, with dotted names
+    selecting fields of nested objects (``items.product.name``). ``expand``
+    lists the nested relations to render in full; any nested relation left
+    out of it is rendered as its primary key(s) instead.
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = self._parse_fields(fields) if fields else None
+        if expand is None:
+            self.expand = None
+        else:
+            self.expand = {
+                tuple(name.split('.')) for name in self._split(expand)
+            }
+
+    @classmethod
+    def from_request(cls, request):
+        """Build a fieldset for a read request, or None if nothing was selected"""
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        params = getattr(request, 'query_params', request.GET)
+        fields = params.get('fields')
+        expand = params.get('expand')
+        if not fields and expand is None:
+            return None
+        return cls(fields, expand)
+
+    @staticmethod
+    def _split(value):
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def _parse_fields(self, value):
+        tree = {}
+        for name in self._split(value):
+            node = tree
+            *parents, leaf = name.split('.')
+            for part in parents:
+                child = node.get(part, {})
+                if child is None:
+                    # The whole relation was already selected
+                    break
+                node = node.setdefault(part, child)
+            else:
+                node[leaf] = None
+        return tree
+
+    def _node(self, path):
+        node = self.fields
+        for name in path:
+            if node is None:
+                return None
+            node = node.get(name)
+        return node
+
+    def allowed(self, path):
+        """Return the field names selected at ``path``, or None for all fields"""
+        node = self._node(path)
+        return None if node is None else set(node)
+
+    def is_expanded(self, path):
+        """Return whether the nested relation at ``path`` is rendered in full"""
+        if self.expand is None or path in self.expand:
+            return True
+        # Selecting fields inside a relation implies expanding it
+        return self.fields is not None and isinstance(self._node(path), dict)
+
+
+class SparseFieldsetMixin:
+    """Serializer mixin that prunes its fields to the requested fieldset
+
+    The fieldset is taken from ``context['fieldset']`` or parsed from the
+    request in the serializer context. Nested serializers resolve their own
+    part of the selection through their dotted path from the root.
+    """
+
+    def get_fieldset(self):
+        context = self.context
+        if 'fieldset' not in context:
+            context['fieldset'] = Fieldset.from_request(context.get('request'))
+        return context['fieldset']
+
+    def get_fieldset_path(self):
+        path = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return tuple(reversed(path))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return fields
+
+        path = self.get_fieldset_path()
+        allowed = fieldset.allowed(path)
+        if allowed is not None:
+            fields = {
+                name: field for name, field in fields.items() if name in allowed
+            }
+
+        for name, field in list(fields.items()):
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if not isinstance(nested, serializers.BaseSerializer):
+                continue
+            if not fieldset.is_expanded(path + (name,)):
+                fields[name] = serializers.PrimaryKeyRelatedField(
+                    many=many, read_only=True, source=field.source
+                )
+        return fields
+
+
+def resolve_source(model, attrs):
+    """Map a serializer source onto (column path, select_related paths)
+
+    Returns None when the source is not a concrete model column reachable
+    through forward relations.
+    """
+    select = []
+    for index, attr in enumerate(attrs):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return None
+        if index == len(attrs) - 1:
+            if not field.concrete:
+                return None
+            return '__'.join(attrs), select
+        if not field.concrete or not (field.many_to_one or field.one_to_one):
+            return None
+        select.append('__'.join(attrs[:index + 1]))
+        model = field.related_model
+    return None
+
+
+def _plan(serializer, model):
+    """Work out the columns and relations ``serializer`` needs from ``model``"""
+    only, select, prefetch = set(), set(), []
+    sources = getattr(getattr(serializer, 'Meta', None), 'sparse_sources', {})
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+
+        if name in sources:
+            for path in sources[name]:
+                resolved = resolve_source(model, path.split('__'))
+                if resolved is None:
+                    return None
+                only.add(resolved[0])
+                for related in resolved[1]:
+                    only.add(related)
+                    select.add(related)
+            continue
+
+        many = isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField))
+        if many or isinstance(field, serializers.BaseSerializer):
+            if len(field.source_attrs) != 1:
+                return None
+            source = field.source_attrs[0]
+            try:
+                relation = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                return None
+            related_model = relation.related_model
+
+            if not many:
+                if not relation.concrete or not (relation.many_to_one or relation.one_to_one):
+                    return None
+                child = _plan(field, related_model)
+                if child is None:
+                    return None
+                child_only, child_select, child_prefetch = child
+                only.add(source)
+                select.add(source)
+                only.update(f'{source}__{path}' for path in child_only)
+                select.update(f'{source}__{path}' for path in child_select)
+                prefetch.extend(
+                    Prefetch(f'{source}__{lookup.prefetch_through}', queryset=lookup.queryset)
+                    for lookup in child_prefetch
+                )
+                continue
+
+            if not relation.one_to_many:
+                return None
+            queryset = related_model._default_manager.all()
+            if isinstance(field, serializers.ListSerializer):
+                child = _plan(field.child, related_model)
+                if child is None:
+                    return None
+                child_only, child_select, child_prefetch = child
+                queryset = queryset.select_related(*child_select).prefetch_related(*child_prefetch)
+            else:
+                child_only = set()
+            queryset = queryset.only(relation.field.name, *child_only)
+            prefetch.append(Prefetch(source, queryset=queryset))
+            continue
+
+        if field.source == '*':
+            return None
+        if isinstance(field, serializers.RelatedField):
+            # Primary key fields read the local foreign key column
+            if len(field.source_attrs) != 1:
+                return None
+            resolved = resolve_source(model, field.source_attrs)
+            if resolved is None:
+                return None
+        else:
+            resolved = resolve_source(model, field.source_attrs)
+            if resolved is None:
+                return None
+        only.add(resolved[0])
+        for related in resolved[1]:
+            only.add(related)
+            select.add(related)
+
+    return only, select, prefetch
+
+
+def narrow_queryset(queryset, serializer):
+    """Restrict ``queryset`` to the columns and relations ``serializer`` renders
+
+    The queryset is returned unchanged if any rendered field cannot be traced
+    back to model columns, so narrowing never causes extra queries per row.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    plan = _plan(serializer, queryset.model)
+    if plan is None:
+        return queryset
+    only, select, prefetch = plan
+    if only:
+        queryset = queryset.only(*only)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class SparseFieldsetViewMixin:
+    """Generic view mixin that narrows read querysets to the rendered fields"""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method in SAFE_METHODS:
+            queryset = narrow_queryset(queryset, self.get_serializer())
+        return queryset
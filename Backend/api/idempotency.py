@@ -0,0 +1,151 @@
+import functools
+import hashlib
+import json
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from .jobs import task
+from .models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+
+# Seconds between checks on a duplicate that is still being processed
+POLL_INTERVAL = 0.2
+
+# Requests in flight in this process, so local duplicates wake up immediately
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def fingerprint(request):
+    """Hash of the method, path and body, to catch keys reused for other requests"""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def _claim(request, key, digest):
+    """Insert the key as in progress; returns (record, created)"""
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=request.user,
+                key=key,
+                fingerprint=digest,
+                expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+            )
+        return record, True
+    except IntegrityError:
+        return IdempotencyKey.objects.filter(user=request.user, key=key).first(), False
+
+
+def _is_abandoned(record):
+    if record.expires_at <= timezone.now():
+        return True
+    cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    return record.status == 'in_progress' and record.created_at < cutoff
+
+
+def _wait(record, timeout):
+    with _inflight_lock:
+        event = _inflight.get((record.user_id, record.key))
+    if event is not None:
+        event.wait(timeout)
+    else:
+        time.sleep(timeout)
+
+
+def _execute(view, record, request, args, kwargs):
+    local_key = (record.user_id, record.key)
+    event = threading.Event()
+    with _inflight_lock:
+        _inflight[local_key] = event
+    try:
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            # Nothing to replay; let the client retry
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+            return response
+        body = None
+        if response.data is not None:
+            body = json.loads(JSONRenderer().render(response.data))
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status='completed',
+            response_status=response.status_code,
+            response_body=body
+        )
+        return response
+    finally:
+        with _inflight_lock:
+            _inflight.pop(local_key, None)
+        event.set()
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Replay the stored response when a request repeats its Idempotency-Key
+
+    Goes below ``@api_view`` and ``@permission_classes`` so the user is
+    already authenticated; keys are scoped per user. A duplicate that
+    arrives while the first request is still running waits for it and
+    replays its response instead of running the view again. Responses
+    are kept for ``IDEMPOTENCY_KEY_TTL`` seconds; server errors and
+    exceptions are not stored, so those requests can be retried.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({
+                'error': f'Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        digest = fingerprint(request)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+        while True:
+            record, created = _claim(request, key, digest)
+            if created:
+                return _execute(view, record, request, args, kwargs)
+            if record is None:
+                continue
+            if record.fingerprint != digest:
+                return Response({
+                    'error': 'Idempotency-Key was already used for a different request'
+                }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if _is_abandoned(record):
+                IdempotencyKey.objects.filter(pk=record.pk, status=record.status).delete()
+                continue
+            if record.status == 'completed':
+                return _replay(record)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                response = Response({
+                    'error': 'A request with this Idempotency-Key is still being processed'
+                }, status=status.HTTP_409_CONFLICT)
+                response['Retry-After'] = '1'
+                return response
+            _wait(record, min(remaining, POLL_INTERVAL))
+    return wrapper
+
+
+@task('idempotency.sweep', every=3600)
+def sweep_idempotency_keys():
+    """Delete stored responses past their expiry"""
+    IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
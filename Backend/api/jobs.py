@@ -0,0 +1,295 @@
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+_periodic = {}
+
+
+def task(name, max_attempts=5, every=None):
+    """Register a function as a background task
+
+    Tasks are called with the job payload as keyword arguments. Tasks with
+    ``every`` (seconds) are re-queued by the worker after each run.
+    """
+    def decorator(func):
+        _tasks[name] = (func, max_attempts)
+        if every is not None:
+            _periodic[name] = every
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, delay=0, unique_key=None, debounce=False, max_delay=None):
+    """Queue a job and return it, or None if a pending job was reused
+
+    The job row is written in the caller's transaction, so it only becomes
+    visible to workers once that transaction commits. With ``unique_key``
+    at most one queued job exists per key; ``debounce`` pushes that job's
+    start back by ``delay`` instead of leaving it where it was, but never
+    past ``max_delay`` seconds after it was first queued.
+    """
+    if name not in _tasks:
+        raise KeyError(f'Unknown task {name}')
+    payload = payload or {}
+    run_at = timezone.now() + timedelta(seconds=delay)
+
+    if unique_key is not None:
+        pending = Job.objects.filter(unique_key=unique_key, status='queued')
+        if debounce:
+            movable = pending
+            if max_delay is not None:
+                # A job pushed back up to its limit keeps its start time
+                movable = pending.filter(created_at__gt=run_at - timedelta(seconds=max_delay))
+            if movable.update(run_at=run_at, payload=payload) or pending.update(payload=payload):
+                return None
+        elif pending.exists():
+            return None
+
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                name=name,
+                payload=payload,
+                unique_key=unique_key,
+                run_at=run_at,
+                max_attempts=_tasks[name][1]
+            )
+    except IntegrityError:
+        # Another request queued the same key first
+        return None
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, in seconds"""
+    base = settings.JOB_RETRY_BASE_DELAY
+    delay = min(base * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_DELAY)
+    return delay + random.uniform(0, base)
+
+
+def claim_jobs(worker_id, limit=1):
+    """Mark up to ``limit`` due jobs as running for this worker
+
+    Databases with ``SKIP LOCKED`` hand each worker a disjoint set of rows.
+    SQLite has no row locks, so every candidate is claimed with a
+    conditional UPDATE that only one worker can win.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+    claim = {
+        'status': 'running',
+        'locked_by': worker_id,
+        'locked_at': now,
+        'attempts': F('attempts') + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(**claim)
+    else:
+        ids = []
+        for job_id in due.values_list('id', flat=True)[:limit * 4]:
+            if Job.objects.filter(id=job_id, status='queued').update(**claim):
+                ids.append(job_id)
+                if len(ids) == limit:
+                    break
+
+    return list(Job.objects.filter(id__in=ids, locked_by=worker_id).order_by('run_at', 'id'))
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; returns True on success"""
+    func = _tasks.get(job.name, (None,))[0]
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task {job.name}')
+        func(**job.payload)
+    except Exception as exc:
+        logger.exception("Job %s (%s) failed on attempt %d", job.id, job.name, job.attempts)
+        _record_failure(job, exc)
+        return False
+
+    Job.objects.filter(pk=job.pk).update(status='done', finished_at=timezone.now(), last_error='')
+    if job.name in _periodic:
+        enqueue(job.name, job.payload, delay=_periodic[job.name], unique_key=f'periodic:{job.name}')
+    return True
+
+
+def _record_failure(job, exc):
+    error = f'{type(exc).__name__}: {exc}'
+    if job.attempts >= job.max_attempts:
+        Job.objects.filter(pk=job.pk).update(status='failed', finished_at=timezone.now(), last_error=error)
+        if job.name in _periodic:
+            # Keep periodic work going even if one run gave up
+            enqueue(job.name, job.payload, delay=_periodic[job.name], unique_key=f'periodic:{job.name}')
+        return
+    run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(status='queued', run_at=run_at, last_error=error)
+    except IntegrityError:
+        # A newer job with the same key is already queued and supersedes this one
+        Job.objects.filter(pk=job.pk).update(status='failed', finished_at=timezone.now(), last_error=error)
+
+
+def requeue_stale_jobs():
+    """Return jobs left running by a worker that died to the queue"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    requeued = 0
+    for job in Job.objects.filter(status='running', locked_at__lt=cutoff):
+        _record_failure(job, TimeoutError('worker stopped responding'))
+        requeued += 1
+    return requeued
+
+
+def schedule_periodic_jobs():
+    """Queue each periodic task that has nothing pending"""
+    for name in _periodic:
+        if not Job.objects.filter(name=name, status__in=('queued', 'running')).exists():
+            enqueue(name, unique_key=f'periodic:{name}')
+
+
+def queue_stats():
+    """Queue depth by status and jobs finished over the last minute"""
+    counts = dict(Job.objects.order_by().values_list('status').annotate(count=Count('id')))
+    since = timezone.now() - timedelta(minutes=1)
+    finished = Job.objects.filter(finished_at__gte=since)
+    oldest = Job.objects.filter(status='queued', run_at__lte=timezone.now()).order_by('run_at').first()
+    return {
+        'queued': counts.get('queued', 0),
+        'running': counts.get('running', 0),
+        'done': counts.get('done', 0),
+        'failed': counts.get('failed', 0),
+        'done_last_minute': finished.filter(status='done').count(),
+        'failed_last_minute': finished.filter(status='failed').count(),
+        'oldest_due_seconds': (
+            round((timezone.now() - oldest.run_at).total_seconds(), 1) if oldest else 0
+        ),
+    }
+
+
+@task('jobs.prune', every=86400)
+def prune_jobs():
+    """Delete finished jobs older than the retention period"""
+    cutoff = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS)
+    Job.objects.filter(status__in=('done', 'failed'), finished_at__lt=cutoff).delete()
+
+
+class WorkerStats:
+    """Throughput counters shared by the threads of one worker process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.done = Counter()
+        self.failed = Counter()
+        self.busy = 0.0
+
+    def record(self, name, ok, seconds):
+        with self.lock:
+            (self.done if ok else self.failed)[name] += 1
+            self.busy += seconds
+
+    def summary(self):
+        with self.lock:
+            done = sum(self.done.values())
+            failed = sum(self.failed.values())
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            return {
+                'done': done,
+                'failed': failed,
+                'jobs_per_second': round((done + failed) / elapsed, 2),
+                'busy_seconds': round(self.busy, 2),
+                'by_task': dict(self.done),
+            }
+
+
+class Worker:
+    """Polls the queue and runs jobs on ``threads`` threads until stopped"""
+
+    def __init__(self, threads=1, poll_interval=1.0, stats_interval=60):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stats_interval = stats_interval
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stats = WorkerStats()
+        self.stop_event = threading.Event()
+
+    def run_once(self, worker_id=None, limit=10):
+        """Claim and run due jobs until none are left; returns the number run"""
+        worker_id = worker_id or f'{self.name}:{threading.get_ident()}'
+        processed = 0
+        while not self.stop_event.is_set():
+            jobs = claim_jobs(worker_id, limit)
+            if not jobs:
+                break
+            for job in jobs:
+                start = time.monotonic()
+                ok = run_job(job)
+                self.stats.record(job.name, ok, time.monotonic() - start)
+                processed += 1
+        return processed
+
+    def _loop(self, index):
+        worker_id = f'{self.name}:{index}'
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                try:
+                    processed = self.run_once(worker_id, limit=1)
+                except Exception:
+                    logger.exception("Worker %s failed to poll the queue", worker_id)
+                    processed = 0
+                if not processed:
+                    self.stop_event.wait(self.poll_interval)
+        finally:
+            connection.close()
+
+    def run(self):
+        requeue_stale_jobs()
+        schedule_periodic_jobs()
+        threads = [
+            threading.Thread(target=self._loop, args=(index,), name=f'job-worker-{index}', daemon=True)
+            for index in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info("Worker %s started with %d threads", self.name, self.threads)
+
+        last_report = time.monotonic()
+        while not self.stop_event.wait(1):
+            if time.monotonic() - last_report >= self.stats_interval:
+                last_report = time.monotonic()
+                requeue_stale_jobs()
+                logger.info("Worker %s stats: %s", self.name, self.stats.summary())
+
+        for thread in threads:
+            thread.join()
+        logger.info("Worker %s stopped: %s", self.name, self.stats.summary())
+
+    def stop(self, *args):
+        self.stop_event.set()
+
+
+def run_worker_process(threads, poll_interval):
+    """Entry point for worker processes started by the run_worker command"""
+    import signal
+    import django
+    django.setup()
+    worker = Worker(threads=threads, poll_interval=poll_interval)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
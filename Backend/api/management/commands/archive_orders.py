@@ -0,0 +1,28 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.archive import archivable_orders, archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Move delivered and cancelled orders older than the cutoff to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS, help='Archive orders unchanged for this many days')
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_ARCHIVE_BATCH_SIZE, help='Orders moved per transaction')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the orders that would be archived')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = archivable_orders(timezone.now() - timedelta(days=options['days'])).count()
+            self.stdout.write(f'{count} orders would be archived')
+            return
+        moved = archive_orders(
+            options['days'],
+            options['batch_size'],
+            max_batches=options['max_batches'],
+            progress=lambda moved: self.stdout.write(f'  {moved} orders archived')
+        )
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} orders'))
@@ -0,0 +1,89 @@
+import random
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.models import Category, Product
+from api.pricing import ProductTable
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare memory and lookup latency of the product price table against the ORM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Products in the catalog')
+        parser.add_argument('--lookups', type=int, default=2000, help='Cart-sized lookups timed per path')
+        parser.add_argument('--cart-size', type=int, default=5, help='Products per lookup')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['products'], options['lookups'], options['cart_size'])
+                # Leave the database as it was
+                raise Rollback
+        except Rollback:
+            pass
+
+    def retained(self, func):
+        """Bytes still allocated after func() returns, with its result kept alive"""
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, after - before
+
+    def per_lookup(self, carts, func):
+        start = time.perf_counter()
+        for ids in carts:
+            func(ids)
+        return (time.perf_counter() - start) / len(carts)
+
+    def run(self, products, lookups, cart_size):
+        category = Category.objects.create(name='Benchmark')
+        Product.objects.bulk_create([
+            Product(
+                name=f'Benchmark product {index}',
+                description='Benchmark description ' * 10,
+                price='%d.99' % (index % 500),
+                effective_price='%d.99' % (index % 500),
+                category=category,
+                stock=index % 50,
+                discount_percent=index % 30
+            )
+            for index in range(products)
+        ], batch_size=2000)
+        ids = list(Product.objects.filter(category=category).values_list('id', flat=True))
+        carts = [random.sample(ids, cart_size) for _ in range(lookups)]
+
+        instances, orm_bytes = self.retained(lambda: list(Product.objects.filter(category=category)))
+        del instances
+        table = ProductTable()
+        _, table_bytes = self.retained(table.sync)
+
+        def orm_path(cart):
+            found = Product.objects.in_bulk(cart)
+            return [found[pk].discounted_price for pk in cart]
+
+        def table_path(cart):
+            # Expire first so every lookup pays for its version check
+            table.expire()
+            found = table.get_many(cart)
+            return [found[pk].discounted_price for pk in cart]
+
+        if [orm_path(cart) for cart in carts[:100]] != [table_path(cart) for cart in carts[:100]]:
+            self.stdout.write(self.style.ERROR('Table prices differ from Product.discounted_price'))
+            return
+
+        orm_time = self.per_lookup(carts, orm_path)
+        table_time = self.per_lookup(carts, table_path)
+        self.stdout.write(f'Products:             {products}')
+        self.stdout.write(f'ORM instances:        {orm_bytes / 2 ** 20:.1f} MiB')
+        self.stdout.write(f'Product table:        {table_bytes / 2 ** 20:.1f} MiB ({table.nbytes / 2 ** 20:.1f} MiB of arrays)')
+        self.stdout.write(f'ORM lookup ({cart_size} ids):   {orm_time * 1e6:.0f} us')
+        self.stdout.write(f'Table lookup ({cart_size} ids): {table_time * 1e6:.0f} us')
+        self.stdout.write(self.style.SUCCESS(f'Speedup:              {orm_time / table_time:.1f}x'))
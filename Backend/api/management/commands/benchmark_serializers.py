@@ -0,0 +1,84 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from api.models import Category, Product
+from api.serializers import ProductSerializer
+from api.fastpath import compile_serializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF and compiled serialization of a product list page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Products per page')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per path')
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = options['repeat']
+        try:
+            with transaction.atomic():
+                self.run(rows, repeat)
+                # Leave the database as it was
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, rows, repeat):
+        category = Category.objects.create(name='Benchmark')
+        Product.objects.bulk_create([
+            Product(
+                name=f'Benchmark product {index}',
+                description='Benchmark description ' * 10,
+                price='%d.99' % (index % 500),
+                category=category,
+                image=f'products/benchmark_{index}.jpg',
+                stock=index % 50,
+                discount_percent=index % 30
+            )
+            for index in range(rows)
+        ])
+        queryset = Product.objects.filter(category=category).order_by('id')
+        request = APIRequestFactory().get('/api/products/', HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        context = {'request': request}
+        renderer = JSONRenderer()
+
+        def drf_path():
+            reference = serializers.ListSerializer(
+                child=ProductSerializer(),
+                instance=list(queryset.select_related('category')),
+                context=context
+            )
+            return renderer.render(reference.data)
+
+        def compiled_path():
+            compiled = compile_serializer(ProductSerializer(context=context))
+            page = list(queryset.values(*compiled.columns))
+            return renderer.render(compiled.bind(context).render_rows(page))
+
+        if drf_path() != compiled_path():
+            self.stdout.write(self.style.ERROR('Compiled output differs from DRF output'))
+            return
+
+        drf_time = self.best_of(repeat, drf_path)
+        compiled_time = self.best_of(repeat, compiled_path)
+        self.stdout.write(f'Rows per page:  {rows}')
+        self.stdout.write(f'DRF serializer: {drf_time * 1000:.1f} ms')
+        self.stdout.write(f'Compiled:       {compiled_time * 1000:.1f} ms')
+        self.stdout.write(self.style.SUCCESS(f'Speedup:        {drf_time / compiled_time:.1f}x'))
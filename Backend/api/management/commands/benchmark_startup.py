@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from statistics import median
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter, so nothing is imported or cached beforehand
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+from summitmarket.asgi import application
+loaded = time.perf_counter()
+if sys.argv[1] == 'warm':
+    from api.warmup import warm_up
+    warm_up()
+warmed = time.perf_counter()
+from django.test import Client
+client = Client(SERVER_NAME='localhost')
+responses = []
+for path in sys.argv[2:]:
+    begin = time.perf_counter()
+    status = client.get(path).status_code
+    responses.append([path, status, time.perf_counter() - begin])
+print(json.dumps({'load': loaded - start, 'warm_up': warmed - loaded, 'responses': responses}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Time a fresh process: imports by module, Django setup and its first responses, with and without warm-up'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths', help='Path requested, in order (repeatable)')
+        parser.add_argument('--runs', type=int, default=3, help='Fresh processes per mode; medians are reported')
+        parser.add_argument('--top', type=int, default=15, help='Imports listed')
+
+    def probe(self, mode, paths, importtime=False):
+        command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', PROBE, mode, *paths]
+        with tempfile.TemporaryDirectory() as scratch:
+            env = {
+                **os.environ,
+                # Keep the probe's requests out of the real metrics, throttle state and slow query log
+                'METRICS_DIR': os.path.join(scratch, 'metrics'),
+                'THROTTLE_STORE': os.path.join(scratch, 'throttle.sqlite3'),
+                'SLOW_QUERY_THRESHOLD_MS': '0',
+                'LOG_LEVEL': 'WARNING',
+            }
+            result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f'Probe process failed:\n{result.stderr[-2000:]}')
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/api/products/', '/api/categories/', '/api/products/']
+        for mode in ('cold', 'warm'):
+            runs = [self.probe(mode, paths)[0] for _ in range(options['runs'])]
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{mode.capitalize()} start (median of {len(runs)})'))
+            self.stdout.write(f"  Import and Django setup: {median(run['load'] for run in runs) * 1000:7.1f} ms")
+            if mode == 'warm':
+                self.stdout.write(f"  Warm-up:                 {median(run['warm_up'] for run in runs) * 1000:7.1f} ms")
+            for index, (path, status, seconds) in enumerate(runs[0]['responses']):
+                elapsed = median(run['responses'][index][2] for run in runs)
+                self.stdout.write(f'  Response {index + 1} {path} ({status}): {elapsed * 1000:7.1f} ms')
+
+        self.report_imports(self.probe('cold', paths[:1], importtime=True)[1], options['top'])
+
+    def report_imports(self, stderr, top):
+        """Summarize ``-X importtime`` output by package and by slowest module"""
+        imports = []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+            own, cumulative, name = line[len('import time:'):].split('|')
+            imports.append((name.strip(), int(own), int(cumulative)))
+
+        packages = defaultdict(int)
+        for name, own, cumulative in imports:
+            packages[name.split('.')[0]] += own
+        total = sum(packages.values())
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Import time by package (total {total / 1000:.1f} ms)'))
+        for package, own in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f'  {own / 1000:7.1f} ms  {package}')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Slowest imports (including what they import)'))
+        for name, own, cumulative in sorted(imports, key=lambda item: -item[2])[:top]:
+            self.stdout.write(f'  {cumulative / 1000:7.1f} ms  {name} (own {own / 1000:.1f} ms)')
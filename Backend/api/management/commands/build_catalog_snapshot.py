@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.catalog import build_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Render the catalog snapshot served to the storefront'
+
+    def handle(self, *args, **options):
+        manifest = build_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"Catalog snapshot {manifest['version']} at {manifest['url']}"))
@@ -0,0 +1,19 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from api.models import Order
+from api.search import index_order, index_user
+
+
+class Command(BaseCommand):
+    help = 'Bring the admin user and order search indexes up to date'
+
+    def handle(self, *args, **options):
+        users = 0
+        for user in User.objects.order_by('pk').iterator(chunk_size=1000):
+            index_user(user)
+            users += 1
+        orders = 0
+        for order in Order.objects.select_related('user').order_by('pk').iterator(chunk_size=1000):
+            index_order(order)
+            orders += 1
+        self.stdout.write(self.style.SUCCESS(f'Indexed {users} users and {orders} orders'))
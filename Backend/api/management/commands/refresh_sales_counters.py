@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.sales import rebuild_sales_counters, refresh_sales_windows
+
+
+class Command(BaseCommand):
+    help = 'Refresh the rolling product sales windows, or rebuild all sales counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recount everything from order history')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rebuild_sales_counters()
+            self.stdout.write(self.style.SUCCESS('Rebuilt product sales counters'))
+        else:
+            refresh_sales_windows()
+            self.stdout.write(self.style.SUCCESS('Refreshed rolling sales windows'))
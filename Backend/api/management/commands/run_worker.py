@@ -0,0 +1,58 @@
+import multiprocessing
+import signal
+from django.core.management.base import BaseCommand
+from django.db import connections
+from api.jobs import Worker, run_worker_process, queue_stats
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads per process')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to start')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls of an empty queue')
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due and exit')
+        parser.add_argument('--stats', action='store_true', help='Print queue statistics and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for key, value in queue_stats().items():
+                self.stdout.write(f'{key}: {value}')
+            return
+
+        if options['once']:
+            worker = Worker()
+            processed = worker.run_once()
+            self.stdout.write(self.style.SUCCESS(f'Ran {processed} jobs: {worker.stats.summary()}'))
+            return
+
+        threads = options['threads']
+        poll_interval = options['poll_interval']
+        if options['processes'] <= 1:
+            worker = Worker(threads=threads, poll_interval=poll_interval)
+            signal.signal(signal.SIGTERM, worker.stop)
+            signal.signal(signal.SIGINT, worker.stop)
+            worker.run()
+            return
+
+        # Child processes open their own database connections
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=run_worker_process, args=(threads, poll_interval))
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"Started {len(processes)} worker processes with {threads} threads each"
+        ))
+
+        def stop(*args):
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for process in processes:
+            process.join()
@@ -0,0 +1,38 @@
+import textwrap
+from django.core.management.base import BaseCommand
+from api.models import SlowQuery
+from api.slow_queries import OFFENDER_ORDERING, top_offenders
+
+
+class Command(BaseCommand):
+    help = 'Print the slowest query fingerprints and the code that ran them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10, help='Fingerprints to print')
+        parser.add_argument('--sort', choices=sorted(OFFENDER_ORDERING), default='total', help='Rank by total time, calls or the slowest call')
+        parser.add_argument('--stack', action='store_true', help='Print the api/ stack of each source')
+        parser.add_argument('--reset', action='store_true', help='Delete every recorded query')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} slow query records'))
+            return
+
+        groups = top_offenders(options['limit'], options['sort'])
+        if not groups:
+            self.stdout.write('No slow queries recorded')
+            return
+        for rank, group in enumerate(groups, 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{rank}. {group['fingerprint']}  {group['calls']} calls, "
+                f"{group['total']:.0f} ms total, {group['total'] / group['calls']:.0f} ms avg, {group['slowest']:.0f} ms max"
+            ))
+            self.stdout.write(textwrap.indent(textwrap.shorten(group['statement'], 400), '   '))
+            for source in group['sources']:
+                self.stdout.write(
+                    f"   - {source.location} [{source.view or 'no view'}] "
+                    f"{source.count} calls, {source.total_ms:.0f} ms, params ({source.params_shape})"
+                )
+                if options['stack']:
+                    self.stdout.write(textwrap.indent(source.stack, '       '))
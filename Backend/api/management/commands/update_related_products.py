@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.related import rebuild_related_products, update_related_products
+
+
+class Command(BaseCommand):
+    help = 'Count new completed orders for related products, or rebuild the table from all orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recount everything from order history')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rebuild_related_products()
+            self.stdout.write(self.style.SUCCESS('Rebuilt related products'))
+        else:
+            update_related_products()
+            self.stdout.write(self.style.SUCCESS('Counted new orders for related products'))
@@ -0,0 +1,334 @@
+import functools
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Bytes a process's metrics file starts with; it doubles when full
+INITIAL_FILE_SIZE = 1 << 16
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Anything else is labelled as 'other', so clients cannot add label values
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class MmapValues:
+    """Float values keyed by string, in a memory-mapped file owned by one process
+
+    Entries are appended as a length, the padded key and an 8-byte value,
+    after a header holding the bytes in use. The header is written last,
+    so a reader in another process never sees a half-written entry.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(INITIAL_FILE_SIZE)
+        self.capacity = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), self.capacity)
+        # Values are 8-byte aligned, so they can be updated in place as doubles
+        self.doubles = memoryview(self.map).cast('d')
+        self.indexes = {}
+        self.used = struct.unpack_from('i', self.map, 0)[0]
+        if self.used == 0:
+            self.used = 8
+            struct.pack_into('i', self.map, 0, self.used)
+        for key, value, position in _entries(self.map, self.used):
+            self.indexes[key] = position // 8
+
+    def _append(self, key):
+        encoded = key.encode()
+        padded = encoded + b' ' * (-(len(encoded) + 4) % 8)
+        entry = struct.pack(f'i{len(padded)}sd', len(encoded), padded, 0.0)
+        while self.used + len(entry) > self.capacity:
+            self.capacity *= 2
+            self.file.truncate(self.capacity)
+            self.doubles.release()
+            self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), self.capacity)
+            self.doubles = memoryview(self.map).cast('d')
+        self.map[self.used:self.used + len(entry)] = entry
+        position = self.used + len(entry) - 8
+        self.used += len(entry)
+        struct.pack_into('i', self.map, 0, self.used)
+        self.indexes[key] = position // 8
+        return position // 8
+
+    def add(self, key, amount):
+        index = self.indexes.get(key)
+        if index is None:
+            index = self._append(key)
+        self.doubles[index] += amount
+
+    def close(self):
+        self.doubles.release()
+        self.map.close()
+        self.file.close()
+
+
+def _entries(data, used):
+    position = 8
+    while position < used:
+        length = struct.unpack_from('i', data, position)[0]
+        key = bytes(data[position + 4:position + 4 + length]).decode()
+        position += 4 + length + (-(length + 4) % 8)
+        yield key, struct.unpack_from('d', data, position)[0], position
+        position += 8
+
+
+def read_values(path):
+    """Every (key, value) in a metrics file, read without mapping it"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return []
+    return [(key, value) for key, value, position in _entries(data, struct.unpack_from('i', data, 0)[0])]
+
+
+_open_lock = threading.Lock()
+_write_lock = threading.Lock()
+_values = None
+
+
+def process_values():
+    """This process's metrics file, reopened after a fork"""
+    global _values
+    values = _values
+    if values is None or values.pid != os.getpid():
+        with _open_lock:
+            values = _values
+            if values is None or values.pid != os.getpid():
+                os.makedirs(settings.METRICS_DIR, exist_ok=True)
+                values = MmapValues(os.path.join(settings.METRICS_DIR, f'{os.getpid()}.db'))
+                values.pid = os.getpid()
+                _values = values
+    return values
+
+
+@receiver(setting_changed)
+def reopen_values(setting, **kwargs):
+    global _values
+    if setting == 'METRICS_DIR':
+        _values = None
+
+
+def clear_metrics_dir():
+    """Remove every process's file, e.g. when the server starts"""
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        os.remove(path)
+
+
+REGISTRY = {}
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        # Keys are built once per label combination, off the hot path after that
+        self.keys = {}
+        REGISTRY[name] = self
+
+    def _key(self, sample, labels):
+        return json.dumps([self.name, sample, labels])
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *values, amount=1):
+        with _write_lock:
+            self.add_to(process_values(), values, amount)
+
+    def add_to(self, store, values, amount=1):
+        key = self.keys.get(values)
+        if key is None:
+            key = self.keys[values] = self._key(self.name + '_total', list(zip(self.labels, map(str, values))))
+        store.add(key, amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(float(bound) for bound in buckets)
+
+    def _child_keys(self, values):
+        labels = list(zip(self.labels, map(str, values)))
+        bounds = [repr(bound) for bound in self.buckets] + ['+Inf']
+        return (
+            [self._key(self.name + '_bucket', labels + [['le', bound]]) for bound in bounds],
+            self._key(self.name + '_sum', labels),
+            self._key(self.name + '_count', labels),
+        )
+
+    def observe(self, amount, *values):
+        with _write_lock:
+            self.observe_in(process_values(), values, amount)
+
+    def observe_in(self, store, values, amount):
+        keys = self.keys.get(values)
+        if keys is None:
+            keys = self.keys[values] = self._child_keys(values)
+        buckets, sum_key, count_key = keys
+        # Buckets are stored per bucket and made cumulative when scraped
+        store.add(buckets[bisect_left(self.buckets, amount)], 1)
+        store.add(sum_key, amount)
+        store.add(count_key, 1)
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, by view', ('view', 'method')
+)
+RESPONSES = Counter('http_responses', 'Responses sent, by view and status code', ('view', 'method', 'status'))
+REQUEST_QUERIES = Histogram(
+    'db_queries_per_request', 'Database queries run while handling a request, by view', ('view',),
+    buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_QUERY_TIME = Histogram(
+    'db_time_per_request_seconds', 'Time spent in database queries per request, by view', ('view',),
+    buckets=QUERY_TIME_BUCKETS
+)
+QUERY_DURATION = Histogram('db_query_duration_seconds', 'Time taken by each database query', buckets=QUERY_TIME_BUCKETS)
+CACHE_REQUESTS = Counter('cache_requests', 'Cache lookups, by cache and hit or miss', ('cache', 'result'))
+CHECKOUTS = Counter('checkouts', 'Order and payment requests, by step and outcome', ('step', 'result'))
+
+
+_request = threading.local()
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        QUERY_DURATION.observe(elapsed)
+        # Outside a request (jobs, commands) there is nothing to add to
+        if getattr(_request, 'active', False):
+            _request.queries += 1
+            _request.query_time += elapsed
+
+
+def start_request():
+    _request.active = True
+    _request.queries = 0
+    _request.query_time = 0.0
+
+
+def finish_request(request, response, duration):
+    _request.active = False
+    match = request.resolver_match
+    view = match.view_name if match is not None else 'unmatched'
+    method = request.method if request.method in METHODS else 'other'
+    with _write_lock:
+        store = process_values()
+        REQUEST_DURATION.observe_in(store, (view, method), duration)
+        RESPONSES.add_to(store, (view, method, response.status_code))
+        REQUEST_QUERIES.observe_in(store, (view,), _request.queries)
+        REQUEST_QUERY_TIME.observe_in(store, (view,), _request.query_time)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache, 'hit' if hit else 'miss')
+
+
+def count_checkout(step):
+    """Count a checkout view's outcome; anything but a 2xx is a failure"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                CHECKOUTS.inc(step, 'failure')
+                raise
+            CHECKOUTS.inc(step, 'success' if response.status_code < 400 else 'failure')
+            return response
+        return wrapper
+    return decorator
+
+
+def collect():
+    """{key: value} summed over the files of every process"""
+    totals = defaultdict(float)
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        try:
+            values = read_values(path)
+        except FileNotFoundError:
+            continue
+        for key, value in values:
+            totals[key] += value
+    return totals
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    samples = defaultdict(dict)
+    for key, value in collect().items():
+        name, sample, labels = json.loads(key)
+        samples[name][sample, tuple(map(tuple, labels))] = value
+
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        if metric.kind == 'histogram':
+            lines.extend(_histogram_lines(metric, samples[name]))
+        else:
+            lines.extend(_sample_line(sample, labels, value) for (sample, labels), value in sorted(samples[name].items()))
+    return '\n'.join(lines) + '\n'
+
+
+def _sample_line(sample, labels, value):
+    value = str(int(value)) if value == int(value) else repr(value)
+    if not labels:
+        return f'{sample} {value}'
+    label_text = ','.join(f'{label}="{_escape(text)}"' for label, text in labels)
+    return f'{sample}{{{label_text}}} {value}'
+
+
+def _histogram_lines(metric, samples):
+    """Every ``le`` bucket of each child, counting the observations at or below it
+
+    Buckets are stored as per-bucket counts, and only once observed.
+    """
+    bounds = [repr(bound) for bound in metric.buckets] + ['+Inf']
+    children = sorted(labels for sample, labels in samples if sample == metric.name + '_count')
+    for labels in children:
+        running = 0
+        for bound in bounds:
+            bucket = labels + (('le', bound),)
+            running += samples.get((metric.name + '_bucket', bucket), 0)
+            yield _sample_line(metric.name + '_bucket', bucket, running)
+        yield _sample_line(metric.name + '_sum', labels, samples.get((metric.name + '_sum', labels), 0))
+        yield _sample_line(metric.name + '_count', labels, samples[metric.name + '_count', labels])
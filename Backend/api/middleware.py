@@ -0,0 +1,104 @@
+import os
+import time
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+from .catalog import SNAPSHOT_NAME_RE
+from .metrics import start_request, finish_request
+from . import slow_queries
+from .profiling import requested_mode, profiling_user, profile_request
+
+
+class CatalogSnapshotMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise middleware that also serves catalog snapshots
+
+    Snapshots are written after the worker starts, so the snapshot directory
+    is rescanned when it changes and a snapshot URL is not yet known.
+    Snapshot files carry their content hash and are served as immutable.
+    """
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        self.snapshot_root = settings.CATALOG_SNAPSHOT_ROOT
+        self.snapshot_prefix = settings.CATALOG_SNAPSHOT_URL
+        self.snapshot_mtime = None
+        os.makedirs(self.snapshot_root, exist_ok=True)
+        if self.autorefresh:
+            # Autorefresh looks files up on every request already
+            self.add_files(self.snapshot_root, prefix=self.snapshot_prefix)
+        else:
+            self.scan_snapshots()
+
+    def scan_snapshots(self):
+        try:
+            mtime = os.stat(self.snapshot_root).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self.snapshot_mtime:
+            self.snapshot_mtime = mtime
+            self.add_files(self.snapshot_root, prefix=self.snapshot_prefix)
+
+    def __call__(self, request):
+        path = request.path_info
+        if not self.autorefresh and path.startswith(self.snapshot_prefix) and path not in self.files:
+            self.scan_snapshots()
+        return super().__call__(request)
+
+    def immutable_file_test(self, path, url):
+        if url.startswith(self.snapshot_prefix):
+            return bool(SNAPSHOT_NAME_RE.match(url[len(self.snapshot_prefix):]))
+        return super().immutable_file_test(path, url)
+
+
+class ProfilerMiddleware:
+    """Profile a request when a staff user asks for it
+
+    ``?_profile=cprofile|sample`` or an ``X-Profile`` header picks the
+    profiler. Anyone else's request runs as normal. The stored profile's
+    id comes back in ``X-Profile-Id``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = requested_mode(request)
+        if mode is not None:
+            user = profiling_user(request)
+            if user is not None:
+                return profile_request(self.get_response, request, mode, user)
+        return self.get_response(request)
+
+
+class MetricsMiddleware:
+    """Time every request and count its status code and queries for ``/metrics``
+
+    Sits first, so the time includes the other middleware. Views are
+    labelled by URL name, which is known once the URL has been resolved.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start_request()
+        start = time.perf_counter()
+        response = self.get_response(request)
+        finish_request(request, response, time.perf_counter() - start)
+        return response
+
+
+class SlowQueryMiddleware:
+    """Attribute slow queries to the view that ran them, and store them after the response"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        slow_queries.start_request()
+        try:
+            return self.get_response(request)
+        finally:
+            slow_queries.finish_request()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        slow_queries.set_view(request.resolver_match.view_name)
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:52
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def populate_effective_price(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    products = list(Product.objects.only('price', 'discount_percent'))
+    for product in products:
+        price = product.price
+        if product.discount_percent > 0:
+            price = price * (1 - Decimal(product.discount_percent) / Decimal(100))
+        product.effective_price = price.quantize(Decimal('0.01'))
+    Product.objects.bulk_update(products, ['effective_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(populate_effective_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='product_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at'], name='product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'effective_price'], name='product_cat_eff_price_idx'),
+        ),
+    ]
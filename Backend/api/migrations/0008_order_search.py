@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_search_terms(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    OrderSearchTerm = apps.get_model('api', 'OrderSearchTerm')
+    terms = []
+    orders = Order.objects.select_related('user').only(
+        'tracking_number', 'payment_transaction_id', 'user__username', 'user__email'
+    )
+    for order in orders.iterator(chunk_size=500):
+        for kind, value in (
+            ('username', order.user.username),
+            ('email', order.user.email),
+            ('tracking', order.tracking_number),
+            ('transaction', order.payment_transaction_id),
+        ):
+            value = (value or '').strip().lower()[:254]
+            if value:
+                terms.append(OrderSearchTerm(order_id=order.id, kind=kind, term=value))
+    OrderSearchTerm.objects.bulk_create(terms, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('username', 'Username'), ('email', 'Email'), ('tracking', 'Tracking Number'), ('transaction', 'Transaction ID')], max_length=20)),
+                ('term', models.CharField(max_length=254)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['tracking_number'], name='order_tracking_idx'),
+        ),
+        migrations.AddField(
+            model_name='ordersearchterm',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='api.order'),
+        ),
+        migrations.AddIndex(
+            model_name='ordersearchterm',
+            index=models.Index(fields=['term'], name='order_search_term_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ordersearchterm',
+            constraint=models.UniqueConstraint(fields=('order', 'kind'), name='order_search_order_kind'),
+        ),
+        migrations.RunPython(populate_search_terms, migrations.RunPython.noop),
+    ]
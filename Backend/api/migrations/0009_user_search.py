@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+SEARCH_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+def populate_user_search(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserSearchTerm = apps.get_model('api', 'UserSearchTerm')
+    UserSearchTrigram = apps.get_model('api', 'UserSearchTrigram')
+    terms, grams = [], []
+    for user in User.objects.only(*SEARCH_FIELDS).iterator(chunk_size=1000):
+        user_grams = set()
+        for field in SEARCH_FIELDS:
+            value = (getattr(user, field) or '').strip().lower()[:254]
+            if value:
+                terms.append(UserSearchTerm(user_id=user.pk, kind=field, term=value))
+                user_grams.update(value[i:i + 3] for i in range(len(value) - 2))
+        grams.extend(UserSearchTrigram(user_id=user.pk, trigram=gram) for gram in user_grams)
+        if len(grams) >= 10000:
+            UserSearchTerm.objects.bulk_create(terms, batch_size=1000)
+            UserSearchTrigram.objects.bulk_create(grams, batch_size=1000)
+            terms, grams = [], []
+    UserSearchTerm.objects.bulk_create(terms, batch_size=1000)
+    UserSearchTrigram.objects.bulk_create(grams, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0008_order_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_trigrams', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('username', 'Username'), ('email', 'Email'), ('first_name', 'First Name'), ('last_name', 'Last Name')], max_length=20)),
+                ('term', models.CharField(max_length=254)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='usersearchtrigram',
+            constraint=models.UniqueConstraint(fields=('trigram', 'user'), name='user_search_trigram_user'),
+        ),
+        migrations.AddIndex(
+            model_name='usersearchterm',
+            index=models.Index(fields=['term'], name='user_search_term_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='usersearchterm',
+            constraint=models.UniqueConstraint(fields=('user', 'kind'), name='user_search_user_kind'),
+        ),
+        migrations.RunPython(populate_user_search, migrations.RunPython.noop),
+    ]
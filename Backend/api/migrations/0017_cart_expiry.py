@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:45
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def populate_updated_at(apps, schema_editor):
+    # The last time an item was added, rather than the time of the migration
+    Cart = apps.get_model('api', 'Cart')
+    CartItem = apps.get_model('api', 'CartItem')
+    last_added = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart').annotate(last=Max('added_at')).values('last')
+    Cart.objects.update(updated_at=Greatest('created_at', Coalesce(Subquery(last_added), 'created_at')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_order_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AbandonedCartDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('carts', models.PositiveIntegerField(default=0)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(populate_updated_at, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,88 @@
-from django.db import models
+from django.db import connections, models
+from django.db.models import F, Q
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
+class VersionConflict(Exception):
+    """A conditional save found the row at another version than expected"""
+
+
+class VersionedModel(models.Model):
+    """Model whose rows carry a version number, bumped by every save
+
+    Set ``expected_version`` before ``save()`` to make the UPDATE
+    conditional on the row still being at that version; otherwise
+    ``VersionConflict`` is raised and nothing is written. Saves with
+    ``update_fields`` always write the version and ``updated_at`` too.
+    """
+    version = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        abstract = True
+    
+    def save(self, *args, **kwargs):
+        expected = self.__dict__.pop('expected_version', None)
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'version', 'updated_at'}
+        if expected is None:
+            # Bumped in SQL, so a concurrent save is never undone. The UPDATE
+            # returns the new version where the database can; otherwise it is
+            # reloaded on next access.
+            self.version = F('version') + 1
+            super().save(*args, **kwargs)
+            if hasattr(self.version, 'resolve_expression'):
+                del self.__dict__['version']
+            return
+        self._expected_version = expected
+        self.version = expected + 1
+        try:
+            super().save(*args, **kwargs)
+        except VersionConflict:
+            self.version = expected
+            raise
+        finally:
+            del self._expected_version
+    
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected = getattr(self, '_expected_version', None)
+        if expected is None:
+            if hasattr(self.version, 'resolve_expression') and _can_return_from_update(using):
+                return self._update_returning_version(base_qs.filter(pk=pk_val), using, values)
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if not super()._do_update(base_qs.filter(version=expected), using, pk_val, values, update_fields, forced_update):
+            raise VersionConflict
+        return True
+    
+    def _update_returning_version(self, filtered, using, values):
+        query = filtered.query.chain(UpdateQuery)
+        query.add_update_fields(values)
+        sql, params = query.get_compiler(using).as_sql()
+        connection = connections[using]
+        column = connection.ops.quote_name(self._meta.get_field('version').column)
+        with connection.cursor() as cursor:
+            cursor.execute(f'{sql} RETURNING {column}', params)
+            row = cursor.fetchone()
+        if row is None:
+            return False
+        self.version = row[0]
+        return True
+
+
+def _can_return_from_update(using):
+    # UPDATE ... RETURNING: PostgreSQL, and SQLite from 3.35 like INSERT ... RETURNING
+    connection = connections[using]
+    return connection.vendor == 'postgresql' or (
+        connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+    )
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -15,7 +95,7 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-class Product(models.Model):
+class Product(VersionedModel):
     name = models.CharField(max_length=200)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -26,12 +106,39 @@ class Product(models.Model):
         validators=[MinValueValidator(0), MaxValueValidator(100)],
         default=0
     )
+    # Price after discount, kept in sync by save() so listings can sort and filter on it
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['price'], name='product_price_idx'),
+            models.Index(fields=['name'], name='product_name_idx'),
+            models.Index(fields=['created_at'], name='product_created_idx'),
+            models.Index(fields=['category', 'effective_price'], name='product_cat_eff_price_idx'),
+            # Read by the product price table to find changed rows
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
+    
     def __str__(self):
         return self.name
     
+    @staticmethod
+    def compute_effective_price(price, discount_percent):
+        price = Decimal(str(price))
+        if discount_percent > 0:
+            price = price * (1 - Decimal(discount_percent) / Decimal(100))
+        return price.quantize(Decimal('0.01'))
+    
+    def save(self, *args, **kwargs):
+        self.price = Decimal(str(self.price))
+        self.effective_price = self.compute_effective_price(self.price, self.discount_percent)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'price', 'discount_percent'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'effective_price'}
+        super().save(*args, **kwargs)
+    
     @property
     def discounted_price(self):
         if self.discount_percent > 0:
@@ -41,6 +148,8 @@ class Product(models.Model):
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever the items change; carts untouched for long are expired
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def __str__(self):
         return f"Cart for {self.user.username}"
@@ -51,7 +160,10 @@ class Cart(models.Model):
     
     @property
     def total_price(self):
-        return sum(item.subtotal for item in self.items.all())
+        from .pricing import product_table
+        items = list(self.items.values_list('product_id', 'quantity'))
+        prices = product_table.get_many([product_id for product_id, quantity in items])
+        return sum(prices[product_id].discounted_price * quantity for product_id, quantity in items)
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -66,7 +178,22 @@ class CartItem(models.Model):
     def subtotal(self):
         return self.product.discounted_price * self.quantity
 
-class Order(models.Model):
+class AbandonedCartDay(models.Model):
+    """Carts expired with items still in them, per day they were expired"""
+    date = models.DateField(unique=True)
+    carts = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    # At the prices of the day the carts were expired
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"{self.carts} carts abandoned on {self.date}"
+
+class Order(VersionedModel):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('processing', 'Processing'),
@@ -105,6 +232,23 @@ class Order(models.Model):
     shipped_date = models.DateTimeField(null=True, blank=True)
     estimated_delivery_date = models.DateTimeField(null=True, blank=True)
     
+    # Whether this order is currently counted in the product sales counters
+    sales_recorded = models.BooleanField(default=False, editable=False)
+    # Whether this order's items are counted in the product co-occurrence table
+    related_recorded = models.BooleanField(default=False, editable=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['tracking_number'], name='order_tracking_idx'),
+            # Completed orders not yet counted for related products, read by the related.update job
+            models.Index(
+                fields=['id'], name='order_related_pending_idx',
+                condition=Q(payment_status='completed', related_recorded=False)
+            ),
+            # Finished orders by age, read by the archive_orders command
+            models.Index(fields=['status', 'updated_at'], name='order_archive_idx'),
+        ]
+    
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
@@ -119,4 +263,337 @@ class OrderItem(models.Model):
     
     @property
     def subtotal(self):
-        return self.price * self.quantity
\ No newline at end of file
+        return self.price * self.quantity
+
+class ArchivedOrder(models.Model):
+    """Delivered or cancelled order moved out of Order by the archive_orders command
+
+    Keeps the order's ID, fields and relation names, so the order serializers
+    render it as they render an Order. Archived orders are read-only.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    payment_status = models.CharField(max_length=20, choices=Order.PAYMENT_STATUS_CHOICES)
+    created_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField()
+    
+    shipping_address = models.TextField()
+    city = models.CharField(max_length=100)
+    postal_code = models.CharField(max_length=20)
+    country = models.CharField(max_length=100)
+    
+    payment_method = models.CharField(max_length=50, blank=True)
+    payment_transaction_id = models.CharField(max_length=100, blank=True, db_index=True)
+    payment_date = models.DateTimeField(null=True, blank=True)
+    
+    tracking_number = models.CharField(max_length=100, blank=True, db_index=True)
+    shipped_date = models.DateTimeField(null=True, blank=True)
+    estimated_delivery_date = models.DateTimeField(null=True, blank=True)
+    
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Archived order {self.id} by {self.user.username}"
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField(default=1)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name}"
+    
+    @property
+    def subtotal(self):
+        return self.price * self.quantity
+
+class OrderArchiveTotals(models.Model):
+    """Count and revenue of the archived orders, so dashboard totals need not scan them"""
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = "Order archive totals"
+    
+    def __str__(self):
+        return f"{self.orders} archived orders"
+
+class CatalogVersion(models.Model):
+    """Counter bumped on every product or category change, shared by all workers"""
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
+
+
+class ProductSales(models.Model):
+    """Denormalized sales counters per product, maintained from completed orders"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+    units_sold = models.PositiveIntegerField(default=0, db_index=True)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Rolling windows, refreshed daily from ProductSalesDay
+    units_7d = models.PositiveIntegerField(default=0, db_index=True)
+    revenue_7d = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    units_30d = models.PositiveIntegerField(default=0, db_index=True)
+    revenue_30d = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = "Product sales"
+    
+    def __str__(self):
+        return f"Sales for {self.product.name}"
+
+class ProductCooccurrence(models.Model):
+    """How many completed orders contained both products; one row per direction"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='product_cooccurrence_pair'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} with {self.other_id}: {self.count}"
+
+class RelatedProduct(models.Model):
+    """Top neighbours of a product by co-occurrence, served as frequently bought together"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.PositiveIntegerField()
+    
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank'),
+        ]
+    
+    def __str__(self):
+        return f"{self.related_id} for {self.product_id} (#{self.rank})"
+
+class ProductSalesDay(models.Model):
+    """Units and revenue per product per day, the source for rolling windows"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_days')
+    date = models.DateField(db_index=True)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    class Meta:
+        unique_together = ('product', 'date')
+    
+    def __str__(self):
+        return f"{self.product.name} on {self.date}"
+
+
+class Job(models.Model):
+    """Background job stored in the database and run by the run_worker command"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    # At most one queued job per key; used to collapse and debounce duplicates
+    unique_key = models.CharField(max_length=200, null=True, blank=True)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['unique_key'],
+                condition=Q(status='queued'),
+                name='job_unique_queued_key'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Job {self.id} {self.name} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """Stored response for a client supplied Idempotency-Key"""
+    STATUS_CHOICES = [
+        ('in_progress', 'In Progress'),
+        ('completed', 'Completed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # Hash of the method, path and body the key was first used with
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.key} ({self.status})"
+
+
+class OrderSearchTerm(models.Model):
+    """Lower-cased searchable value of an order, kept in sync by signals"""
+    KIND_CHOICES = [
+        ('username', 'Username'),
+        ('email', 'Email'),
+        ('tracking', 'Tracking Number'),
+        ('transaction', 'Transaction ID'),
+    ]
+    
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='search_terms')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    term = models.CharField(max_length=254)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['term'], name='order_search_term_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'kind'], name='order_search_order_kind'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind}: {self.term}"
+
+
+class UserSearchTerm(models.Model):
+    """Lower-cased name or email of a user, for exact and prefix matches"""
+    KIND_CHOICES = [
+        ('username', 'Username'),
+        ('email', 'Email'),
+        ('first_name', 'First Name'),
+        ('last_name', 'Last Name'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_terms')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    term = models.CharField(max_length=254)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['term'], name='user_search_term_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind'], name='user_search_user_kind'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind}: {self.term}"
+
+
+class UserSearchTrigram(models.Model):
+    """Three-character slice of a user's names or email, for substring matches"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_trigrams')
+    trigram = models.CharField(max_length=3)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trigram', 'user'], name='user_search_trigram_user'),
+        ]
+    
+    def __str__(self):
+        return self.trigram
+
+
+class OrderEvent(models.Model):
+    """Change to an order's status, payment or tracking, streamed to its owner"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='order_events')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='order_event_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Event {self.id} for order {self.order_id}"
+
+
+class DashboardEvent(models.Model):
+    """Change to the admin dashboard totals, streamed to every admin"""
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"Dashboard event {self.id}"
+
+
+class RequestProfile(models.Model):
+    """Profile of one request taken for a staff user; only the latest PROFILE_KEEP are kept"""
+    MODE_CHOICES = [
+        ('cprofile', 'cProfile'),
+        ('sample', 'Sampling'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField()
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES)
+    duration_ms = models.FloatField()
+    sql_ms = models.FloatField()
+    sql_count = models.PositiveIntegerField()
+    serializer_ms = models.FloatField()
+    report = models.TextField()
+    queries = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-id']
+    
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+class SlowQuery(models.Model):
+    """Queries slower than SLOW_QUERY_THRESHOLD_MS, aggregated by fingerprint and the code that ran them"""
+    # Hash of the fingerprint, view and location
+    key = models.CharField(max_length=40, unique=True)
+    fingerprint = models.CharField(max_length=16, db_index=True)
+    statement = models.TextField()
+    params_shape = models.CharField(max_length=255, blank=True)
+    view = models.CharField(max_length=200, blank=True)
+    location = models.CharField(max_length=255)
+    stack = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-total_ms']
+    
+    def __str__(self):
+        return f"{self.fingerprint} at {self.location} ({self.count}x, {self.total_ms:.0f} ms)"
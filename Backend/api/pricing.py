@@ -0,0 +1,156 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+from decimal import Decimal
+from django.db import connection
+from django.utils import timezone
+from .models import CatalogVersion, Product
+
+# Changes are re-read from this far before the last sync, so rows from
+# transactions that committed after it are still picked up
+SYNC_OVERLAP = timedelta(seconds=60)
+
+# Lookups this soon after a version check reuse it, so rendering a cart
+# checks once rather than once per item. Changes made in this process
+# expire the check straight away.
+CHECK_INTERVAL = 0.05
+
+ROWS_PER_FETCH = 5000
+
+CENT = Decimal('0.01')
+
+VERSION_SQL = (
+    f'SELECT (SELECT version FROM {CatalogVersion._meta.db_table} WHERE id = 1), '
+    f'(SELECT MAX(updated_at) FROM {Product._meta.db_table})'
+)
+
+
+class ProductPrice:
+    """Price, discount and stock of one product, read from the product table"""
+    __slots__ = ('id', 'price', 'discount_percent', 'stock')
+
+    def __init__(self, id, price, discount_percent, stock):
+        self.id = id
+        self.price = price
+        self.discount_percent = discount_percent
+        self.stock = stock
+
+    @property
+    def discounted_price(self):
+        # Same arithmetic as Product.discounted_price
+        if self.discount_percent > 0:
+            return self.price * (1 - Decimal(self.discount_percent) / Decimal(100))
+        return self.price
+
+
+class ProductTable:
+    """Process-local copy of every product's price, discount and stock
+
+    Rows live in flat arrays sorted by product ID, a few dozen bytes per
+    product instead of a model instance with its description. Before each
+    lookup a single query reads the catalog version and the newest
+    ``Product.updated_at``; only when either has moved are the rows
+    updated since the last sync fetched.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.ids = array('q')
+        self.prices = array('q')
+        self.discounts = array('B')
+        self.stocks = array('q')
+        self.version = None
+        self.synced_at = None
+        self.checked_at = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in (self.ids, self.prices, self.discounts, self.stocks))
+
+    def _version(self):
+        # Plain SQL: this runs on every lookup, and compiling the equivalent
+        # ORM query would cost more than running it
+        with connection.cursor() as cursor:
+            cursor.execute(VERSION_SQL)
+            return cursor.fetchone()
+
+    def _store(self, pk, price, discount_percent, stock):
+        cents = int(price * 100)
+        index = bisect_left(self.ids, pk)
+        if index < len(self.ids) and self.ids[index] == pk:
+            self.prices[index] = cents
+            self.discounts[index] = discount_percent
+            self.stocks[index] = stock
+        else:
+            # IDs mostly grow, so this is nearly always an append
+            self.ids.insert(index, pk)
+            self.prices.insert(index, cents)
+            self.discounts.insert(index, discount_percent)
+            self.stocks.insert(index, stock)
+
+    def _fetch(self, queryset):
+        rows = queryset.order_by('id').values_list('id', 'price', 'discount_percent', 'stock')
+        for row in rows.iterator(chunk_size=ROWS_PER_FETCH):
+            self._store(*row)
+
+    def expire(self):
+        """Make the next lookup check the version again"""
+        self.checked_at = 0
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self.checked_at < CHECK_INTERVAL:
+            return
+        version = self._version()
+        self.checked_at = now
+        if version == self.version:
+            return
+        started = timezone.now()
+        if self.synced_at is None:
+            self.clear()
+            self._fetch(Product.objects.all())
+        else:
+            self._fetch(Product.objects.filter(updated_at__gte=self.synced_at - SYNC_OVERLAP))
+        self.version = version
+        self.synced_at = started
+
+    def _read(self, pk):
+        index = bisect_left(self.ids, pk)
+        if index == len(self.ids) or self.ids[index] != pk:
+            return None
+        return ProductPrice(
+            pk, Decimal(self.prices[index]) * CENT, self.discounts[index], self.stocks[index]
+        )
+
+    def get_many(self, ids):
+        """Return {id: ProductPrice} for the given product IDs that exist"""
+        with self.lock:
+            self._sync()
+            missing = [pk for pk in ids if self._read(pk) is None]
+            if missing:
+                # Created since the last sync by a transaction that was not yet visible
+                self._fetch(Product.objects.filter(pk__in=missing))
+            found = {}
+            for pk in ids:
+                record = self._read(pk)
+                if record is not None:
+                    found[pk] = record
+            return found
+
+    def get(self, pk):
+        return self.get_many([pk]).get(pk)
+
+
+product_table = ProductTable()
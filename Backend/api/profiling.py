@@ -0,0 +1,169 @@
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.db import connections
+from rest_framework.authtoken.models import Token
+from rest_framework.serializers import BaseSerializer
+from .fastpath import BoundSerializer
+from .models import RequestProfile
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+# Seconds between stack samples in sampling mode
+SAMPLE_INTERVAL = 0.005
+
+# Lines of the cProfile table and distinct stacks kept in a report
+REPORT_LINES = 80
+
+# Queries stored per profile; the totals still count every query
+MAX_QUERIES = 500
+
+# Time inside these is counted as serialization
+SERIALIZER_CODES = {
+    BaseSerializer.data.fget.__code__,
+    BoundSerializer.render_rows.__code__,
+    BoundSerializer.render_instances.__code__,
+}
+
+
+def requested_mode(request):
+    mode = request.GET.get('_profile') or request.headers.get('X-Profile')
+    return mode if mode in PROFILE_MODES else None
+
+
+def profiling_user(request):
+    """The staff user asking for a profile, from the session or a token, or None
+
+    DRF authenticates inside the view, after middleware, so tokens are
+    looked up here; this only happens on requests that ask for a profile.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        header = request.headers.get('Authorization', '')
+        token = Token.objects.select_related('user').filter(key=header[6:].strip()).first() if header.startswith('Token ') else None
+        user = token.user if token is not None else None
+    if user is None or not user.is_active or not user.is_staff:
+        return None
+    return user
+
+
+def _in_serializer(frame):
+    while frame is not None:
+        if frame.f_code in SERIALIZER_CODES:
+            return True
+        frame = frame.f_back
+    return False
+
+
+class QueryRecorder:
+    """``execute_wrapper`` that times every query and notes if a serializer ran it"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'ms': (time.perf_counter() - start) * 1000,
+                'serializer': _in_serializer(sys._getframe(1)),
+            })
+
+
+class Sampler:
+    """Samples the stack of one thread from a background thread"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profile-sampler', daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+
+    def serializer_share(self):
+        total = sum(self.stacks.values())
+        inside = sum(count for stack, count in self.stacks.items() if SERIALIZER_CODES.intersection(stack))
+        return inside / total if total else 0
+
+    def report(self):
+        """Collapsed stacks, one per line with its sample count, as flame graph tools read them"""
+        lines = [
+            ';'.join(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})' for code in stack) + f' {count}'
+            for stack, count in self.stacks.most_common(REPORT_LINES)
+        ]
+        return f'{sum(self.stacks.values())} samples every {self.interval * 1000:g} ms\n' + '\n'.join(lines)
+
+
+def _cprofile_report(profile):
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+    serializer = 0
+    for (filename, line, name), (cc, nc, tt, ct, callers) in stats.stats.items():
+        for code in SERIALIZER_CODES:
+            if (filename, line, name) == (code.co_filename, code.co_firstlineno, code.co_name):
+                serializer = max(serializer, ct)
+    return stream.getvalue(), serializer
+
+
+def profile_request(get_response, request, mode, user):
+    """Run the request under a profiler and store the result"""
+    recorder = QueryRecorder()
+    with connections['default'].execute_wrapper(recorder):
+        start = time.perf_counter()
+        if mode == 'cprofile':
+            profile = cProfile.Profile()
+            response = profile.runcall(get_response, request)
+            duration = time.perf_counter() - start
+            report, serializer = _cprofile_report(profile)
+        else:
+            with Sampler(threading.get_ident()) as sampler:
+                response = get_response(request)
+            duration = time.perf_counter() - start
+            report, serializer = sampler.report(), sampler.serializer_share() * duration
+
+    queries = recorder.queries
+    serializer_sql = sum(query['ms'] for query in queries if query['serializer'])
+    record = RequestProfile.objects.create(
+        user=user,
+        method=request.method,
+        path=request.get_full_path()[:500],
+        status_code=response.status_code,
+        mode=mode,
+        duration_ms=duration * 1000,
+        sql_ms=sum(query['ms'] for query in queries),
+        sql_count=len(queries),
+        # Queries run by serializers (lazy relations) count as ORM time, not serializer time
+        serializer_ms=max(serializer * 1000 - serializer_sql, 0),
+        report=report,
+        queries=queries[:MAX_QUERIES]
+    )
+    # Keep a ring buffer of the latest profiles
+    RequestProfile.objects.filter(id__lte=record.id - settings.PROFILE_KEEP).delete()
+    response['X-Profile-Id'] = str(record.id)
+    return response
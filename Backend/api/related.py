@@ -0,0 +1,152 @@
+from collections import Counter, defaultdict
+from heapq import nlargest
+from itertools import permutations
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+from .catalog import catalog_version
+from .jobs import task, enqueue
+from .metrics import record_cache
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, Product, ProductCooccurrence, RelatedProduct
+from .serializers import ProductSerializer
+
+# Orders counted per transaction of the update job
+UPDATE_BATCH_SIZE = 500
+
+# Bigger baskets add n² pairs and say little about any one product, so they are skipped
+MAX_BASKET_SIZE = 50
+
+# Cached lists are keyed on the catalog version, so this only bounds memory
+RELATED_CACHE_TIMEOUT = 60 * 60
+
+
+def related_cache_key(version, product_id):
+    return f'related:{version}:{product_id}'
+
+
+def count_pairs(order_ids, item_model=OrderItem):
+    """Count the product pairs in the given orders as {(product, other): orders}
+
+    The matrix is kept sparse: only pairs that were actually bought
+    together are counted, in both directions.
+    """
+    baskets = defaultdict(set)
+    items = item_model.objects.filter(order_id__in=order_ids).values_list('order_id', 'product_id')
+    for order_id, product_id in items:
+        baskets[order_id].add(product_id)
+    pairs = Counter()
+    for products in baskets.values():
+        if 1 < len(products) <= MAX_BASKET_SIZE:
+            pairs.update(permutations(products, 2))
+    return pairs
+
+
+def add_pairs(pairs):
+    """Add counts to the co-occurrence table; returns the products whose rows changed"""
+    products = {product for product, other in pairs}
+    existing = {
+        (row.product_id, row.other_id): row
+        for row in ProductCooccurrence.objects.select_for_update().filter(
+            product_id__in=products, other_id__in=products
+        )
+    }
+    changed, created = [], []
+    for (product, other), count in pairs.items():
+        row = existing.get((product, other))
+        if row is None:
+            created.append(ProductCooccurrence(product_id=product, other_id=other, count=count))
+        else:
+            row.count += count
+            changed.append(row)
+    ProductCooccurrence.objects.bulk_update(changed, ['count'], batch_size=500)
+    ProductCooccurrence.objects.bulk_create(created, batch_size=500)
+    return products
+
+
+def rank_related(product_ids):
+    """Rewrite the top-K rows of the given products from the co-occurrence table"""
+    top_k = settings.RELATED_PRODUCTS_TOP_K
+    neighbours = defaultdict(list)
+    rows = ProductCooccurrence.objects.filter(product_id__in=product_ids).values_list('product_id', 'other_id', 'count')
+    for product, other, count in rows.iterator(chunk_size=2000):
+        # Ties go to the lower product ID
+        neighbours[product].append((count, -other))
+
+    RelatedProduct.objects.filter(product_id__in=product_ids).delete()
+    RelatedProduct.objects.bulk_create([
+        RelatedProduct(product_id=product, related_id=-other, rank=rank, score=count)
+        for product, candidates in neighbours.items()
+        for rank, (count, other) in enumerate(nlargest(top_k, candidates), 1)
+    ], batch_size=500)
+    version = catalog_version()
+    cache.delete_many([related_cache_key(version, pk) for pk in product_ids])
+
+
+@task('related.update')
+def update_related_products():
+    """Count completed orders that are not in the co-occurrence table yet
+
+    Only new orders are read, never the whole history, and only the
+    products they contain are re-ranked.
+    """
+    pending = Order.objects.filter(payment_status='completed', related_recorded=False)
+    while True:
+        with transaction.atomic():
+            order_ids = list(
+                pending.select_for_update().order_by('id').values_list('id', flat=True)[:UPDATE_BATCH_SIZE]
+            )
+            if not order_ids:
+                return
+            touched = add_pairs(count_pairs(order_ids))
+            Order.objects.filter(pk__in=order_ids).update(related_recorded=True)
+            rank_related(touched)
+
+
+def queue_related_update():
+    """Count new completed orders in the background, a batch at a time"""
+    enqueue('related.update', delay=settings.RELATED_PRODUCTS_DELAY, unique_key='related:update')
+
+
+def rebuild_related_products():
+    """Recount every completed order, e.g. after a backfill"""
+    with transaction.atomic():
+        ProductCooccurrence.objects.all().delete()
+        RelatedProduct.objects.all().delete()
+        Order.objects.update(related_recorded=False)
+        # Archived orders left the hot table counted; recount them from the archive
+        archived = ArchivedOrder.objects.filter(payment_status='completed').order_by('id').values_list('id', flat=True)
+        for start in range(0, archived.count(), UPDATE_BATCH_SIZE):
+            add_pairs(count_pairs(list(archived[start:start + UPDATE_BATCH_SIZE]), ArchivedOrderItem))
+        update_related_products()
+    version = catalog_version()
+    cache.delete_many([related_cache_key(version, pk) for pk in Product.objects.values_list('pk', flat=True)])
+
+
+def cached_related(product_id, request=None):
+    """Serialized related products of a product, cached per catalog version
+
+    The cached image URLs are relative so every host can share them; with
+    a request they are made absolute like the rest of the API's.
+    """
+    key = related_cache_key(catalog_version(), product_id)
+    data = cache.get(key)
+    record_cache('related', data is not None)
+    if data is None:
+        if not Product.objects.filter(pk=product_id).exists():
+            raise Http404
+        entries = list(
+            RelatedProduct.objects.filter(product_id=product_id)
+            .select_related('related__category')
+            .order_by('rank')
+        )
+        data = list(ProductSerializer([entry.related for entry in entries], many=True).data)
+        for product, entry in zip(data, entries):
+            product['score'] = entry.score
+        cache.set(key, data, RELATED_CACHE_TIMEOUT)
+    if request is not None:
+        data = [
+            {**product, 'image': request.build_absolute_uri(product['image'])} if product['image'] else product
+            for product in data
+        ]
+    return data
@@ -0,0 +1,156 @@
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum, Subquery, OuterRef, DecimalField, IntegerField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .jobs import task, enqueue
+from .metrics import record_cache
+from .models import ArchivedOrder, Order, ProductSales, ProductSalesDay
+
+# Rolling windows as (days, units column, revenue column)
+SALES_WINDOWS = {
+    '7d': (7, 'units_7d', 'revenue_7d'),
+    '30d': (30, 'units_30d', 'revenue_30d'),
+}
+
+
+def counts_as_sale(order):
+    return order.payment_status == 'completed' and order.status != 'cancelled'
+
+
+def sale_date(order):
+    return timezone.localdate(order.payment_date or order.created_at)
+
+
+def _apply(order, sign):
+    """Add (sign=1) or remove (sign=-1) the order's items from the counters"""
+    day = sale_date(order)
+    today = timezone.localdate()
+    lines = {}
+    for product_id, quantity, price in order.items.values_list('product_id', 'quantity', 'price'):
+        units, revenue = lines.get(product_id, (0, 0))
+        lines[product_id] = (units + quantity, revenue + price * quantity)
+
+    for product_id, (units, revenue) in lines.items():
+        units, revenue = sign * units, sign * revenue
+        changes = {
+            'units_sold': F('units_sold') + units,
+            'revenue': F('revenue') + revenue,
+        }
+        for days, units_field, revenue_field in SALES_WINDOWS.values():
+            if day > today - timedelta(days=days):
+                changes[units_field] = F(units_field) + units
+                changes[revenue_field] = F(revenue_field) + revenue
+        ProductSales.objects.get_or_create(product_id=product_id)
+        ProductSales.objects.filter(product_id=product_id).update(**changes)
+
+        ProductSalesDay.objects.get_or_create(product_id=product_id, date=day)
+        ProductSalesDay.objects.filter(product_id=product_id, date=day).update(
+            units=F('units') + units,
+            revenue=F('revenue') + revenue
+        )
+
+
+def sync_order_sales(order):
+    """Count or uncount an order so the counters match its payment and status
+
+    The conditional update on ``sales_recorded`` makes this safe to call
+    repeatedly and from concurrent requests: only the caller that flips the
+    flag touches the counters.
+    """
+    counted = counts_as_sale(order)
+    with transaction.atomic():
+        flipped = Order.objects.filter(pk=order.pk, sales_recorded=not counted).update(sales_recorded=counted)
+        if flipped:
+            _apply(order, 1 if counted else -1)
+    order.sales_recorded = counted
+
+
+@task('sales.sync_order')
+def sync_order_sales_job(order_id):
+    order = Order.objects.filter(pk=order_id).first()
+    if order is not None:
+        sync_order_sales(order)
+
+
+def queue_order_sales(order):
+    """Sync the counters for an order in the background"""
+    enqueue('sales.sync_order', {'order_id': order.pk}, unique_key=f'sales:order:{order.pk}')
+
+
+@task('sales.sync_orders')
+def sync_orders_sales_job(order_ids):
+    for order in Order.objects.filter(pk__in=order_ids).iterator(chunk_size=500):
+        sync_order_sales(order)
+
+
+def queue_orders_sales(order_ids):
+    """Sync the counters for a batch of orders in one background job"""
+    enqueue('sales.sync_orders', {'order_ids': list(order_ids)})
+
+
+def _window_sum(column, days, today, output_field):
+    totals = (
+        ProductSalesDay.objects
+        .filter(product=OuterRef('product'), date__gt=today - timedelta(days=days))
+        .order_by()
+        .values('product')
+        .annotate(total=Sum(column))
+        .values('total')
+    )
+    return Coalesce(Subquery(totals, output_field=output_field), Value(0), output_field=output_field)
+
+
+@task('sales.refresh_windows', every=3600)
+def refresh_sales_windows():
+    """Recompute every rolling window from the daily buckets in one UPDATE"""
+    today = timezone.localdate()
+    changes = {}
+    for days, units_field, revenue_field in SALES_WINDOWS.values():
+        changes[units_field] = _window_sum('units', days, today, IntegerField())
+        changes[revenue_field] = _window_sum('revenue', days, today, DecimalField(max_digits=12, decimal_places=2))
+    ProductSales.objects.update(**changes)
+    cache.set('sales:windows_date', today.isoformat(), None)
+
+
+@task('sales.roll_windows', every=300)
+def ensure_sales_windows():
+    """Refresh the rolling windows if they have not been refreshed today
+
+    Run by the worker every few minutes, so the windows roll over soon
+    after midnight without a request having to write.
+    """
+    today = timezone.localdate().isoformat()
+    fresh = cache.get('sales:windows_date') == today
+    record_cache('sales_windows', fresh)
+    if not fresh:
+        refresh_sales_windows()
+
+
+def rebuild_sales_counters():
+    """Rebuild all counters from order history, e.g. after a backfill"""
+    with transaction.atomic():
+        ProductSales.objects.all().delete()
+        ProductSalesDay.objects.all().delete()
+        Order.objects.update(sales_recorded=False)
+        orders = Order.objects.filter(payment_status='completed').exclude(status='cancelled')
+        for order in orders.iterator(chunk_size=500):
+            sync_order_sales(order)
+        # Archived orders were counted before they moved and are never synced again
+        archived = ArchivedOrder.objects.filter(payment_status='completed').exclude(status='cancelled')
+        for order in archived.iterator(chunk_size=500):
+            _apply(order, 1)
+        refresh_sales_windows()
+
+
+def top_products(start_date, end_date, limit=10):
+    """Best selling products between two dates, read from the daily buckets"""
+    return list(
+        ProductSalesDay.objects
+        .filter(date__gte=start_date, date__lte=end_date)
+        .values('product__name')
+        .annotate(total_quantity=Sum('units'), total_revenue=Sum('revenue'))
+        .filter(total_quantity__gt=0)
+        .order_by('-total_quantity')[:limit]
+    )
@@ -0,0 +1,261 @@
+import re
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+from .models import Order, OrderSearchTerm, UserSearchTerm, UserSearchTrigram
+
+TERM_MAX_LENGTH = 254
+
+# Order IDs and numeric tracking numbers; longer digit strings cannot be a PK
+NUMERIC_RE = re.compile(r'^\d{1,18}$')
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+# Cap on users returned per match type, which bounds the cost of a search
+USER_SEARCH_CANDIDATES = 200
+
+# Users read per step from a trigram's posting list in substring matches
+USER_SEARCH_CHUNK = 500
+
+# Posting lists are only counted this far when picking the rarest trigram
+USER_SEARCH_POSTING_CAP = 5000
+
+# Posting list entries read per substring search; a search that runs out
+# stops there and reports its results as partial
+USER_SEARCH_SCAN_BUDGET = 20000
+
+# Trigrams of the query used for substring matches, spread across it;
+# candidates are checked against the full query afterwards
+USER_SEARCH_TRIGRAMS = 6
+
+USER_SEARCH_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+def normalize_term(value):
+    return (value or '').strip().lower()[:TERM_MAX_LENGTH]
+
+
+def prefix_range(prefix, field='term'):
+    """Lookups matching ``prefix`` as a range, so any B-tree index is used
+
+    ``startswith`` becomes a case-insensitive ``LIKE`` on SQLite, which
+    cannot use a plain index.
+    """
+    return {f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'}
+
+
+def order_terms(order):
+    """The (kind, term) pairs an order is found by"""
+    values = (
+        ('username', order.user.username),
+        ('email', order.user.email),
+        ('tracking', order.tracking_number),
+        ('transaction', order.payment_transaction_id),
+    )
+    return {(kind, normalize_term(value)) for kind, value in values if normalize_term(value)}
+
+
+def index_order(order):
+    """Bring the search terms of one order up to date"""
+    wanted = order_terms(order)
+    existing = set(OrderSearchTerm.objects.filter(order=order).values_list('kind', 'term'))
+    changed = {kind for kind, term in wanted ^ existing}
+    if not changed:
+        return
+    OrderSearchTerm.objects.filter(order=order, kind__in=changed).delete()
+    OrderSearchTerm.objects.bulk_create([
+        OrderSearchTerm(order=order, kind=kind, term=term)
+        for kind, term in wanted if kind in changed
+    ])
+
+
+def index_orders(order_ids):
+    for order in Order.objects.filter(pk__in=order_ids).select_related('user'):
+        index_order(order)
+
+
+def index_user_orders(user):
+    """Update the username and email terms of every order of a user"""
+    orders = Order.objects.filter(user=user)
+    for kind, value in (('username', user.username), ('email', user.email)):
+        term = normalize_term(value)
+        terms = OrderSearchTerm.objects.filter(order__user=user, kind=kind)
+        if not term:
+            terms.delete()
+            continue
+        terms.exclude(term=term).update(term=term)
+        missing = orders.exclude(search_terms__kind=kind).values_list('pk', flat=True)
+        OrderSearchTerm.objects.bulk_create(
+            [OrderSearchTerm(order_id=pk, kind=kind, term=term) for pk in missing],
+            batch_size=500
+        )
+
+
+def search_orders(queryset, search):
+    """Filter orders by a free-text admin search using indexed lookups only
+
+    Digits are an order ID or tracking number, an email address is matched
+    exactly and a partial one by prefix, and anything else is a prefix
+    match on the order search terms.
+    """
+    search = search.strip()
+    if not search:
+        return queryset
+    if NUMERIC_RE.match(search):
+        return queryset.filter(Q(pk=int(search)) | Q(tracking_number=search))
+
+    term = normalize_term(search)
+    if EMAIL_RE.match(term):
+        matches = OrderSearchTerm.objects.filter(kind='email', term=term)
+    elif '@' in term:
+        matches = OrderSearchTerm.objects.filter(kind='email', **prefix_range(term))
+    else:
+        matches = OrderSearchTerm.objects.filter(**prefix_range(term))
+    return queryset.filter(pk__in=matches.values('order_id'))
+
+
+def search_archived_orders(queryset, search):
+    """The same search over archived orders, which have no search terms of their own
+
+    Users are found through their own search terms; tracking numbers and
+    transaction IDs are prefix-matched on their indexed columns, as typed.
+    """
+    search = search.strip()
+    if not search:
+        return queryset
+    if NUMERIC_RE.match(search):
+        return queryset.filter(Q(pk=int(search)) | Q(tracking_number=search))
+
+    term = normalize_term(search)
+    if EMAIL_RE.match(term):
+        users = UserSearchTerm.objects.filter(kind='email', term=term)
+    elif '@' in term:
+        users = UserSearchTerm.objects.filter(kind='email', **prefix_range(term))
+    else:
+        users = UserSearchTerm.objects.filter(kind__in=('username', 'email'), **prefix_range(term))
+        return queryset.filter(
+            Q(user_id__in=users.values('user_id'))
+            | Q(**prefix_range(search, 'tracking_number'))
+            | Q(**prefix_range(search, 'payment_transaction_id'))
+        )
+    return queryset.filter(user_id__in=users.values('user_id'))
+
+
+def trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def user_terms(user):
+    values = ((field, normalize_term(getattr(user, field))) for field in USER_SEARCH_FIELDS)
+    return {(kind, term) for kind, term in values if term}
+
+
+def index_user(user):
+    """Bring the search terms and trigrams of one user up to date"""
+    terms = user_terms(user)
+    existing = set(UserSearchTerm.objects.filter(user=user).values_list('kind', 'term'))
+    changed = {kind for kind, term in terms ^ existing}
+    if not changed:
+        return
+    UserSearchTerm.objects.filter(user=user, kind__in=changed).delete()
+    UserSearchTerm.objects.bulk_create([
+        UserSearchTerm(user=user, kind=kind, term=term)
+        for kind, term in terms if kind in changed
+    ])
+
+    grams = set().union(*(trigrams(term) for kind, term in terms))
+    existing = set(UserSearchTrigram.objects.filter(user=user).values_list('trigram', flat=True))
+    UserSearchTrigram.objects.filter(user=user, trigram__in=existing - grams).delete()
+    UserSearchTrigram.objects.bulk_create([
+        UserSearchTrigram(user=user, trigram=gram) for gram in grams - existing
+    ])
+
+
+def _spread(grams, count):
+    grams = sorted(grams)
+    if len(grams) <= count:
+        return grams
+    step = len(grams) / count
+    return [grams[int(i * step)] for i in range(count)]
+
+
+def _posting_size(gram):
+    """Users holding ``gram``, counted up to a cap so common trigrams stay cheap"""
+    return UserSearchTrigram.objects.filter(trigram=gram)[:USER_SEARCH_POSTING_CAP].count()
+
+
+def _substring_matches(model, term, skip, limit):
+    """Up to ``limit`` users not in ``skip`` whose names or email contain ``term``
+
+    The posting list of the rarest sampled trigram is read in index order,
+    a chunk at a time; each chunk is narrowed to users holding the other
+    trigrams and confirmed with LIKE, until enough users are confirmed.
+    Returns the users and whether the posting list was read within
+    ``USER_SEARCH_SCAN_BUDGET`` entries.
+    """
+    grams = sorted(_spread(trigrams(term), USER_SEARCH_TRIGRAMS), key=_posting_size)
+    rarest, others = grams[0], grams[1:]
+    matches = Q()
+    for field in USER_SEARCH_FIELDS:
+        matches |= Q(**{f'{field}__icontains': term})
+
+    found = set()
+    last = 0
+    scanned = 0
+    while len(found) < limit:
+        if scanned >= USER_SEARCH_SCAN_BUDGET:
+            return found, False
+        chunk = list(
+            UserSearchTrigram.objects.filter(trigram=rarest, user_id__gt=last)
+            .order_by('user_id').values_list('user_id', flat=True)
+            [:min(USER_SEARCH_CHUNK, USER_SEARCH_SCAN_BUDGET - scanned)]
+        )
+        if not chunk:
+            break
+        last = chunk[-1]
+        scanned += len(chunk)
+        candidates = set(chunk) - skip
+        if others and candidates:
+            candidates = set(
+                UserSearchTrigram.objects.filter(trigram__in=others, user_id__in=candidates)
+                .values('user_id').annotate(hits=Count('id')).filter(hits=len(others))
+                .values_list('user_id', flat=True)
+            )
+        if candidates:
+            confirmed = model.objects.filter(pk__in=candidates).filter(matches).order_by('pk')
+            found.update(confirmed.values_list('pk', flat=True)[:limit - len(found)])
+    return found, True
+
+
+def search_users(queryset, search):
+    """Filter users by a free-text admin search, best matches first
+
+    Exact and prefix matches come from the term index; substring matches
+    are users holding every sampled trigram of the query, confirmed
+    against the query itself. Every stage reads an index instead of
+    scanning ``auth_user`` and returns at most ``USER_SEARCH_CANDIDATES``
+    users; only users holding every sampled trigram are compared with LIKE.
+
+    Returns the queryset and whether the search is complete: False when
+    substring matching ran out of its scan budget.
+    """
+    term = normalize_term(search)
+    if not term:
+        return queryset, True
+    limit = USER_SEARCH_CANDIDATES
+
+    exact = set(UserSearchTerm.objects.filter(term=term).values_list('user_id', flat=True)[:limit])
+    prefix = set(
+        UserSearchTerm.objects.filter(**prefix_range(term))
+        .values_list('user_id', flat=True)[:limit]
+    ) - exact
+
+    substring, complete = set(), True
+    if len(term) >= 3:
+        substring, complete = _substring_matches(queryset.model, term, exact | prefix, limit)
+
+    return queryset.filter(pk__in=exact | prefix | substring).annotate(
+        search_rank=Case(
+            When(pk__in=exact, then=Value(0)),
+            When(pk__in=prefix, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField()
+        )
+    ).order_by('search_rank', *queryset.query.order_by), complete
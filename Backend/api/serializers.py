@@ -1,25 +1,34 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Category, Product, Cart, CartItem, Order, OrderItem
+from .fieldsets import SparseFieldsetMixin
+from .fastpath import CompiledListSerializer
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'is_staff')
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
+        list_serializer_class = CompiledListSerializer
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     discounted_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     image = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ('effective_price', 'version')
+        list_serializer_class = CompiledListSerializer
+        sparse_sources = {
+            'discounted_price': ('price', 'discount_percent'),
+            'image': ('image',),
+        }
+        fast_media_fields = ('image',)
     
     def get_image(self, obj):
         if obj.image:
@@ -29,15 +38,18 @@ class ProductSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
         model = CartItem
         fields = '__all__'
+        sparse_sources = {
+            'subtotal': ('quantity', 'product'),
+        }
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_items = serializers.IntegerField(read_only=True)
     total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
@@ -46,20 +58,24 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = '__all__'
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
         model = OrderItem
         fields = '__all__'
+        list_serializer_class = CompiledListSerializer
+        sparse_sources = {
+            'subtotal': ('price', 'quantity'),
+        }
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
-        fields = '__all__'
+        exclude = ('sales_recorded', 'related_recorded', 'version')
         read_only_fields = ('user', 'total_amount', 'created_at', 'updated_at')
 
 class RegisterSerializer(serializers.ModelSerializer):
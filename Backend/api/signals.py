@@ -0,0 +1,115 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+from .models import Category, Product, Order, ArchivedOrder
+from .archive import uncount_archived_order
+from .catalog import catalog_changed
+from .sales import counts_as_sale, queue_order_sales
+from .search import index_order, index_user, index_user_orders
+from .events import order_state, record_order_event
+from .related import queue_related_update
+from .dashboard import order_totals, record_order_change, record_stock_change, record_signup
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def rebuild_catalog_snapshot(sender, **kwargs):
+    catalog_changed()
+
+
+@receiver(post_save, sender=Order)
+def update_sales_counters(sender, instance, created, **kwargs):
+    if created and not counts_as_sale(instance):
+        return
+    queue_order_sales(instance)
+
+
+@receiver(post_save, sender=Order)
+def update_related_products(sender, instance, **kwargs):
+    if instance.payment_status == 'completed' and not instance.related_recorded:
+        queue_related_update()
+
+
+@receiver(post_init, sender=Order)
+def remember_order_state(sender, instance, **kwargs):
+    instance._event_state = order_state(instance)
+
+
+@receiver(post_save, sender=Order)
+def publish_order_event(sender, instance, created, **kwargs):
+    state = order_state(instance)
+    if created or state != instance._event_state:
+        record_order_event(instance)
+        instance._event_state = state
+
+
+@receiver(post_init, sender=Order)
+def remember_order_totals(sender, instance, **kwargs):
+    instance._dashboard_totals = order_totals(instance)
+
+
+@receiver(post_save, sender=Order)
+def publish_order_totals(sender, instance, created, **kwargs):
+    totals = order_totals(instance)
+    if created or totals != instance._dashboard_totals:
+        record_order_change(instance, None if created else instance._dashboard_totals, created=created)
+        instance._dashboard_totals = totals
+
+
+@receiver(post_delete, sender=Order)
+def publish_deleted_order_totals(sender, instance, **kwargs):
+    record_order_change(instance, instance._dashboard_totals, deleted=True)
+
+
+@receiver(post_delete, sender=ArchivedOrder)
+def publish_deleted_archived_order(sender, instance, **kwargs):
+    # Only reached when the customer is deleted; the archive is otherwise read-only
+    uncount_archived_order(instance)
+    record_order_change(instance, order_totals(instance), deleted=True)
+
+
+@receiver(post_init, sender=Product)
+def remember_product_stock(sender, instance, **kwargs):
+    instance._dashboard_stock = instance.__dict__.get('stock')
+
+
+@receiver(post_save, sender=Product)
+def publish_product_stock(sender, instance, created, **kwargs):
+    before = None if created else instance._dashboard_stock
+    if created or (before is not None and before != instance.stock):
+        record_stock_change(instance, before, instance.stock)
+    instance._dashboard_stock = instance.stock
+
+
+@receiver(post_delete, sender=Product)
+def publish_deleted_product_stock(sender, instance, **kwargs):
+    record_stock_change(instance, instance._dashboard_stock, None)
+
+
+@receiver(post_save, sender=Order)
+def update_order_search_terms(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not {'tracking_number', 'payment_transaction_id'} & set(update_fields):
+        return
+    index_order(instance)
+
+
+@receiver(post_save, sender=User)
+def update_user_search_terms(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not {'username', 'email', 'first_name', 'last_name'} & set(update_fields):
+        return
+    index_user(instance)
+    if not created:
+        index_user_orders(instance)
+
+
+@receiver(post_save, sender=User)
+def publish_signup(sender, instance, created, **kwargs):
+    if created:
+        record_signup(instance)
+
+
+@receiver(post_delete, sender=User)
+def publish_deleted_user(sender, instance, **kwargs):
+    record_signup(instance, deleted=True)
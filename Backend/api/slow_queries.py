@@ -0,0 +1,198 @@
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F, Max, Sum
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import SlowQuery
+
+API_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+# Frames of these files are the recorders themselves, not the code that ran the query
+SKIPPED_FILES = {os.path.join(API_DIR, name) for name in ('slow_queries.py', 'metrics.py', 'profiling.py')}
+
+# api/ frames kept per query, innermost first
+STACK_DEPTH = 8
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+# IN lists and multi-row VALUES vary in length with the data, not the code
+LIST_RE = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+ROWS_RE = re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')
+SPACE_RE = re.compile(r'\s+')
+
+_state = threading.local()
+
+
+def normalize(sql):
+    """SQL with literals replaced and variable-length lists collapsed"""
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = LIST_RE.sub('(...)', sql)
+    sql = ROWS_RE.sub(r'\1', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(statement):
+    return hashlib.sha1(statement.encode()).hexdigest()[:16]
+
+
+def _shape(params):
+    """Parameter types with runs collapsed, e.g. ``int, str, datetime x3``"""
+    if params is None:
+        return ''
+    if isinstance(params, dict):
+        return ', '.join(f'{name}={type(value).__name__}' for name, value in params.items())
+    runs = []
+    for value in params:
+        name = type(value).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return ', '.join(name if count == 1 else f'{name} x{count}' for name, count in runs)
+
+
+def params_shape(params, many):
+    if many:
+        rows = list(params)
+        return f'{len(rows)} rows of ({_shape(rows[0]) if rows else ""})'
+    return _shape(params)
+
+
+def api_frames(frame):
+    """The innermost frames that belong to this app, as ``api/file.py:line in function``"""
+    frames = []
+    while frame is not None and len(frames) < STACK_DEPTH:
+        filename = frame.f_code.co_filename
+        if filename.startswith(API_DIR) and filename not in SKIPPED_FILES:
+            relative = os.path.relpath(filename, os.path.dirname(API_DIR.rstrip(os.sep)))
+            frames.append(f'{relative}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return frames
+
+
+def _pending():
+    pending = getattr(_state, 'pending', None)
+    if pending is None:
+        pending = _state.pending = []
+    return pending
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if record_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_slow_query)
+
+
+def record_slow_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if threshold and elapsed_ms >= threshold and not getattr(_state, 'flushing', False):
+            frames = api_frames(sys._getframe(1))
+            _pending().append({
+                'statement': normalize(sql),
+                'params_shape': params_shape(params, many)[:255],
+                'view': getattr(_state, 'view', ''),
+                'location': frames[0] if frames else '(outside api)',
+                'stack': '\n'.join(frames),
+                'ms': elapsed_ms,
+            })
+            # Requests flush once they are done; elsewhere (jobs, commands) flush
+            # as soon as that cannot write into someone else's transaction
+            if not getattr(_state, 'in_request', False) and not context['connection'].in_atomic_block:
+                flush()
+
+
+def _store(entry, now):
+    statement_fingerprint = fingerprint(entry['statement'])
+    key = hashlib.sha1(f"{statement_fingerprint}|{entry['view']}|{entry['location']}".encode()).hexdigest()
+    changes = {
+        'count': F('count') + 1,
+        'total_ms': F('total_ms') + entry['ms'],
+        'max_ms': Greatest('max_ms', entry['ms']),
+        'last_seen': now,
+        # The latest stack and params, which the fingerprint leaves open
+        'stack': entry['stack'],
+        'params_shape': entry['params_shape'],
+    }
+    if SlowQuery.objects.filter(key=key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            SlowQuery.objects.create(
+                key=key,
+                fingerprint=statement_fingerprint,
+                statement=entry['statement'],
+                params_shape=entry['params_shape'],
+                view=entry['view'],
+                location=entry['location'][:255],
+                stack=entry['stack'],
+                count=1,
+                total_ms=entry['ms'],
+                max_ms=entry['ms'],
+                last_seen=now
+            )
+    except IntegrityError:
+        # Another process stored the first one in the meantime
+        SlowQuery.objects.filter(key=key).update(**changes)
+
+
+def flush():
+    """Store the slow queries this thread has seen"""
+    pending = _pending()
+    if not pending:
+        return
+    _state.pending = []
+    _state.flushing = True
+    try:
+        now = timezone.now()
+        for entry in pending:
+            _store(entry, now)
+    finally:
+        _state.flushing = False
+
+
+def start_request():
+    _state.in_request = True
+    _state.view = ''
+
+
+def set_view(view):
+    _state.view = view
+
+
+def finish_request():
+    _state.in_request = False
+    _state.view = ''
+    flush()
+
+
+# Orderings of top_offenders
+OFFENDER_ORDERING = {'total': 'total', 'count': 'calls', 'max': 'slowest'}
+
+
+def top_offenders(limit=20, order_by='total'):
+    """Fingerprints worst first, with totals over every place that ran them and those places"""
+    groups = list(
+        SlowQuery.objects.values('fingerprint', 'statement')
+        .annotate(calls=Sum('count'), total=Sum('total_ms'), slowest=Max('max_ms'))
+        .order_by(f'-{OFFENDER_ORDERING[order_by]}')[:limit]
+    )
+    sources = {}
+    for row in SlowQuery.objects.filter(fingerprint__in=[group['fingerprint'] for group in groups]).order_by('-total_ms'):
+        sources.setdefault(row.fingerprint, []).append(row)
+    for group in groups:
+        group['sources'] = sources.get(group['fingerprint'], [])
+    return groups
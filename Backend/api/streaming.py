@@ -0,0 +1,97 @@
+from itertools import islice
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+# Rows fetched from the database and serialized per batch
+STREAM_CHUNK_SIZE = 500
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def stream_format(request, default=None):
+    """Return the streaming format requested with ``?stream=``, or ``default``"""
+    value = request.query_params.get('stream')
+    if value is None:
+        return default
+    value = value.lower()
+    if value in ('1', 'true', 'json'):
+        return 'json'
+    if value == 'ndjson':
+        return 'ndjson'
+    return default
+
+
+def iter_chunks(queryset, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield lists of at most ``chunk_size`` objects from a server-side iterator"""
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_json(queryset, serialize, fmt='json', chunk_size=STREAM_CHUNK_SIZE, rest=()):
+    """Yield a JSON array or NDJSON document one batch of rows at a time
+
+    ``serialize`` turns a list of model instances into a list of dicts.
+    Only one batch is held in memory, however many rows are streamed.
+    ``rest`` holds further ``(queryset, serialize)`` pairs streamed after
+    the first into the same document.
+    """
+    renderer = JSONRenderer()
+    first = True
+    if fmt == 'json':
+        yield b'['
+    for queryset, serialize in ((queryset, serialize), *rest):
+        for chunk in iter_chunks(queryset, chunk_size):
+            parts = []
+            for item in serialize(chunk):
+                encoded = renderer.render(item)
+                if fmt == 'ndjson':
+                    parts.append(encoded + b'\n')
+                elif first:
+                    parts.append(encoded)
+                    first = False
+                else:
+                    parts.append(b',' + encoded)
+            yield b''.join(parts)
+    if fmt == 'json':
+        yield b']'
+
+
+def streaming_response(queryset, serialize, fmt='json', filename=None, rest=()):
+    """Wrap :func:`stream_json` in a ``StreamingHttpResponse``"""
+    response = StreamingHttpResponse(
+        stream_json(queryset, serialize, fmt, rest=rest),
+        content_type=STREAM_FORMATS[fmt]
+    )
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+class StreamingListMixin:
+    """List view mixin that streams the unpaginated queryset on ``?stream=``"""
+
+    def list(self, request, *args, **kwargs):
+        fmt = stream_format(request)
+        if fmt is None:
+            return super().list(request, *args, **kwargs)
+        return self.stream(fmt)
+
+    def get_stream_querysets(self):
+        return [self.filter_queryset(self.get_queryset())]
+
+    def stream(self, fmt, filename=None):
+        context = self.get_serializer_context()
+        serializer_class = self.get_serializer_class()
+
+        def serialize(chunk):
+            return serializer_class(chunk, many=True, context=context).data
+
+        first, *rest = self.get_stream_querysets()
+        return streaming_response(first, serialize, fmt, filename, rest=[(queryset, serialize) for queryset in rest])
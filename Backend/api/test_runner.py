@@ -0,0 +1,23 @@
+import os
+import shutil
+import tempfile
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Test runner that keeps the run's metrics files and throttle state out of the real ones"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.scratch_dir = tempfile.mkdtemp(prefix='summitmarket-test-')
+        self.scratch_override = override_settings(
+            METRICS_DIR=os.path.join(self.scratch_dir, 'metrics'),
+            THROTTLE_STORE=os.path.join(self.scratch_dir, 'throttle.sqlite3'),
+        )
+        self.scratch_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.scratch_override.disable()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -1,5 +1,8 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .models import Category, Product, Cart, CartItem, Order, OrderItem
 
 class CategoryModelTest(TestCase):
@@ -98,4 +101,1573 @@ class OrderModelTest(TestCase):
         self.assertEqual(str(self.order), 'Order 1 by testuser')
     
     def test_order_item_subtotal(self):
-        self.assertEqual(float(self.order_item.subtotal), 699.99)
\ No newline at end of file
+        self.assertEqual(float(self.order_item.subtotal), 699.99)
+
+class SparseFieldsetTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Electronics')
+        self.product = Product.objects.create(
+            name='Smartphone',
+            description='Latest smartphone model',
+            price=699.99,
+            category=self.category,
+            stock=10
+        )
+        self.order = Order.objects.create(
+            user=self.user,
+            total_amount=699.99,
+            shipping_address='123 Test St',
+            city='Test City',
+            postal_code='12345',
+            country='Test Country'
+        )
+        OrderItem.objects.create(
+            order=self.order,
+            product=self.product,
+            quantity=1,
+            price=699.99
+        )
+    
+    def test_product_list_fields(self):
+        response = self.client.get('/api/products/', {'fields': 'id,name,discounted_price'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {'id', 'name', 'discounted_price'}
+        )
+    
+    def test_product_list_defers_unused_columns(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/products/', {'fields': 'id,name'})
+        product_query = [q['sql'] for q in queries if 'FROM "api_product"' in q['sql']][-1]
+        self.assertNotIn('"description"', product_query)
+    
+    def test_default_output_unchanged(self):
+        response = self.client.get(f'/api/products/{self.product.id}/')
+        self.assertIn('description', response.data)
+        self.assertEqual(response.data['category_name'], 'Electronics')
+    
+    def test_order_nested_fields(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/orders/', {'fields': 'id,items.quantity,items.product.name'})
+        self.assertEqual(response.data, [{
+            'id': self.order.id,
+            'items': [{'quantity': 1, 'product': {'name': 'Smartphone'}}],
+        }])
+    
+    def test_order_collapsed_expansion(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/orders/', {'fields': 'id,items', 'expand': ''})
+        self.assertEqual(response.data, [{
+            'id': self.order.id,
+            'items': [self.order.items.get().id],
+        }])
+    
+    def test_order_list_query_count(self):
+        self.client.force_authenticate(self.user)
+        # Archived orders, orders and their items
+        with self.assertNumQueries(3):
+            self.client.get('/api/orders/', {'fields': 'id,items.product.category_name'})
+
+
+class CompiledSerializerTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIRequestFactory
+        self.request = APIRequestFactory().get('/api/products/')
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='Electronics', image='categories/front page.jpg')
+        Category.objects.create(name='Books', description='Paper')
+        for index, discount in enumerate([0, 10, 15, 33]):
+            Product.objects.create(
+                name=f'Product {index}',
+                description='Latest model',
+                price='%d.99' % (index * 100 + 19),
+                category=self.category,
+                image=f'products/item ü {index}.jpg' if index % 2 else '',
+                stock=index,
+                discount_percent=discount
+            )
+        order = Order.objects.create(
+            user=self.user,
+            total_amount='19.99',
+            shipping_address='123 Test St',
+            city='Test City',
+            postal_code='12345',
+            country='Test Country'
+        )
+        for product in Product.objects.all():
+            OrderItem.objects.create(order=order, product=product, quantity=3, price=product.discounted_price)
+    
+    def assertSameOutput(self, serializer_class, queryset, context):
+        from rest_framework import serializers
+        from rest_framework.renderers import JSONRenderer
+        from .fastpath import compile_serializer
+        reference = serializers.ListSerializer(
+            child=serializer_class(), instance=queryset, context=context
+        )
+        expected = JSONRenderer().render(reference.data)
+        compiled = compile_serializer(serializer_class(context=context))
+        self.assertIsNotNone(compiled)
+        from_rows = compiled.bind(context).render_rows(queryset.values(*compiled.columns))
+        from_instances = serializer_class(queryset, many=True, context=context).data
+        self.assertEqual(JSONRenderer().render(from_rows), expected)
+        self.assertEqual(JSONRenderer().render(from_instances), expected)
+    
+    def test_product_output_identical(self):
+        from .serializers import ProductSerializer
+        self.assertSameOutput(ProductSerializer, Product.objects.all(), {'request': self.request})
+        self.assertSameOutput(ProductSerializer, Product.objects.all(), {})
+    
+    def test_category_output_identical(self):
+        from .serializers import CategorySerializer
+        self.assertSameOutput(CategorySerializer, Category.objects.all(), {'request': self.request})
+    
+    def test_order_item_output_identical(self):
+        from .serializers import OrderItemSerializer
+        self.assertSameOutput(OrderItemSerializer, OrderItem.objects.all(), {'request': self.request})
+
+
+class StreamingResponseTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.admin)
+        for index in range(3):
+            Order.objects.create(
+                user=self.admin,
+                total_amount='10.00',
+                shipping_address='123 Test St',
+                city='Test City',
+                postal_code='12345',
+                country='Test Country'
+            )
+    
+    def read(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+    
+    def test_order_list_stream_matches_regular_response(self):
+        content = self.read(self.client.get('/api/orders/', {'stream': '1'}))
+        regular = self.client.get('/api/orders/')
+        self.assertEqual(json.loads(content), json.loads(regular.content))
+    
+    def test_admin_order_stream_ndjson(self):
+        response = self.client.get('/api/admin/orders/', {'stream': 'ndjson', 'fields': 'id'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        content = self.read(response)
+        lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(lines, [{'id': order.id} for order in Order.objects.order_by('-created_at')])
+    
+    def test_admin_order_export(self):
+        response = self.client.get('/api/admin/orders/export/', {'stream': 'json'})
+        self.assertIn('attachment; filename="orders.json"', response['Content-Disposition'])
+        content = self.read(response)
+        self.assertEqual(len(json.loads(content)), 3)
+
+
+class CatalogSnapshotTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        self.root = tempfile.mkdtemp()
+        self.override = override_settings(CATALOG_SNAPSHOT_ROOT=self.root)
+        self.override.enable()
+        self.category = Category.objects.create(name='Electronics')
+        Product.objects.create(
+            name='Smartphone',
+            description='Latest smartphone model',
+            price='699.99',
+            category=self.category,
+            stock=10
+        )
+    
+    def tearDown(self):
+        import shutil
+        self.override.disable()
+        shutil.rmtree(self.root)
+    
+    def test_build_snapshot(self):
+        import os
+        from .catalog import build_snapshot
+        manifest = build_snapshot()
+        path = os.path.join(self.root, f"catalog.{manifest['version']}.json")
+        with open(path) as f:
+            snapshot = json.load(f)
+        self.assertEqual([p['name'] for p in snapshot['products']], ['Smartphone'])
+        self.assertTrue(os.path.exists(path + '.gz'))
+        # Unchanged catalogs keep their version
+        self.assertEqual(build_snapshot()['version'], manifest['version'])
+    
+    def test_manifest_and_immutable_serving(self):
+        from django.test import Client
+        from .catalog import build_snapshot
+        self.assertEqual(self.client.get('/api/catalog/manifest/').status_code, 404)
+        manifest = build_snapshot()
+        response = self.client.get('/api/catalog/manifest/')
+        self.assertEqual(response.json()['version'], manifest['version'])
+        response = Client().get(manifest['url'], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+    
+    def test_changes_queue_debounced_rebuild(self):
+        from .models import Job
+        for name in ('Tablet', 'Laptop'):
+            Product.objects.create(
+                name=name,
+                description=name,
+                price='199.99',
+                category=self.category
+            )
+        jobs = Job.objects.filter(name='catalog.build_snapshot', status='queued')
+        self.assertEqual(jobs.count(), 1)
+        self.assertGreater(jobs.get().run_at, timezone.now())
+    
+    def test_debounce_stops_at_max_delay(self):
+        from datetime import timedelta
+        from unittest import mock
+        from .jobs import enqueue
+        from .models import Job
+        start = timezone.now()
+        with mock.patch('api.jobs.timezone.now', return_value=start):
+            job = enqueue('catalog.build_snapshot', delay=30, unique_key='snap', debounce=True, max_delay=300)
+        Job.objects.filter(pk=job.pk).update(created_at=start)
+        for seconds in (100, 260, 290):
+            with mock.patch('api.jobs.timezone.now', return_value=start + timedelta(seconds=seconds)):
+                self.assertIsNone(enqueue('catalog.build_snapshot', {'n': seconds}, 30, 'snap', debounce=True, max_delay=300))
+        job.refresh_from_db()
+        self.assertEqual(job.run_at, start + timedelta(seconds=290))
+        self.assertEqual(job.payload, {'n': 290})
+
+
+class ProductFacetTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.client = APIClient()
+        self.electronics = Category.objects.create(name='Electronics')
+        self.books = Category.objects.create(name='Books')
+        for name, price, stock, discount, category in [
+            ('Smartphone', '699.99', 10, 10, self.electronics),
+            ('Headphones', '49.99', 0, 0, self.electronics),
+            ('Novel', '12.00', 5, 30, self.books),
+        ]:
+            Product.objects.create(
+                name=name,
+                description=name,
+                price=price,
+                stock=stock,
+                discount_percent=discount,
+                category=category
+            )
+    
+    def test_facet_counts(self):
+        with self.assertNumQueries(2):
+            facets = self.client.get('/api/products/facets/').data
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(
+            [(c['name'], c['count']) for c in facets['categories']],
+            [('Books', 1), ('Electronics', 2)]
+        )
+        self.assertEqual(facets['availability'], {'in_stock': 2, 'out_of_stock': 1})
+        self.assertEqual([r['count'] for r in facets['price_ranges']], [1, 1, 0, 0, 0, 1, 0])
+        self.assertEqual([r['count'] for r in facets['discounts']], [1, 0, 1, 1, 0])
+    
+    def test_facets_follow_filters_and_cache(self):
+        facets = self.client.get('/api/products/facets/', {'in_stock': 'true', 'max_price': '100'}).data
+        self.assertEqual(facets['total'], 1)
+        # Cached until the catalog changes
+        with self.assertNumQueries(1):
+            self.client.get('/api/products/facets/', {'in_stock': 'true', 'max_price': '100'})
+        Product.objects.filter(name='Smartphone').get().save()
+        with self.assertNumQueries(2):
+            self.client.get('/api/products/facets/', {'in_stock': 'true', 'max_price': '100'})
+    
+    def test_price_and_stock_filters(self):
+        response = self.client.get('/api/products/', {'min_price': '20', 'in_stock': 'false'})
+        self.assertEqual([p['name'] for p in response.data['results']], ['Headphones'])
+        response = self.client.get('/api/products/', {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/products/', {'in_stock': '1'})
+        self.assertEqual(sorted(p['name'] for p in response.data['results']), sorted(
+            Product.objects.filter(stock__gt=0).values_list('name', flat=True)
+        ))
+        self.assertNotIn('Headphones', [p['name'] for p in response.data['results']])
+        self.assertEqual(self.client.get('/api/products/', {'in_stock': 'yes'}).status_code, 400)
+
+
+class ProductEffectivePriceTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Electronics')
+        for name, price, discount in [('Laptop', '1000.00', 50), ('Phone', '600.00', 0), ('Watch', '250.00', 10)]:
+            Product.objects.create(
+                name=name,
+                description=name,
+                price=price,
+                discount_percent=discount,
+                category=self.category
+            )
+    
+    def test_effective_price_maintained_on_save(self):
+        product = Product.objects.get(name='Watch')
+        self.assertEqual(product.effective_price, Decimal('225.00'))
+        product.discount_percent = 20
+        product.save(update_fields=['discount_percent'])
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, Decimal('200.00'))
+    
+    def test_sort_by_discounted_price(self):
+        response = self.client.get('/api/products/', {'ordering': '-discounted_price'})
+        self.assertEqual([p['name'] for p in response.data['results']], ['Phone', 'Laptop', 'Watch'])
+        self.assertNotIn('effective_price', response.data['results'][0])
+    
+    def test_sort_uses_index(self):
+        plan = Product.objects.order_by('effective_price').explain()
+        self.assertIn('effective_price', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_unsupported_ordering_rejected(self):
+        response = self.client.get('/api/products/', {'ordering': 'description'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductSalesCounterTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Electronics')
+        self.phone = Product.objects.create(
+            name='Smartphone', description='Phone', price='500.00', category=self.category, stock=10
+        )
+        self.cable = Product.objects.create(
+            name='Cable', description='Cable', price='10.00', category=self.category, stock=10
+        )
+        self.order = self.create_order([(self.phone, 1), (self.cable, 3)])
+    
+    def create_order(self, lines):
+        order = Order.objects.create(
+            user=self.user,
+            total_amount=sum(product.price * quantity for product, quantity in lines),
+            shipping_address='123 Test St',
+            city='Test City',
+            postal_code='12345',
+            country='Test Country'
+        )
+        for product, quantity in lines:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        return order
+    
+    def run_jobs(self):
+        from .jobs import Worker
+        Worker().run_once()
+    
+    def sales(self, product):
+        from .models import ProductSales
+        return ProductSales.objects.get(product=product)
+    
+    def test_payment_records_and_cancel_reverses(self):
+        self.client.post(f'/api/orders/{self.order.id}/payment/')
+        self.client.post(f'/api/orders/{self.order.id}/payment/')
+        self.run_jobs()
+        sales = self.sales(self.cable)
+        self.assertEqual((sales.units_sold, sales.units_7d, sales.revenue), (3, 3, Decimal('30.00')))
+        
+        self.client.post(f'/api/admin/orders/{self.order.id}/update_status/', {'status': 'cancelled'})
+        self.run_jobs()
+        sales = self.sales(self.cable)
+        self.assertEqual((sales.units_sold, sales.units_30d, sales.revenue), (0, 0, Decimal('0.00')))
+    
+    def test_best_sellers(self):
+        self.client.post(f'/api/orders/{self.order.id}/payment/')
+        self.run_jobs()
+        response = self.client.get('/api/products/best-sellers/', {'window': '7d'})
+        self.assertEqual(
+            [(p['name'], p['units_sold']) for p in response.data],
+            [('Cable', 3), ('Smartphone', 1)]
+        )
+        response = self.client.get('/api/products/best-sellers/', {'window': '1y'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_windows_roll_over_in_the_worker(self):
+        from django.core.cache import cache
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .sales import ensure_sales_windows
+        cache.delete('sales:windows_date')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/products/best-sellers/', {'window': '7d'})
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+        ensure_sales_windows()
+        self.assertEqual(cache.get('sales:windows_date'), timezone.localdate().isoformat())
+    
+    def test_sales_report_top_products(self):
+        self.client.post(f'/api/orders/{self.order.id}/payment/')
+        self.run_jobs()
+        response = self.client.get('/api/admin/sales-report/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['top_products'][0]['product__name'], 'Cable')
+        self.assertEqual(response.data['top_products'][0]['total_quantity'], 3)
+    
+    def test_rebuild_matches_incremental(self):
+        from .sales import rebuild_sales_counters
+        self.client.post(f'/api/orders/{self.order.id}/payment/')
+        self.run_jobs()
+        rebuild_sales_counters()
+        sales = self.sales(self.phone)
+        self.assertEqual((sales.units_sold, sales.units_7d, sales.revenue_30d), (1, 1, Decimal('500.00')))
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        from .jobs import task
+        self.calls = []
+        
+        @task('tests.record')
+        def record(value):
+            self.calls.append(value)
+        
+        @task('tests.flaky', max_attempts=2)
+        def flaky():
+            raise ValueError('boom')
+    
+    def test_enqueue_and_run(self):
+        from .jobs import Worker, enqueue
+        from .models import Job
+        enqueue('tests.record', {'value': 1})
+        enqueue('tests.record', {'value': 2}, delay=60)
+        self.assertEqual(Worker().run_once(), 1)
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(Job.objects.filter(status='done').count(), 1)
+        self.assertEqual(Job.objects.filter(status='queued').count(), 1)
+    
+    def test_unique_key_collapses_duplicates(self):
+        from .jobs import enqueue
+        from .models import Job
+        self.assertIsNotNone(enqueue('tests.record', {'value': 1}, unique_key='k'))
+        self.assertIsNone(enqueue('tests.record', {'value': 2}, unique_key='k'))
+        self.assertEqual(Job.objects.get().payload, {'value': 1})
+    
+    def test_claim_is_exclusive(self):
+        from .jobs import claim_jobs, enqueue
+        for value in range(3):
+            enqueue('tests.record', {'value': value})
+        first = claim_jobs('worker-a', limit=2)
+        second = claim_jobs('worker-b', limit=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({job.id for job in first} & {job.id for job in second})
+    
+    def test_failures_retry_with_backoff_then_fail(self):
+        from .jobs import Worker, enqueue
+        from .models import Job
+        job = enqueue('tests.flaky')
+        Worker().run_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('boom', job.last_error)
+        
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        Worker().run_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+
+class IdempotencyKeyTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Electronics')
+        self.product = Product.objects.create(
+            name='Smartphone', description='Phone', price='500.00', category=self.category, stock=10
+        )
+        self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 1}, format='json')
+    
+    def create_order(self, key, **data):
+        data.setdefault('shipping_address', '123 Test St')
+        return self.client.post('/api/orders/create/', data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+    
+    def test_retry_replays_first_response(self):
+        first = self.create_order('checkout-1')
+        retry = self.create_order('checkout-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+    
+    def test_key_reused_for_other_request(self):
+        self.create_order('checkout-1')
+        response = self.create_order('checkout-1', shipping_address='Elsewhere')
+        self.assertEqual(response.status_code, 422)
+    
+    def test_in_flight_duplicate_times_out_with_conflict(self):
+        from datetime import timedelta
+        from .models import IdempotencyKey
+        from .idempotency import fingerprint
+        from rest_framework.test import APIRequestFactory
+        from rest_framework.request import Request
+        from rest_framework.parsers import JSONParser
+        request = Request(
+            APIRequestFactory().post('/api/orders/create/', {'shipping_address': '123 Test St'}, format='json'),
+            parsers=[JSONParser()]
+        )
+        IdempotencyKey.objects.create(
+            user=self.user,
+            key='checkout-1',
+            fingerprint=fingerprint(request),
+            expires_at=timezone.now() + timedelta(hours=1)
+        )
+        with self.settings(IDEMPOTENCY_WAIT_TIMEOUT=0):
+            response = self.client.post(
+                '/api/orders/create/', {'shipping_address': '123 Test St'},
+                format='json', HTTP_IDEMPOTENCY_KEY='checkout-1'
+            )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.count(), 0)
+    
+    def test_sweep_removes_expired_keys(self):
+        from .models import IdempotencyKey
+        from .idempotency import sweep_idempotency_keys
+        self.create_order('checkout-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        sweep_idempotency_keys()
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class SharedThrottleTest(TestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        from django.conf import settings
+        from django.test import override_settings
+        from rest_framework.test import APIClient
+        self.root = tempfile.mkdtemp()
+        rest_framework = dict(settings.REST_FRAMEWORK)
+        rest_framework['DEFAULT_THROTTLE_RATES'] = {'anon': '100/min', 'login': '3/min', 'search': '2/min'}
+        self.override = override_settings(
+            THROTTLE_STORE=os.path.join(self.root, 'throttle.sqlite3'),
+            REST_FRAMEWORK=rest_framework
+        )
+        self.override.enable()
+        self.client = APIClient()
+    
+    def tearDown(self):
+        import shutil
+        self.override.disable()
+        shutil.rmtree(self.root)
+    
+    def test_login_sliding_window(self):
+        for _ in range(3):
+            response = self.client.post('/api/auth/login/', {'username': 'x', 'password': 'y'})
+            self.assertNotEqual(response.status_code, 429)
+        response = self.client.post('/api/auth/login/', {'username': 'x', 'password': 'y'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+    
+    def test_forwarded_for_is_not_trusted_by_default(self):
+        for index in range(3):
+            self.client.post('/api/auth/login/', {'username': 'x', 'password': 'y'}, HTTP_X_FORWARDED_FOR=f'10.0.0.{index}')
+        response = self.client.post('/api/auth/login/', {'username': 'x', 'password': 'y'}, HTTP_X_FORWARDED_FOR='10.0.0.9')
+        self.assertEqual(response.status_code, 429)
+    
+    def test_search_throttled_separately(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/products/', {'search': 'phone'}).status_code, 200)
+        self.assertEqual(self.client.get('/api/products/', {'search': 'phone'}).status_code, 429)
+        self.assertEqual(self.client.get('/api/products/').status_code, 200)
+    
+    def test_stacked_scopes_share_one_store_call(self):
+        from unittest import mock
+        from .throttling import ThrottleStore
+        with mock.patch.object(ThrottleStore, 'check', autospec=True, side_effect=ThrottleStore.check) as check:
+            self.client.get('/api/products/', {'search': 'phone'})
+        self.assertEqual(check.call_count, 1)
+        self.assertEqual([key for _, key, _, _ in check.call_args.args[1]], ['anon:ip:127.0.0.1', 'search:ip:127.0.0.1'])
+    
+    def test_token_bucket_refills(self):
+        from unittest import mock
+        from .throttling import get_store
+        store = get_store()
+        with mock.patch('api.throttling.time.time', return_value=1000.0):
+            self.assertEqual(store.take_token('k', 2, 60), (True, 0))
+            self.assertEqual(store.take_token('k', 2, 60), (True, 0))
+            allowed, wait = store.take_token('k', 2, 60)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 30)
+        with mock.patch('api.throttling.time.time', return_value=1030.0):
+            self.assertTrue(store.take_token('k', 2, 60)[0])
+    
+    def test_store_errors_fail_open(self):
+        import sqlite3
+        from unittest import mock
+        from .throttling import ThrottleStore
+        error = sqlite3.OperationalError('database is locked')
+        with mock.patch.object(ThrottleStore, 'take_token', side_effect=error), \
+                self.assertLogs('api.throttling', 'ERROR'):
+            self.assertEqual(self.client.get('/api/products/').status_code, 200)
+
+
+class BulkAdminUpdateTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123'
+        )
+        self.client.force_authenticate(self.admin)
+        self.category = Category.objects.create(name='Electronics')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {index}', description='Product', price='100.00',
+                category=self.category, stock=5
+            )
+            for index in range(3)
+        ]
+        self.orders = [
+            Order.objects.create(
+                user=self.admin, total_amount='10.00', shipping_address='123 Test St',
+                city='Test City', postal_code='12345', country='Test Country'
+            )
+            for _ in range(2)
+        ]
+    
+    def test_bulk_order_status_and_tracking(self):
+        from datetime import timedelta
+        from .models import Job
+        ids = [order.id for order in self.orders]
+        response = self.client.post('/api/admin/orders/bulk_update/', {
+            'ids': ids + [999],
+            'status': 'shipped',
+            'tracking_number': {str(ids[0]): 'TRACK-1'},
+        }, format='json')
+        self.assertEqual(response.data, {'updated': ids, 'not_found': [999]})
+        first, second = Order.objects.order_by('id')
+        self.assertEqual((first.status, first.tracking_number), ('shipped', 'TRACK-1'))
+        self.assertEqual((second.status, second.tracking_number), ('shipped', ''))
+        self.assertIsNotNone(first.shipped_date)
+        self.assertEqual(first.estimated_delivery_date, first.shipped_date + timedelta(days=5))
+        self.assertEqual(Job.objects.filter(name='sales.sync_orders').count(), 1)
+    
+    def test_bulk_product_restock_and_discount_by_filter(self):
+        from .catalog import catalog_version
+        version = catalog_version()
+        response = self.client.post('/api/admin/products/bulk_update/', {
+            'filter': {'category': self.category.id},
+            'stock_delta': 10,
+            'discount_percent': {str(self.products[0].id): 25},
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['updated']), 3)
+        first = Product.objects.get(pk=self.products[0].id)
+        other = Product.objects.get(pk=self.products[1].id)
+        self.assertEqual((first.stock, first.discount_percent, first.effective_price), (15, 25, Decimal('75.00')))
+        self.assertEqual((other.stock, other.discount_percent, other.effective_price), (15, 0, Decimal('100.00')))
+        self.assertEqual(catalog_version(), version + 1)
+    
+    def test_bulk_rejects_invalid_input(self):
+        response = self.client.post('/api/admin/products/bulk_update/', {
+            'ids': [self.products[0].id], 'discount_percent': 150,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/admin/orders/bulk_update/', {
+            'filter': {'user__password': 'x'}, 'status': 'shipped',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderSearchTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123'
+        )
+        self.client.force_authenticate(self.admin)
+        self.alice = User.objects.create_user(username='alice', email='Alice@Example.com', password='x')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.org', password='x')
+        self.alice_order = self.create_order(self.alice, tracking_number='1Z999')
+        self.bob_order = self.create_order(self.bob, tracking_number='4242')
+    
+    def create_order(self, user, **fields):
+        return Order.objects.create(
+            user=user, total_amount='10.00', shipping_address='123 Test St',
+            city='Test City', postal_code='12345', country='Test Country', **fields
+        )
+    
+    def search(self, term):
+        response = self.client.get('/api/admin/orders/', {'search': term})
+        return {order['id'] for order in response.data['results']}
+    
+    def test_search_plans(self):
+        self.assertEqual(self.search(str(self.alice_order.id)), {self.alice_order.id})
+        self.assertEqual(self.search('4242'), {self.bob_order.id})
+        self.assertEqual(self.search('alice@example.com'), {self.alice_order.id})
+        self.assertEqual(self.search('bob@ex'), {self.bob_order.id})
+        self.assertEqual(self.search('Ali'), {self.alice_order.id})
+        self.assertEqual(self.search('1z9'), {self.alice_order.id})
+        self.assertEqual(self.search('nobody'), set())
+    
+    def test_terms_follow_order_and_user_changes(self):
+        self.alice_order.payment_transaction_id = 'txn_abc'
+        self.alice_order.save()
+        self.alice.email = 'alice@new.example'
+        self.alice.save()
+        self.assertEqual(self.search('txn_ab'), {self.alice_order.id})
+        self.assertEqual(self.search('alice@new.example'), {self.alice_order.id})
+        self.assertEqual(self.search('alice@example.com'), set())
+    
+    def test_bulk_tracking_update_is_searchable(self):
+        self.client.post('/api/admin/orders/bulk_update/', {
+            'ids': [self.bob_order.id], 'tracking_number': 'BULK-77',
+        }, format='json')
+        self.assertEqual(self.search('bulk-7'), {self.bob_order.id})
+
+
+class UserSearchTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123'
+        )
+        self.client.force_authenticate(self.admin)
+        self.smith = User.objects.create_user(
+            username='jsmith', email='john@example.com', first_name='John', last_name='Smith'
+        )
+        self.smithers = User.objects.create_user(
+            username='smithers', email='waylon@example.com', first_name='Waylon', last_name='Smithers'
+        )
+        self.goldsmith = User.objects.create_user(
+            username='oliver', email='oliver@example.com', first_name='Oliver', last_name='Goldsmith'
+        )
+    
+    def search(self, term):
+        response = self.client.get('/api/admin/users/', {'search': term})
+        return [user['username'] for user in response.data['results']]
+    
+    def test_ranked_exact_prefix_substring(self):
+        self.assertEqual(self.search('Smith'), ['jsmith', 'smithers', 'oliver'])
+        self.assertEqual(self.search('oldsm'), ['oliver'])
+        self.assertEqual(self.search('zz'), [])
+    
+    def test_index_follows_user_changes(self):
+        self.goldsmith.last_name = 'Twist'
+        self.goldsmith.save()
+        self.assertEqual(self.search('smith'), ['jsmith', 'smithers'])
+        self.assertEqual(self.search('wis'), ['oliver'])
+    
+    def test_substring_match_after_false_candidates(self):
+        from unittest import mock
+        # Every trigram of "annex", but never the word itself, and all before the real match
+        User.objects.bulk_create([User(username=f'ann_nne_nex_{index}') for index in range(250)])
+        from .search import index_user
+        for user in User.objects.filter(username__startswith='ann_nne_nex_'):
+            index_user(user)
+        User.objects.create_user(username='bob_annex')
+        with mock.patch('api.search.USER_SEARCH_CHUNK', 40):
+            self.assertEqual(self.search('annex'), ['bob_annex'])
+        self.assertNotIn('Search-Partial', self.client.get('/api/admin/users/', {'search': 'annex'}))
+        with mock.patch('api.search.USER_SEARCH_CHUNK', 40), mock.patch('api.search.USER_SEARCH_SCAN_BUDGET', 100):
+            response = self.client.get('/api/admin/users/', {'search': 'annex'})
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response['Search-Partial'], 'true')
+
+
+class OrderEventStreamTest(TestCase):
+    def setUp(self):
+        from rest_framework.authtoken.models import Token
+        self.user = User.objects.create_user(username='streamer', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.order = Order.objects.create(
+            user=self.user, total_amount='10.00', shipping_address='123 Test St',
+            city='Test City', postal_code='12345', country='Test Country'
+        )
+    
+    def events(self):
+        from .models import OrderEvent
+        return [event.data['status'] for event in OrderEvent.objects.filter(order=self.order).order_by('id')]
+    
+    def test_changes_are_recorded(self):
+        self.order.save()
+        self.order.status = 'processing'
+        self.order.save()
+        from .bulk import bulk_update_orders
+        bulk_update_orders([self.order.id], {'status': 'shipped'})
+        self.assertEqual(self.events(), ['pending', 'processing', 'shipped'])
+    
+    def test_requires_authentication(self):
+        response = self.client.get('/api/orders/events/')
+        self.assertEqual(response.status_code, 401)
+    
+    async def test_replay_and_live_events(self):
+        import asyncio
+        from asgiref.sync import sync_to_async
+        from .events import order_events
+        from .models import OrderEvent
+        first = await OrderEvent.objects.filter(order=self.order).afirst()
+        self.order.status = 'processing'
+        await sync_to_async(self.order.save)()
+        
+        response = await self.async_client.get(
+            '/api/orders/events/', {'token': self.token.key}, headers={'Last-Event-ID': str(first.id)}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        replayed = await anext(stream)
+        self.assertIn(b'"status": "processing"', replayed)
+        
+        await asyncio.sleep(0.05)
+        self.order.status = 'shipped'
+        await sync_to_async(self.order.save)()
+        order_events.notify()
+        live = await asyncio.wait_for(anext(stream), 5)
+        self.assertIn(b'"status": "shipped"', live)
+        await stream.aclose()
+    
+    async def test_stream_ends_after_max_age(self):
+        from django.test import override_settings
+        from .events import order_events
+        with override_settings(EVENT_STREAM_MAX_AGE=0.1, EVENT_STREAM_HEARTBEAT=0.05):
+            response = await self.async_client.get('/api/orders/events/', {'token': self.token.key})
+            messages = [message async for message in response.streaming_content]
+        self.assertTrue(messages[0].startswith(b'retry:'))
+        self.assertNotIn(self.user.pk, order_events.subscribers)
+
+
+class DashboardStreamTest(TestCase):
+    def setUp(self):
+        from rest_framework.authtoken.models import Token
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123'
+        )
+        self.token = Token.objects.create(user=self.admin)
+        self.category = Category.objects.create(name='Gear')
+    
+    def events(self):
+        from .models import DashboardEvent
+        return [event.data for event in DashboardEvent.objects.order_by('id')]
+    
+    def test_changes_become_deltas(self):
+        from .bulk import bulk_update_orders
+        from .models import DashboardEvent
+        DashboardEvent.objects.all().delete()
+        customer = User.objects.create_user(username='customer', password='x')
+        product = Product.objects.create(name='Rope', price='20.00', category=self.category, stock=20)
+        product.stock = 5
+        product.save()
+        product.save()
+        order = Order.objects.create(
+            user=customer, total_amount='30.00', shipping_address='123 Test St',
+            city='Test City', postal_code='12345', country='Test Country'
+        )
+        order.payment_status = 'completed'
+        order.save()
+        bulk_update_orders([order.id], {'status': 'shipped'})
+        
+        user_event, created, restocked, new_order, paid, shipped = self.events()
+        self.assertEqual(user_event['deltas'], {'total_users': 1})
+        self.assertEqual(created['deltas'], {'total_products': 1})
+        self.assertEqual(restocked['deltas'], {'low_stock_products': 1})
+        self.assertEqual(restocked['low_stock'], [{'id': product.id, 'name': 'Rope', 'stock': 5}])
+        self.assertEqual(new_order['new_order']['id'], order.id)
+        self.assertEqual(new_order['deltas'], {'total_orders': 1, 'total_revenue': '30.00', 'pending_orders': 1})
+        self.assertEqual(paid['deltas'], {'paid_revenue': '30.00'})
+        self.assertEqual(shipped, {'kind': 'orders', 'deltas': {'pending_orders': -1}})
+    
+    def test_stream_is_admin_only(self):
+        User.objects.create_user(username='customer', password='x')
+        from rest_framework.authtoken.models import Token
+        token = Token.objects.create(user=User.objects.get(username='customer'))
+        response = self.client.get('/api/admin/stats/events/', {'token': token.key})
+        self.assertEqual(response.status_code, 403)
+    
+    async def test_stream_resumes_from_stats(self):
+        import asyncio
+        from asgiref.sync import sync_to_async
+        from .dashboard import dashboard_events
+        response = await self.async_client.get(
+            '/api/admin/stats/', headers={'Authorization': f'Token {self.token.key}'}
+        )
+        last_event_id = json.loads(response.content)['last_event_id']
+        await sync_to_async(Product.objects.create)(name='Rope', price='20.00', category=self.category, stock=2)
+        
+        response = await self.async_client.get(
+            '/api/admin/stats/events/', {'token': self.token.key, 'last_event_id': last_event_id}
+        )
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+        self.assertIn(b'"low_stock_products": 1', await anext(stream))
+        
+        await asyncio.sleep(0.05)
+        await sync_to_async(User.objects.create_user)(username='late', password='x')
+        dashboard_events.notify()
+        self.assertIn(b'"total_users": 1', await asyncio.wait_for(anext(stream), 5))
+        await stream.aclose()
+    
+    async def test_pump_stops_with_last_subscriber(self):
+        import asyncio
+        from .dashboard import dashboard_events, replay_dashboard_events, DASHBOARD_KEY
+        from .events import event_stream
+        stream = event_stream(dashboard_events, DASHBOARD_KEY, replay_dashboard_events)
+        await anext(stream)
+        pump = dashboard_events.pump_task
+        self.assertFalse(pump.done())
+        await stream.aclose()
+        await asyncio.wait([pump], timeout=5)
+        self.assertTrue(pump.cancelled())
+        self.assertIsNone(dashboard_events.pump_task)
+
+
+class RelatedProductsTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import override_settings
+        cache.clear()
+        self.override = override_settings(RELATED_PRODUCTS_DELAY=0)
+        self.override.enable()
+        self.user = User.objects.create_user(username='shopper', password='testpass123')
+        category = Category.objects.create(name='Climbing')
+        self.rope, self.harness, self.chalk, self.tent = [
+            Product.objects.create(name=name, price='10.00', category=category, stock=50)
+            for name in ('Rope', 'Harness', 'Chalk', 'Tent')
+        ]
+        self.buy([self.rope, self.harness])
+        self.buy([self.rope, self.harness, self.chalk])
+        self.buy([self.rope, self.chalk])
+        self.buy([self.rope, self.tent], payment_status='pending')
+        self.run_jobs()
+    
+    def tearDown(self):
+        self.override.disable()
+    
+    def buy(self, products, payment_status='completed'):
+        order = Order.objects.create(
+            user=self.user, total_amount='10.00', shipping_address='123 Test St',
+            city='Test City', postal_code='12345', country='Test Country'
+        )
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+        order.payment_status = payment_status
+        order.save()
+        return order
+    
+    def run_jobs(self):
+        from .jobs import Worker
+        Worker().run_once()
+    
+    def related(self, product):
+        response = self.client.get(f'/api/products/{product.id}/related/')
+        return [(item['name'], item['score']) for item in response.data]
+    
+    def test_ranked_by_co_occurrence(self):
+        self.assertEqual(self.related(self.rope), [('Harness', 2), ('Chalk', 2)])
+        self.assertEqual(self.related(self.harness), [('Rope', 2), ('Chalk', 1)])
+        self.assertEqual(self.related(self.tent), [])
+        self.assertEqual(self.client.get('/api/products/999999/related/').status_code, 404)
+    
+    def test_image_urls_are_absolute(self):
+        from django.test import override_settings
+        Product.objects.filter(pk=self.harness.pk).update(image='products/harness.jpg')
+        for _ in range(2):
+            response = self.client.get(f'/api/products/{self.rope.id}/related/')
+            self.assertEqual(response.data[0]['image'], 'http://testserver/media/products/harness.jpg')
+        with override_settings(ALLOWED_HOSTS=['shop.example.com']):
+            response = self.client.get(f'/api/products/{self.rope.id}/related/', HTTP_HOST='shop.example.com')
+        self.assertEqual(response.data[0]['image'], 'http://shop.example.com/media/products/harness.jpg')
+    
+    def test_new_orders_are_added_incrementally(self):
+        self.assertEqual(self.related(self.chalk), [('Rope', 2), ('Harness', 1)])
+        self.buy([self.harness, self.chalk])
+        self.run_jobs()
+        self.assertEqual(self.related(self.chalk), [('Rope', 2), ('Harness', 2)])
+        self.assertEqual(self.related(self.rope), [('Harness', 2), ('Chalk', 2)])
+        
+        from .related import rebuild_related_products
+        rebuild_related_products()
+        self.assertEqual(self.related(self.chalk), [('Rope', 2), ('Harness', 2)])
+
+
+class ProductTableTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from .pricing import product_table
+        self.table = product_table
+        self.table.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Camping')
+        self.stove = Product.objects.create(
+            name='Stove', description='x' * 1000, price='40.00', category=category, stock=5, discount_percent=25
+        )
+        self.fuel = Product.objects.create(name='Fuel', price='4.99', category=category, stock=50)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.stove, quantity=1)
+        CartItem.objects.create(cart=cart, product=self.fuel, quantity=3)
+    
+    def test_matches_product_fields(self):
+        for product in (self.stove, self.fuel):
+            record = self.table.get(product.id)
+            self.assertEqual(record.discounted_price, product.discounted_price)
+            self.assertEqual(record.stock, product.stock)
+        self.assertIsNone(self.table.get(999999))
+    
+    def test_picks_up_changes(self):
+        self.assertEqual(self.table.get(self.fuel.id).price, Decimal('4.99'))
+        self.fuel.price = '5.49'
+        self.fuel.save()
+        self.assertEqual(self.table.get(self.fuel.id).price, Decimal('5.49'))
+        
+        # Written by another process: found through Product.updated_at once the check interval passes
+        Product.objects.filter(pk=self.fuel.pk).update(stock=7, updated_at=timezone.now())
+        self.table.expire()
+        self.assertEqual(self.table.get(self.fuel.id).stock, 7)
+    
+    def test_cart_and_checkout_pricing(self):
+        response = self.client.get('/api/cart/')
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('44.97'))
+        self.assertEqual([Decimal(item['subtotal']) for item in response.data['items']], [Decimal('30.00'), Decimal('14.97')])
+        
+        response = self.client.post('/api/orders/create/', {'shipping_address': '1 Trail'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data['total_amount']), Decimal('44.97'))
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(
+            sorted(order.items.values_list('product_id', 'price')),
+            [(self.stove.id, Decimal('30.00')), (self.fuel.id, Decimal('4.99'))]
+        )
+
+
+class RequestProfilerTest(TestCase):
+    def setUp(self):
+        from rest_framework.authtoken.models import Token
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123'
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.admin).key}')
+        category = Category.objects.create(name='Tools')
+        for index in range(3):
+            Product.objects.create(name=f'Tool {index}', price='5.00', category=category, stock=3)
+    
+    def test_cprofile(self):
+        from .models import RequestProfile
+        response = self.client.get('/api/products/', {'_profile': 'cprofile'})
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((profile.mode, profile.path, profile.user), ('cprofile', '/api/products/?_profile=cprofile', self.admin))
+        self.assertIn('Ordered by: cumulative', profile.report)
+        self.assertGreater(profile.sql_count, 0)
+        self.assertEqual(len(profile.queries), profile.sql_count)
+        self.assertGreater(profile.serializer_ms, 0)
+    
+    def test_sampling_and_ring_buffer(self):
+        from django.test import override_settings
+        from .models import RequestProfile
+        with override_settings(PROFILE_KEEP=2):
+            ids = [self.client.get('/api/products/', HTTP_X_PROFILE='sample')['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(list(RequestProfile.objects.values_list('id', flat=True)), [int(pk) for pk in ids[:0:-1]])
+        self.assertIn('samples every', RequestProfile.objects.first().report)
+        
+        response = self.client.get('/api/admin/profiles/', {'fields': 'id,path,duration_ms'})
+        self.assertEqual([profile['id'] for profile in response.data['results']], [int(pk) for pk in ids[:0:-1]])
+    
+    def test_ignored_for_customers(self):
+        from .models import RequestProfile
+        self.client.credentials()
+        self.client.force_authenticate(User.objects.create_user(username='customer', password='x'))
+        response = self.client.get('/api/products/', {'_profile': 'cprofile'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.root = tempfile.mkdtemp()
+        self.override = override_settings(METRICS_DIR=self.root, METRICS_TOKEN='')
+        self.override.enable()
+        category = Category.objects.create(name='Lamps')
+        self.product = Product.objects.create(name='Lamp', price='15.00', category=category, stock=4)
+        self.user = User.objects.create_user(username='customer', password='x')
+    
+    def tearDown(self):
+        import shutil
+        self.override.disable()
+        shutil.rmtree(self.root)
+    
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+    
+    def test_request_and_checkout_metrics(self):
+        self.client.get('/api/products/')
+        self.client.get('/api/products/')
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post('/api/orders/create/').status_code, 404)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        self.assertEqual(self.client.post('/api/orders/create/').status_code, 201)
+        text = self.scrape()
+        
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="product-list",method="GET",le="+Inf"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{view="product-list",method="GET"} 2', text)
+        self.assertIn('http_responses_total{view="product-list",method="GET",status="200"} 2', text)
+        self.assertIn('db_queries_per_request_count{view="product-list"} 2', text)
+        self.assertIn('checkouts_total{step="order",result="failure"} 1', text)
+        self.assertIn('checkouts_total{step="order",result="success"} 1', text)
+        self.assertRegex(text, r'db_query_duration_seconds_count \d+')
+    
+    def test_buckets_are_cumulative_across_processes(self):
+        import os
+        from .metrics import MmapValues, Histogram, REGISTRY, process_values
+        histogram = Histogram('test_latency_seconds', 'Test', ('view',), buckets=(0.1, 1))
+        try:
+            histogram.observe(0.05, 'home')
+            # A second worker's file in the shared directory
+            other = MmapValues(os.path.join(self.root, 'other.db'))
+            buckets, sum_key, count_key = histogram.keys[('home',)]
+            for key, amount in ((buckets[1], 1), (sum_key, 0.5), (count_key, 1)):
+                other.add(key, amount)
+            other.close()
+            # Reopening a file keeps its values
+            reopened = MmapValues(os.path.join(self.root, 'other.db'))
+            self.assertEqual(reopened.indexes.keys(), {buckets[1], sum_key, count_key})
+            reopened.close()
+            self.assertEqual(os.path.dirname(process_values().path), self.root)
+            text = self.scrape()
+        finally:
+            del REGISTRY['test_latency_seconds']
+        self.assertIn('test_latency_seconds_bucket{view="home",le="0.1"} 1\n', text)
+        self.assertIn('test_latency_seconds_bucket{view="home",le="1.0"} 2\n', text)
+        self.assertIn('test_latency_seconds_bucket{view="home",le="+Inf"} 2\n', text)
+        self.assertIn('test_latency_seconds_sum{view="home"} 0.55\n', text)
+        self.assertIn('test_latency_seconds_count{view="home"} 2\n', text)
+    
+    def test_cache_hits_and_token(self):
+        from django.test import override_settings
+        self.client.get('/api/products/facets/')
+        self.client.get('/api/products/facets/')
+        text = self.scrape()
+        self.assertIn('cache_requests_total{cache="facets",result="hit"} 1', text)
+        self.assertIn('cache_requests_total{cache="facets",result="miss"} 1', text)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+
+class SlowQueryLogTest(TestCase):
+    def setUp(self):
+        from django.test import override_settings
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        # Every query counts as slow
+        self.override = override_settings(SLOW_QUERY_THRESHOLD_MS=1e-9)
+        self.override.enable()
+        category = Category.objects.create(name='Rugs')
+        for index in range(3):
+            Product.objects.create(name=f'Rug {index}', price='40.00', category=category, stock=2)
+        # Leave out the queries of the setup
+        from .models import SlowQuery
+        from .slow_queries import flush
+        flush()
+        SlowQuery.objects.all().delete()
+    
+    def tearDown(self):
+        self.override.disable()
+    
+    def test_normalize(self):
+        from .slow_queries import normalize, params_shape
+        self.assertEqual(
+            normalize("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x''y'\n LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?'
+        )
+        self.assertEqual(normalize('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'), 'INSERT INTO t (a, b) VALUES (...)')
+        self.assertEqual(params_shape([1, 2, 3, 'a', None], False), 'int x3, str, NoneType')
+        self.assertEqual(params_shape([(1, 'a'), (2, 'b')], True), '2 rows of (int, str)')
+    
+    def test_records_view_and_location(self):
+        from .models import SlowQuery
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        rows = SlowQuery.objects.filter(view='product-list')
+        self.assertTrue(rows.exists())
+        self.assertTrue(all(row.location.startswith('api/') for row in rows))
+        # Storing them is not recorded in turn
+        self.assertFalse(SlowQuery.objects.filter(statement__regex=r'^(INSERT INTO|UPDATE) "api_slowquery"').exists())
+        
+        count = rows.get(statement__startswith='SELECT COUNT(*)')
+        self.client.get('/api/products/')
+        count.refresh_from_db()
+        self.assertEqual(count.count, 2)
+    
+    def test_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        self.client.get('/api/products/')
+        out = StringIO()
+        call_command('slow_queries', '--limit', '20', '--stack', stdout=out)
+        self.assertIn('1. ', out.getvalue())
+        self.assertIn('[product-list]', out.getvalue())
+
+
+class WarmUpTest(TestCase):
+    def test_warm_up(self):
+        from .fastpath import _compiled
+        from .pricing import product_table
+        from .warmup import warm_up, STEPS
+        category = Category.objects.create(name='Garden')
+        product = Product.objects.create(name='Hose', price='12.00', category=category, stock=5)
+        _compiled.clear()
+        product_table.clear()
+        with self.assertNoLogs('api.warmup', level='ERROR'):
+            timings = warm_up()
+        self.assertEqual(list(timings), [name for name, step in STEPS])
+        self.assertEqual(len(_compiled), 2)
+        self.assertIn(product.pk, product_table.ids)
+
+
+class OrderArchiveTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123'
+        )
+        self.user = User.objects.create_user(username='carol', email='carol@example.com', password='x')
+        category = Category.objects.create(name='Lamps')
+        self.product = Product.objects.create(name='Lamp', price='25.00', category=category, stock=50)
+        self.old = self.create_order(status='delivered', payment_status='completed', tracking_number='TRK-OLD')
+        self.recent = self.create_order(status='delivered', payment_status='completed')
+        self.pending = self.create_order(status='pending')
+        from .related import update_related_products
+        update_related_products()
+        # Only the first order is past the cutoff
+        Order.objects.filter(pk=self.old.pk).update(updated_at=timezone.now() - timezone.timedelta(days=400))
+    
+    def create_order(self, **fields):
+        from .sales import sync_order_sales
+        order = Order.objects.create(
+            user=self.user, total_amount='50.00', shipping_address='123 Test St',
+            city='Test City', postal_code='12345', country='Test Country', **fields
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=2, price='25.00')
+        sync_order_sales(order)
+        return order
+    
+    def stats(self):
+        self.client.force_authenticate(self.admin)
+        data = self.client.get('/api/admin/stats/').data
+        return data['total_orders'], Decimal(str(data['total_revenue']))
+    
+    def test_archive_moves_finished_orders(self):
+        from .archive import archive_orders, archive_totals
+        from .models import ArchivedOrder, OrderSearchTerm
+        before = self.stats()
+        self.assertEqual(archive_orders(days=180, batch_size=1), 1)
+        self.assertFalse(Order.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(OrderItem.objects.filter(order_id=self.old.pk).exists())
+        self.assertFalse(OrderSearchTerm.objects.filter(order_id=self.old.pk).exists())
+        archived = ArchivedOrder.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.items.get().quantity, 2)
+        self.assertEqual(archive_totals(), (1, Decimal('50.00')))
+        self.assertEqual(self.stats(), before)
+        # Nothing else is old enough
+        self.assertEqual(archive_orders(days=180, batch_size=10), 0)
+    
+    def test_unsettled_orders_stay(self):
+        from .archive import archive_orders
+        Order.objects.filter(pk=self.old.pk).update(related_recorded=False)
+        self.assertEqual(archive_orders(days=180, batch_size=10), 0)
+    
+    def test_both_tiers_are_listed_and_found(self):
+        from .archive import archive_orders
+        archive_orders(days=180, batch_size=10)
+        self.client.force_authenticate(self.user)
+        ids = [order['id'] for order in self.client.get('/api/orders/').data]
+        self.assertEqual(sorted(ids), sorted([self.old.pk, self.recent.pk, self.pending.pk]))
+        
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/admin/orders/')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['results'][-1]['id'], self.old.pk)
+        # Archived tracking numbers are matched as typed
+        search = self.client.get('/api/admin/orders/', {'search': 'TRK-O'})
+        self.assertEqual([order['id'] for order in search.data['results']], [self.old.pk])
+        detail = self.client.get(f'/api/admin/orders/{self.old.pk}/')
+        self.assertEqual(detail.status_code, 200)
+        self.assertEqual(detail.data['tracking_number'], 'TRK-OLD')
+    
+    def test_rebuilds_count_archived_orders(self):
+        from .archive import archive_orders
+        from .models import ProductSales
+        from .sales import rebuild_sales_counters
+        archive_orders(days=180, batch_size=10)
+        rebuild_sales_counters()
+        self.assertEqual(ProductSales.objects.get(product=self.product).units_sold, 4)
+    
+    def test_deleting_customer_uncounts_archive(self):
+        from .archive import archive_orders, archive_totals
+        archive_orders(days=180, batch_size=10)
+        self.user.delete()
+        self.assertEqual(archive_totals(), (0, Decimal('0.00')))
+
+
+class CartCleanupTest(TestCase):
+    def setUp(self):
+        from django.test import override_settings
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.override = override_settings(CART_CLEANUP_PAUSE=0, CART_CLEANUP_BATCH_SIZE=1)
+        self.override.enable()
+        category = Category.objects.create(name='Tea')
+        self.green = Product.objects.create(name='Green', price='8.00', category=category, stock=10)
+        self.black = Product.objects.create(name='Black', price='6.00', category=category, stock=10)
+        self.carts = {}
+        for name in ('stale', 'empty', 'fresh'):
+            user = User.objects.create_user(username=name, password='x')
+            self.carts[name] = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=self.carts['stale'], product=self.green, quantity=2)
+        CartItem.objects.create(cart=self.carts['stale'], product=self.black, quantity=1)
+        CartItem.objects.create(cart=self.carts['fresh'], product=self.green, quantity=1)
+        CartItem.objects.create(cart=self.carts['fresh'], product=self.green, quantity=3)
+        Cart.objects.filter(pk__in=[self.carts['stale'].pk, self.carts['empty'].pk]).update(
+            updated_at=timezone.now() - timezone.timedelta(days=90)
+        )
+    
+    def tearDown(self):
+        self.override.disable()
+    
+    def test_clean_up(self):
+        from .carts import clean_up_carts
+        from .models import AbandonedCartDay
+        self.assertEqual(clean_up_carts(), (2, 1))
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [self.carts['fresh'].pk])
+        self.assertEqual(list(CartItem.objects.values_list('product', 'quantity')), [(self.green.pk, 4)])
+        day = AbandonedCartDay.objects.get()
+        self.assertEqual((day.carts, day.items, day.units, day.value), (1, 2, 3, Decimal('22.00')))
+        self.assertEqual(clean_up_carts(), (0, 0))
+    
+    def test_changing_items_touches_cart(self):
+        from .carts import clean_up_carts
+        self.client.force_authenticate(self.carts['stale'].user)
+        self.client.post('/api/cart/update/', {'product_id': self.black.pk, 'quantity': 2}, format='json')
+        clean_up_carts()
+        self.assertTrue(Cart.objects.filter(pk=self.carts['stale'].pk).exists())
+    
+    def test_cart_touched_after_pick_is_kept(self):
+        from django.db import connection
+        from .carts import expire_batch
+        from .models import AbandonedCartDay
+        stale = self.carts['stale']
+        touched = []
+        
+        def touch_after_pick(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if not touched and sql.startswith('SELECT') and 'api_cart' in sql:
+                touched.append(sql)
+                Cart.objects.filter(pk=stale.pk).update(updated_at=timezone.now())
+            return result
+        
+        cutoff = timezone.now() - timezone.timedelta(days=30)
+        with connection.execute_wrapper(touch_after_pick):
+            self.assertEqual(expire_batch(cutoff, 10), (2, 1))
+        self.assertTrue(Cart.objects.filter(pk=stale.pk).exists())
+        self.assertEqual(CartItem.objects.filter(cart=stale).count(), 2)
+        self.assertFalse(Cart.objects.filter(pk=self.carts['empty'].pk).exists())
+        self.assertFalse(AbandonedCartDay.objects.exists())
+    
+    def test_admin_stats(self):
+        from .carts import clean_up_carts
+        clean_up_carts()
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='x')
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/admin/carts/abandoned/', {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['carts'], 1)
+        self.assertEqual(response.data['open_carts'], 1)
+        self.assertEqual(len(response.data['days']), 1)
+
+
+class BatchRequestTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='dana', password='x')
+        category = Category.objects.create(name='Bikes')
+        self.product = Product.objects.create(name='Bike', price='300.00', category=category, stock=3)
+    
+    def batch(self, requests, **options):
+        return self.client.post('/api/batch/', {'requests': requests, **options}, format='json')
+    
+    def test_results_in_order_with_statuses(self):
+        self.client.force_authenticate(self.user)
+        response = self.batch([
+            '/api/categories/',
+            f'/api/products/?category={self.product.category_id}&fields=id,name',
+            {'path': '/api/cart/'},
+            '/api/products/999999/',
+            '/api/orders/events/',
+            {'path': '/api/cart/add/', 'method': 'POST'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.data['responses']
+        self.assertEqual([result['status'] for result in results], [200, 200, 200, 404, 400, 405])
+        self.assertEqual(results[1]['body']['results'], [{'id': self.product.id, 'name': 'Bike'}])
+        self.assertEqual(results[2]['body']['items'], [])
+    
+    def test_permissions_apply_per_request(self):
+        response = self.batch(['/api/products/', '/api/cart/'])
+        self.assertEqual([result['status'] for result in response.data['responses']], [200, 401])
+    
+    def test_limits(self):
+        from django.test import override_settings
+        self.assertEqual(self.batch([]).status_code, 400)
+        with override_settings(BATCH_MAX_REQUESTS=2):
+            self.assertEqual(self.batch(['/api/products/'] * 3).status_code, 400)
+
+
+class ParallelBatchRequestTest(TransactionTestCase):
+    # Committed data, so the batch's own threads and connections can read it
+    def test_parallel_matches_serial(self):
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='erin', password='x'))
+        category = Category.objects.create(name='Boots')
+        for index in range(3):
+            Product.objects.create(name=f'Boot {index}', price='90.00', category=category, stock=4)
+        paths = ['/api/categories/', '/api/products/', '/api/cart/', '/api/products/facets/']
+        serial = client.post('/api/batch/', {'requests': paths}, format='json').data
+        parallel = client.post('/api/batch/', {'requests': paths, 'parallel': True}, format='json').data
+        self.assertEqual(parallel, serial)
+        self.assertEqual([result['status'] for result in parallel['responses']], [200] * 4)
+
+
+class OptimisticConcurrencyTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123'
+        )
+        self.client.force_authenticate(self.admin)
+        category = Category.objects.create(name='Kites')
+        self.product = Product.objects.create(name='Kite', price='20.00', category=category, stock=10)
+        self.order = Order.objects.create(
+            user=self.admin, total_amount='20.00', shipping_address='123 Test St',
+            city='Test City', postal_code='12345', country='Test Country'
+        )
+    
+    def test_if_match_on_stock(self):
+        url = f'/api/admin/products/{self.product.pk}/update_stock/'
+        tag = self.client.get(f'/api/admin/products/{self.product.pk}/', {'fields': 'id,stock'})['ETag']
+        response = self.client.post(url, {'stock': 7}, format='json', HTTP_IF_MATCH=tag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], tag)
+        # Another admin still holding the first ETag
+        response = self.client.post(url, {'stock': 3}, format='json', HTTP_IF_MATCH=tag)
+        self.assertEqual(response.status_code, 412)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 7)
+        self.assertEqual(self.client.post(url, {'stock_delta': -8}, format='json').status_code, 400)
+    
+    def test_stock_delta_retries_after_conflict(self):
+        from django.db.models import F
+        from .concurrency import retry_on_conflict
+        stale = Product.objects.get(pk=self.product.pk)
+        # Saved by someone else after ``stale`` was read
+        Product.objects.filter(pk=self.product.pk).update(stock=F('stock') + 5, version=F('version') + 1)
+        attempts = []
+        
+        def take_two(product):
+            attempts.append(product.stock)
+            product.stock -= 2
+            product.save(update_fields=['stock'])
+        
+        saved = retry_on_conflict(stale, take_two)
+        self.assertEqual(attempts, [10, 15])
+        self.assertEqual((saved.stock, saved.version), (13, 2))
+    
+    def test_unconditional_save_returns_the_new_version(self):
+        from django.db import connection
+        from django.db.models import F
+        from django.test.utils import CaptureQueriesContext
+        product = Product.objects.get(pk=self.product.pk)
+        Product.objects.filter(pk=product.pk).update(version=F('version') + 1)
+        product.stock = 4
+        product.save(update_fields=['stock'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(product.version, 2)
+        self.assertEqual(len(queries), 0)
+    
+    def test_updates_write_only_their_fields(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        Order.objects.filter(pk=self.order.pk).update(tracking_number='TRK-1')
+        stale.status = 'processing'
+        stale.save(update_fields=['status'])
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.tracking_number, self.order.version), ('processing', 'TRK-1', 1))
+    
+    def test_order_endpoints(self):
+        detail = f'/api/admin/orders/{self.order.pk}/'
+        tag = self.client.get(detail)['ETag']
+        response = self.client.post(f'{detail}update_status/', {'status': 'processing'}, format='json', HTTP_IF_MATCH=tag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(detail, {'tracking_number': 'X1'}, format='json', HTTP_IF_MATCH=tag)
+        self.assertEqual(response.status_code, 412)
+        response = self.client.post(
+            f'/api/orders/{self.order.pk}/shipping/', {'status': 'shipped'}, format='json', HTTP_IF_MATCH='*'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], self.client.get(detail)['ETag'])
+        # Bulk updates move the version on as well
+        self.client.post('/api/admin/orders/bulk_update/', {'ids': [self.order.pk], 'tracking_number': 'B2'}, format='json')
+        self.assertNotEqual(self.client.get(detail)['ETag'], response['ETag'])
+    
+    def test_cross_origin_clients_can_use_etags(self):
+        detail = f'/api/admin/products/{self.product.pk}/'
+        origin = 'http://localhost:3000'
+        preflight = self.client.options(
+            detail, HTTP_ORIGIN=origin, HTTP_ACCESS_CONTROL_REQUEST_METHOD='PUT',
+            HTTP_ACCESS_CONTROL_REQUEST_HEADERS='if-match'
+        )
+        self.assertIn('if-match', preflight['Access-Control-Allow-Headers'])
+        response = self.client.get(detail, HTTP_ORIGIN=origin)
+        self.assertIn('ETag', response['Access-Control-Expose-Headers'])
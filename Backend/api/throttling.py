@@ -0,0 +1,273 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS token_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    allowed INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sliding_windows (
+    key TEXT PRIMARY KEY,
+    window_id INTEGER NOT NULL,
+    current INTEGER NOT NULL,
+    previous INTEGER NOT NULL,
+    allowed INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+# Seconds of inactivity after which a client's state is dropped
+IDLE_TIMEOUT = 86400
+
+# SQLite evaluates every SET expression against the row as it was before the
+# update, so the refill, the decision and the new state come out of one
+# statement.
+TAKE_TOKEN = """
+INSERT INTO token_buckets (key, tokens, allowed, updated)
+VALUES (:key, :capacity - 1, 1, :now)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = min(:capacity, tokens + (:now - updated) * :rate)
+        - (min(:capacity, tokens + (:now - updated) * :rate) >= 1),
+    allowed = min(:capacity, tokens + (:now - updated) * :rate) >= 1,
+    updated = :now
+RETURNING allowed, tokens
+"""
+
+HIT_WINDOW = """
+INSERT INTO sliding_windows (key, window_id, current, previous, allowed, updated)
+VALUES (:key, :window, 1, 0, 1, :now)
+ON CONFLICT (key) DO UPDATE SET
+    previous = CASE window_id WHEN :window THEN previous WHEN :window - 1 THEN current ELSE 0 END,
+    current = CASE window_id WHEN :window THEN current ELSE 0 END + (
+        CASE window_id WHEN :window THEN previous WHEN :window - 1 THEN current ELSE 0 END * :weight
+        + CASE window_id WHEN :window THEN current ELSE 0 END < :limit
+    ),
+    allowed = (
+        CASE window_id WHEN :window THEN previous WHEN :window - 1 THEN current ELSE 0 END * :weight
+        + CASE window_id WHEN :window THEN current ELSE 0 END < :limit
+    ),
+    window_id = :window,
+    updated = :now
+RETURNING allowed, current, previous
+"""
+
+
+class ThrottleStore:
+    """Throttle state in a local SQLite file shared by every worker process
+
+    The file runs in WAL mode so checks from different processes do not
+    block readers, and each check is a single ``INSERT ... ON CONFLICT
+    ... RETURNING`` statement: one round trip per request.
+
+    This module is loaded through DRF's settings, possibly before the app
+    registry is ready, so it must not import models.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        # Connections are per thread and are not reused across a fork
+        pid, conn = getattr(self.local, 'conn', (None, None))
+        if pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self.local.conn = (os.getpid(), conn)
+            # Each new connection clears out clients that have gone idle
+            self.prune(IDLE_TIMEOUT)
+        return conn
+
+    def take_token(self, key, capacity, period):
+        """Token bucket: returns (allowed, seconds until the next token)"""
+        rate = capacity / period
+        allowed, tokens = self.connection().execute(TAKE_TOKEN, {
+            'key': key, 'capacity': capacity, 'rate': rate, 'now': time.time(),
+        }).fetchone()
+        return bool(allowed), (0 if allowed else (1 - tokens) / rate)
+
+    def hit_window(self, key, limit, period):
+        """Sliding window counter: returns (allowed, seconds until a slot frees up)"""
+        now = time.time()
+        window, elapsed = divmod(now, period)
+        weight = 1 - elapsed / period
+        allowed, current, previous = self.connection().execute(HIT_WINDOW, {
+            'key': key, 'window': int(window), 'weight': weight, 'limit': limit, 'now': now,
+        }).fetchone()
+        if allowed:
+            return True, 0
+        if current >= limit or not previous:
+            return False, period - elapsed
+        # Time until the previous window's share drops below what is left
+        return False, period * (1 - (limit - current) / previous) - elapsed
+
+    def check(self, checks):
+        """Apply several ``(algorithm, key, limit, period)`` checks; returns their (allowed, wait) pairs
+
+        More than one check runs in a single write transaction, so stacked
+        scopes take the file's write lock and commit once per request.
+        """
+        if len(checks) == 1:
+            return [self._apply(*checks[0])]
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            results = [self._apply(*check) for check in checks]
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return results
+
+    def _apply(self, algorithm, key, limit, period):
+        if algorithm == 'sliding_window':
+            return self.hit_window(key, limit, period)
+        return self.take_token(key, limit, period)
+
+    def prune(self, max_age):
+        cutoff = time.time() - max_age
+        conn = self.connection()
+        conn.execute('DELETE FROM token_buckets WHERE updated < ?', (cutoff,))
+        conn.execute('DELETE FROM sliding_windows WHERE updated < ?', (cutoff,))
+
+    def reset(self):
+        conn = self.connection()
+        conn.execute('DELETE FROM token_buckets')
+        conn.execute('DELETE FROM sliding_windows')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    path = settings.THROTTLE_STORE
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ThrottleStore(path)
+        return _stores[path]
+
+
+class SharedRateThrottle(SimpleRateThrottle):
+    """Base for throttles whose state lives in the shared :class:`ThrottleStore`
+
+    Rates come from ``DEFAULT_THROTTLE_RATES`` like DRF's own throttles.
+    Clients are identified by user id when authenticated and by IP address
+    otherwise. Requests are let through when the store cannot be used.
+    """
+    algorithm = 'token_bucket'
+
+    def get_rate(self):
+        # Read live so a scope without a configured rate is simply not throttled
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        return f'{self.scope}:{ident}'
+
+    def checks(self, request, view):
+        """The store checks that apply to a request: none, or this scope's"""
+        if self.rate is None:
+            return []
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return []
+        return [(self.algorithm, key, self.num_requests, self.duration)]
+
+    def allow_request(self, request, view):
+        checks = self.checks(request, view)
+        if not checks:
+            return True
+        store = get_store()
+        try:
+            results = store.check(checks)
+        except sqlite3.OperationalError:
+            # A locked or unwritable store must not take the API down with it
+            logger.exception('Throttle store %s failed; letting the request through', store.path)
+            return True
+        self.retry_after = max((wait for allowed, wait in results if not allowed), default=0)
+        return all(allowed for allowed, wait in results)
+
+    def wait(self):
+        return max(math.ceil(self.retry_after), 1)
+
+
+class AnonRateThrottle(SharedRateThrottle):
+    """Token bucket for anonymous clients, per IP address"""
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return super().get_cache_key(request, view)
+
+
+class UserRateThrottle(SharedRateThrottle):
+    """Token bucket for authenticated users, per user"""
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return None
+        return super().get_cache_key(request, view)
+
+
+class LoginRateThrottle(SharedRateThrottle):
+    """Sliding window on login attempts, per IP address"""
+    scope = 'login'
+    algorithm = 'sliding_window'
+
+    def get_cache_key(self, request, view):
+        return f'{self.scope}:ip:{self.get_ident(request)}'
+
+
+class SearchRateThrottle(SharedRateThrottle):
+    """Sliding window on product searches, per user or IP address"""
+    scope = 'search'
+    algorithm = 'sliding_window'
+
+    def get_cache_key(self, request, view):
+        if not request.query_params.get('search'):
+            return None
+        return super().get_cache_key(request, view)
+
+
+class GroupedRateThrottle(SharedRateThrottle):
+    """Several shared throttles checked with one store transaction instead of one each
+
+    Use it in place of stacking the classes in ``throttle_classes``; the
+    request is refused when any of them refuses it.
+    """
+    throttle_classes = ()
+
+    def __init__(self):
+        self.throttles = [throttle_class() for throttle_class in self.throttle_classes]
+
+    def checks(self, request, view):
+        return [check for throttle in self.throttles for check in throttle.checks(request, view)]
+
+
+class ProductSearchThrottle(GroupedRateThrottle):
+    """Product listings: the client's anon or user bucket plus the search window"""
+    throttle_classes = (AnonRateThrottle, UserRateThrottle, SearchRateThrottle)
+
+
+class LoginThrottle(GroupedRateThrottle):
+    """Login attempts: the anon bucket plus the login window"""
+    throttle_classes = (AnonRateThrottle, LoginRateThrottle)
@@ -7,12 +7,18 @@ urlpatterns = [
     path('auth/login/', views.login_view, name='login'),
     path('auth/logout/', views.logout_view, name='logout'),
     
+    # Catalog snapshot
+    path('catalog/manifest/', views.catalog_manifest, name='catalog-manifest'),
+    
     # Categories
     path('categories/', views.CategoryListView.as_view(), name='category-list'),
     
     # Products
     path('products/', views.ProductListView.as_view(), name='product-list'),
+    path('products/facets/', views.product_facets, name='product-facets'),
+    path('products/best-sellers/', views.best_sellers, name='product-best-sellers'),
     path('products/<int:pk>/', views.ProductDetailView.as_view(), name='product-detail'),
+    path('products/<int:pk>/related/', views.related_products, name='product-related'),
     
     # Cart
     path('cart/', views.cart_view, name='cart'),
@@ -23,6 +29,10 @@ urlpatterns = [
     # Orders
     path('orders/', views.order_list_view, name='order-list'),
     path('orders/create/', views.create_order, name='create-order'),
+    path('orders/events/', views.order_events_view, name='order-events'),
     path('orders/<int:order_id>/payment/', views.process_payment, name='process-payment'),
     path('orders/<int:order_id>/shipping/', views.update_shipping_status, name='update-shipping'),
+    
+    # Several GET requests in one
+    path('batch/', views.batch_view, name='batch'),
 ]
\ No newline at end of file
@@ -1,51 +1,177 @@
 from rest_framework import generics, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+import hmac
 import time
-from .models import Category, Product, Cart, CartItem, Order, OrderItem
+from .models import Category, Product, Cart, CartItem, Order, OrderItem, ProductSales, ArchivedOrder
 from .serializers import CategorySerializer, ProductSerializer, CartSerializer, CartItemSerializer, OrderSerializer, RegisterSerializer
+from .fieldsets import Fieldset, SparseFieldsetViewMixin, narrow_queryset
+from .fastpath import CompiledListMixin
+from .streaming import stream_format, streaming_response
+from .catalog import read_manifest
+from .facets import cached_facets
+from .sales import SALES_WINDOWS
+from .idempotency import idempotent
+from .metrics import CONTENT_TYPE, count_checkout, render as render_metrics
+from .related import cached_related
+from .carts import touch_cart
+from .batch import parse_items, run_batch
+from .concurrency import etag, if_match
+from .pricing import product_table
+from .events import order_events, event_stream, authenticate_stream, parse_last_event_id, replay_order_events
+from .throttling import LoginThrottle, ProductSearchThrottle
 
-class CategoryListView(generics.ListAPIView):
+class CategoryListView(SparseFieldsetViewMixin, CompiledListMixin, generics.ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
 
-class ProductListView(generics.ListAPIView):
+PRODUCT_FILTER_PARAMS = ('category', 'search', 'min_price', 'max_price', 'in_stock')
+
+# Sortable fields exposed to clients, each mapped to an indexed column
+PRODUCT_ORDERING = {
+    'price': 'price',
+    'discounted_price': 'effective_price',
+    'name': 'name',
+    'created_at': 'created_at',
+}
+
+def _decimal_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'A valid number is required.'})
+
+def filter_products(queryset, params):
+    """Apply the storefront product filters from query parameters"""
+    # Filter by category
+    category = params.get('category', None)
+    if category:
+        queryset = queryset.filter(category_id=category)
+    
+    # Search by name or description
+    search = params.get('search', None)
+    if search:
+        queryset = queryset.filter(name__icontains=search) | queryset.filter(description__icontains=search)
+    
+    # Filter by the price customers pay, after discount
+    min_price = _decimal_param(params, 'min_price')
+    if min_price is not None:
+        queryset = queryset.filter(effective_price__gte=min_price)
+    max_price = _decimal_param(params, 'max_price')
+    if max_price is not None:
+        queryset = queryset.filter(effective_price__lte=max_price)
+    
+    # Filter by availability
+    in_stock = params.get('in_stock', '').lower()
+    if in_stock in ('true', '1'):
+        queryset = queryset.filter(stock__gt=0)
+    elif in_stock in ('false', '0'):
+        queryset = queryset.filter(stock=0)
+    elif in_stock:
+        raise ValidationError({'in_stock': 'Must be true, false, 1 or 0.'})
+    
+    return queryset
+
+class ProductListView(SparseFieldsetViewMixin, CompiledListMixin, generics.ListAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [ProductSearchThrottle]
     
     def get_queryset(self):
-        queryset = Product.objects.all()
-        
-        # Filter by category
-        category = self.request.query_params.get('category', None)
-        if category:
-            queryset = queryset.filter(category_id=category)
-        
-        # Search by name or description
-        search = self.request.query_params.get('search', None)
-        if search:
-            queryset = queryset.filter(name__icontains=search) | queryset.filter(description__icontains=search)
+        queryset = filter_products(Product.objects.all(), self.request.query_params)
         
         # Ordering/Sorting
         ordering = self.request.query_params.get('ordering', None)
         if ordering:
-            queryset = queryset.order_by(ordering)
+            descending = ordering.startswith('-')
+            column = PRODUCT_ORDERING.get(ordering.lstrip('-'))
+            if column is None:
+                raise ValidationError({
+                    'ordering': 'Unsupported ordering. Choose from: %s.' % ', '.join(PRODUCT_ORDERING)
+                })
+            queryset = queryset.order_by(f'-{column}' if descending else column)
         
         return queryset
 
-class ProductDetailView(generics.RetrieveAPIView):
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@throttle_classes([ProductSearchThrottle])
+def product_facets(request):
+    """Facet counts for the product listing sidebar under the current filters"""
+    params = request.query_params
+    queryset = filter_products(Product.objects.all(), params)
+    filters = {key: params[key] for key in PRODUCT_FILTER_PARAMS if key in params}
+    return Response(cached_facets(queryset, filters))
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def best_sellers(request):
+    """Best selling products over a rolling window, served from the sales counters"""
+    window = request.query_params.get('window', '7d')
+    if window == 'all':
+        units_field = 'units_sold'
+    elif window in SALES_WINDOWS:
+        units_field = SALES_WINDOWS[window][1]
+    else:
+        raise ValidationError({'window': 'Choose from: all, %s.' % ', '.join(SALES_WINDOWS)})
+    
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+    except ValueError:
+        raise ValidationError({'limit': 'A valid integer is required.'})
+    
+    sales = ProductSales.objects.filter(**{f'{units_field}__gt': 0})
+    category = request.query_params.get('category', None)
+    if category:
+        sales = sales.filter(product__category_id=category)
+    sales = list(
+        sales.select_related('product__category').order_by(f'-{units_field}')[:limit]
+    )
+    
+    products = ProductSerializer(
+        [entry.product for entry in sales], many=True, context={'request': request}
+    ).data
+    for product, entry in zip(products, sales):
+        product['units_sold'] = getattr(entry, units_field)
+    return Response(products)
+
+class ProductDetailView(SparseFieldsetViewMixin, generics.RetrieveAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def related_products(request, pk):
+    """Products frequently bought together with this one, best first"""
+    return Response(cached_related(pk, request))
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def catalog_manifest(request):
+    """Return the current catalog snapshot version and URL"""
+    manifest = read_manifest()
+    if manifest is None:
+        return Response({'error': 'Catalog snapshot not built yet'}, status=status.HTTP_404_NOT_FOUND)
+    response = Response(manifest)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def register_view(request):
@@ -75,6 +201,7 @@ def register_view(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginThrottle])
 def login_view(request):
     print('[LOGIN DEBUG] Login request received')
     print('[LOGIN DEBUG] Request data:', request.data)
@@ -126,17 +253,20 @@ def logout_view(request):
 @permission_classes([IsAuthenticated])
 def cart_view(request):
     cart, created = Cart.objects.get_or_create(user=request.user)
-    serializer = CartSerializer(cart)
+    serializer = CartSerializer(cart, context={'fieldset': Fieldset.from_request(request)})
     return Response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def add_to_cart(request):
     product_id = request.data.get('product_id')
     quantity = request.data.get('quantity', 1)
     
     product = get_object_or_404(Product, id=product_id)
     cart, created = Cart.objects.get_or_create(user=request.user)
+    if not created:
+        touch_cart(cart)
     
     cart_item, created = CartItem.objects.get_or_create(
         cart=cart,
@@ -153,16 +283,19 @@ def add_to_cart(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def remove_from_cart(request):
     product_id = request.data.get('product_id')
     cart = get_object_or_404(Cart, user=request.user)
     cart_item = get_object_or_404(CartItem, cart=cart, product_id=product_id)
     cart_item.delete()
+    touch_cart(cart)
     
     return Response({'message': 'Item removed from cart'})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def update_cart_item(request):
     product_id = request.data.get('product_id')
     quantity = request.data.get('quantity')
@@ -174,6 +307,7 @@ def update_cart_item(request):
     cart_item = get_object_or_404(CartItem, cart=cart, product_id=product_id)
     cart_item.quantity = quantity
     cart_item.save()
+    touch_cart(cart)
     
     serializer = CartItemSerializer(cart_item)
     return Response(serializer.data)
@@ -181,22 +315,56 @@ def update_cart_item(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def order_list_view(request):
-    orders = Order.objects.filter(user=request.user)
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    context = {'fieldset': Fieldset.from_request(request)}
+    # Archived orders are older, so they come first; both tiers render the same way
+    archived, orders = (
+        narrow_queryset(model.objects.filter(user=request.user), OrderSerializer(context=context))
+        for model in (ArchivedOrder, Order)
+    )
+    
+    def serialize(chunk):
+        return OrderSerializer(chunk, many=True, context=context).data
+    
+    fmt = stream_format(request)
+    if fmt is not None:
+        return streaming_response(archived, serialize, fmt, rest=[(orders, serialize)])
+    
+    return Response(serialize(archived) + serialize(orders))
+
+async def order_events_view(request):
+    """Server-sent events for status, payment and tracking changes to the user's orders
+
+    A plain async view: under ASGI each open stream is a coroutine, not a
+    worker thread.
+    """
+    user = await authenticate_stream(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    response = StreamingHttpResponse(
+        event_stream(order_events, user.pk, replay_order_events, parse_last_event_id(request)),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
+@count_checkout('order')
 def create_order(request):
     cart = get_object_or_404(Cart, user=request.user)
     
-    if cart.items.count() == 0:
+    # Prices come from the in-memory product table, not full Product rows
+    items = list(cart.items.values_list('product_id', 'quantity'))
+    if not items:
         return Response({
             'error': 'Cart is empty'
         }, status=status.HTTP_400_BAD_REQUEST)
+    prices = product_table.get_many([product_id for product_id, quantity in items])
     
     # Calculate total amount
-    total_amount = cart.total_price
+    total_amount = sum(prices[product_id].discounted_price * quantity for product_id, quantity in items)
     
     # Create order
     order = Order.objects.create(
@@ -212,16 +380,19 @@ def create_order(request):
     )
     
     # Create order items
-    for cart_item in cart.items.all():
-        OrderItem.objects.create(
+    OrderItem.objects.bulk_create([
+        OrderItem(
             order=order,
-            product=cart_item.product,
-            quantity=cart_item.quantity,
-            price=cart_item.product.discounted_price
+            product_id=product_id,
+            quantity=quantity,
+            price=prices[product_id].discounted_price
         )
+        for product_id, quantity in items
+    ])
     
     # Clear cart
     cart.items.all().delete()
+    touch_cart(cart)
     
     serializer = OrderSerializer(order)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -229,6 +400,8 @@ def create_order(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
+@count_checkout('payment')
 def process_payment(request, order_id):
     """Process payment for an order"""
     order = get_object_or_404(Order, id=order_id, user=request.user)
@@ -255,18 +428,43 @@ def update_shipping_status(request, order_id):
     """Update shipping status and tracking information"""
     order = get_object_or_404(Order, id=order_id)
     
-    # Update shipping information
-    order.status = request.data.get('status', order.status)
-    order.tracking_number = request.data.get('tracking_number', order.tracking_number)
-    
-    if order.status == 'shipped' and not order.shipped_date:
-        order.shipped_date = timezone.now()
-    
-    # Set estimated delivery date (5 days from shipping date)
-    if order.shipped_date and not order.estimated_delivery_date:
-        order.estimated_delivery_date = order.shipped_date + timedelta(days=5)
-    
-    order.save()
+    with if_match(request, order):
+        # Update shipping information
+        order.status = request.data.get('status', order.status)
+        order.tracking_number = request.data.get('tracking_number', order.tracking_number)
+        
+        if order.status == 'shipped' and not order.shipped_date:
+            order.shipped_date = timezone.now()
+        
+        # Set estimated delivery date (5 days from shipping date)
+        if order.shipped_date and not order.estimated_delivery_date:
+            order.estimated_delivery_date = order.shipped_date + timedelta(days=5)
+        
+        order.save(update_fields=['status', 'tracking_number', 'shipped_date', 'estimated_delivery_date'])
     
     serializer = OrderSerializer(order)
-    return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+    response = Response(serializer.data, status=status.HTTP_200_OK)
+    response['ETag'] = etag(order)
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def batch_view(request):
+    """Run several GET requests in one round trip, authenticated once
+
+    Each sub-request goes through its view's own permissions and throttles.
+    """
+    try:
+        items, parallel = parse_items(request.data)
+    except ValueError as error:
+        return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'responses': run_batch(request, items, parallel)})
+
+
+def metrics_view(request):
+    """Metrics of every worker process, in the Prometheus text format"""
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
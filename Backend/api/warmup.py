@@ -0,0 +1,120 @@
+import importlib
+import logging
+import time
+from django.apps import apps
+from django.urls import URLResolver, get_resolver
+from rest_framework.serializers import ModelSerializer
+from rest_framework.settings import api_settings
+from .catalog import catalog_version, read_manifest
+from .fastpath import CompiledListMixin, compile_serializer
+from .pricing import product_table
+
+logger = logging.getLogger(__name__)
+
+# Modules a request would otherwise import the first time it needs them
+MODULES = (
+    'api.views',
+    'api.admin_views',
+    'api.bulk',
+    'api.streaming',
+    'api.events',
+    'api.dashboard',
+    'api.related',
+)
+
+# DRF settings whose classes are imported on first access
+DRF_SETTINGS = (
+    'DEFAULT_RENDERER_CLASSES',
+    'DEFAULT_PARSER_CLASSES',
+    'DEFAULT_AUTHENTICATION_CLASSES',
+    'DEFAULT_PERMISSION_CLASSES',
+    'DEFAULT_THROTTLE_CLASSES',
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+    'DEFAULT_PAGINATION_CLASS',
+    'DEFAULT_FILTER_BACKENDS',
+)
+
+
+def warm_imports():
+    for module in MODULES:
+        importlib.import_module(module)
+    for name in DRF_SETTINGS:
+        getattr(api_settings, name)
+
+
+def _patterns(resolver):
+    for pattern in resolver.url_patterns:
+        # Patterns compile their regex on first use
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            yield from _patterns(pattern)
+        else:
+            yield pattern
+
+
+def warm_url_resolver():
+    resolver = get_resolver()
+    # Builds the reverse() lookup tables as well
+    resolver.reverse_dict
+    list(_patterns(resolver))
+
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def _compiled_views(resolver):
+    for pattern in _patterns(resolver):
+        view_class = getattr(pattern.callback, 'view_class', None) or getattr(pattern.callback, 'cls', None)
+        if view_class is not None and issubclass(view_class, CompiledListMixin):
+            yield view_class
+
+
+def warm_serializers():
+    """Fill the models' field caches and the field maps of every model serializer"""
+    for model in apps.get_models():
+        model._meta.get_fields()
+        model._meta._relation_tree
+    for serializer_class in set(_subclasses(ModelSerializer)):
+        if serializer_class.__module__.startswith('api.'):
+            serializer_class(context={}).fields
+    # Compiled forms of the default field layout of each fast-path list view
+    for view_class in set(_compiled_views(get_resolver())):
+        compile_serializer(view_class.serializer_class(context={}))
+
+
+def warm_catalog():
+    catalog_version()
+    read_manifest()
+    product_table.sync()
+
+
+STEPS = (
+    ('imports', warm_imports),
+    ('url resolver', warm_url_resolver),
+    ('serializers', warm_serializers),
+    ('catalog', warm_catalog),
+)
+
+
+def warm_up():
+    """Do the work a process's first requests would otherwise pay for; returns {step: seconds}
+
+    Each step is safe to repeat: after a preloading parent has warmed up,
+    a forked worker's run only checks that its inherited caches are current.
+    """
+    timings = {}
+    for name, step in STEPS:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            # A cold cache is slower, not broken
+            logger.exception('Warm-up step %s failed', name)
+        timings[name] = time.perf_counter() - start
+    logger.info('Warmed up in %.0f ms (%s)', sum(timings.values()) * 1000, ', '.join(
+        f'{name} {seconds * 1000:.0f} ms' for name, seconds in timings.items()
+    ))
+    return timings
@@ -0,0 +1,46 @@
+"""Gunicorn settings, read automatically when gunicorn is started from this directory
+
+    gunicorn summitmarket.asgi:application
+
+The application is imported and warmed up once in the master process, so
+workers fork with Django set up, URLs compiled and the product price table
+loaded, sharing those pages with the master instead of each building them.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Event streams need the ASGI worker
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = True
+# Restart workers now and then so slow leaks cannot build up, staggered so they do not all restart at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    """Runs in the master once the preloaded app is imported, before any worker is forked"""
+    from django.db import connections
+    from api.metrics import clear_metrics_dir
+    from api.warmup import warm_up
+
+    # Files of the previous server's workers
+    clear_metrics_dir()
+    warm_up()
+    # Forked workers must open their own database connections
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    """Runs in each worker once the app is loaded, before it accepts requests
+
+    After a preload this only brings the inherited caches up to date; with
+    ``--no-preload`` (or ``--reload``) it does the whole warm-up.
+    """
+    from django.db import connections
+    from api.warmup import warm_up
+
+    warm_up()
+    # Requests run on other threads, which open their own connections
+    connections.close_all()
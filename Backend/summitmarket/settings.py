@@ -12,20 +12,16 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 import os
 import logging
+from corsheaders.defaults import default_headers
 from decouple import config
 from pathlib import Path
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
-
-logger.debug("Loading settings.py")
+# Set up logging. DEBUG also logs every SQL query when DEBUG is on, so it is opt-in.
+logging.basicConfig(level=config('LOG_LEVEL', default='INFO'))
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-logger.debug(f"BASE_DIR: {BASE_DIR}")
-
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -59,13 +55,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.SlowQueryMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middleware.CatalogSnapshotMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -147,6 +146,89 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Catalog snapshots (served by api.middleware.CatalogSnapshotMiddleware)
+CATALOG_SNAPSHOT_URL = '/snapshots/'
+CATALOG_SNAPSHOT_ROOT = os.path.join(BASE_DIR, 'snapshots')
+# Seconds of quiet after a product or category change before rebuilding
+CATALOG_SNAPSHOT_DEBOUNCE = config('CATALOG_SNAPSHOT_DEBOUNCE', default=30, cast=int)
+# Longest a rebuild waits after the first change when changes keep coming
+CATALOG_SNAPSHOT_MAX_DELAY = config('CATALOG_SNAPSHOT_MAX_DELAY', default=300, cast=int)
+# Number of snapshot versions kept on disk
+CATALOG_SNAPSHOT_KEEP = 3
+
+# Background jobs, run by the run_worker management command
+# Seconds before the first retry of a failed job, doubled on every retry
+JOB_RETRY_BASE_DELAY = config('JOB_RETRY_BASE_DELAY', default=10, cast=int)
+JOB_RETRY_MAX_DELAY = config('JOB_RETRY_MAX_DELAY', default=3600, cast=int)
+# Running jobs not finished after this many seconds are assumed lost
+JOB_LOCK_TIMEOUT = config('JOB_LOCK_TIMEOUT', default=600, cast=int)
+# Days finished jobs are kept before being pruned
+JOB_RETENTION_DAYS = 7
+
+# Frequently bought together products, counted from completed orders
+# Related products kept per product
+RELATED_PRODUCTS_TOP_K = 10
+# Seconds new orders are collected before they are counted in one batch
+RELATED_PRODUCTS_DELAY = config('RELATED_PRODUCTS_DELAY', default=60, cast=int)
+
+# Finished orders are moved to the archive tables by the archive_orders command
+# Days since their last change before delivered and cancelled orders are archived
+ORDER_ARCHIVE_AFTER_DAYS = config('ORDER_ARCHIVE_AFTER_DAYS', default=180, cast=int)
+# Orders moved per transaction
+ORDER_ARCHIVE_BATCH_SIZE = config('ORDER_ARCHIVE_BATCH_SIZE', default=500, cast=int)
+
+# Carts untouched for this many days are deleted by the hourly cleanup job
+CART_EXPIRY_DAYS = config('CART_EXPIRY_DAYS', default=30, cast=int)
+# Carts deleted, or duplicate lines merged, per transaction
+CART_CLEANUP_BATCH_SIZE = config('CART_CLEANUP_BATCH_SIZE', default=100, cast=int)
+# Batches per step and run; the rest waits for the next run
+CART_CLEANUP_MAX_BATCHES = config('CART_CLEANUP_MAX_BATCHES', default=50, cast=int)
+# Seconds between batches, so requests get the write lock in between
+CART_CLEANUP_PAUSE = config('CART_CLEANUP_PAUSE', default=0.2, cast=float)
+
+# POST /api/batch/ runs several GET requests in one
+# Sub-requests accepted per batch
+BATCH_MAX_REQUESTS = config('BATCH_MAX_REQUESTS', default=20, cast=int)
+# Threads used when a batch asks for "parallel"; each opens its own database connection
+BATCH_MAX_WORKERS = config('BATCH_MAX_WORKERS', default=4, cast=int)
+
+# Conditional saves of products and orders (see api.concurrency)
+# Attempts at a commutative change, such as a stock delta, before answering 409
+OPTIMISTIC_LOCK_RETRIES = config('OPTIMISTIC_LOCK_RETRIES', default=5, cast=int)
+
+# Server-sent event streams (run under ASGI)
+# Seconds between heartbeat comments on an idle stream
+EVENT_STREAM_HEARTBEAT = 15
+# Reconnect delay suggested to clients, in milliseconds
+EVENT_STREAM_RETRY_MS = 3000
+# Seconds a stream stays open before the client is made to reconnect
+EVENT_STREAM_MAX_AGE = config('EVENT_STREAM_MAX_AGE', default=300, cast=int)
+# Seconds events are kept for Last-Event-ID replay
+EVENT_STREAM_RETENTION = 86400
+
+# Request profiles taken for staff with ?_profile=cprofile|sample or X-Profile
+# Number of profiles kept, newest first
+PROFILE_KEEP = config('PROFILE_KEEP', default=50, cast=int)
+
+# Queries taking at least this many milliseconds are logged to SlowQuery; 0 turns it off
+SLOW_QUERY_THRESHOLD_MS = config('SLOW_QUERY_THRESHOLD_MS', default=500, cast=float)
+
+# Prometheus metrics served at /metrics
+# Directory shared by every worker process; each keeps its counters in one file here
+METRICS_DIR = config('METRICS_DIR', default=os.path.join(BASE_DIR, 'metrics'))
+# When set, scrapes must send "Authorization: Bearer <token>"
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Test runs write their metrics and throttle state to a temporary directory instead
+TEST_RUNNER = 'api.test_runner.TestRunner'
+
+# Idempotency-Key support for checkout, payment and cart changes
+# Seconds a stored response is replayed for
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+# Seconds a duplicate waits for the original request before giving up with 409
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+# Keys still in progress after this many seconds are assumed abandoned
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -164,13 +246,35 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'UNAUTHENTICATED_USER': None,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.AnonRateThrottle',
+        'api.throttling.UserRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': config('THROTTLE_RATE_ANON', default='300/min'),
+        'user': config('THROTTLE_RATE_USER', default='1200/min'),
+        'login': config('THROTTLE_RATE_LOGIN', default='10/min'),
+        'search': config('THROTTLE_RATE_SEARCH', default='60/min'),
+    },
+    # Proxies in front of the app; clients are identified by the address the
+    # last of them saw. With 0, X-Forwarded-For is ignored.
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
 }
 
+# Rate limit state, shared by all worker processes on this host
+THROTTLE_STORE = config('THROTTLE_STORE', default=os.path.join(BASE_DIR, 'throttle.sqlite3'))
+
+# Product listing facets: ascending bucket boundaries, the last bucket is open-ended
+PRODUCT_PRICE_BUCKETS = [0, 25, 50, 100, 250, 500, 1000]
+PRODUCT_DISCOUNT_BUCKETS = [0, 1, 10, 25, 50]
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key', 'x-profile', 'if-match')
+CORS_EXPOSE_HEADERS = ['X-Profile-Id', 'ETag', 'Search-Partial']
 
 # Custom user model (if needed)
 # AUTH_USER_MODEL = 'api.CustomUser'
@@ -178,5 +282,3 @@ CORS_ALLOWED_ORIGINS = [
 # Stripe settings
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
-
-logger.debug("Settings loaded successfully")
\ No newline at end of file
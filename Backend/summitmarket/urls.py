@@ -17,11 +17,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from api.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('api/admin/', include('api.admin_urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Serve media files in development
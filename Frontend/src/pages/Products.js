@@ -109,8 +109,8 @@ const Products = () => {
                 <label htmlFor="sort">Sort by:</label>
                 <select id="sort" value={sortBy} onChange={handleSortChange}>
                   <option value="">Default</option>
-                  <option value="price">Price: Low to High</option>
-                  <option value="-price">Price: High to Low</option>
+                  <option value="discounted_price">Price: Low to High</option>
+                  <option value="-discounted_price">Price: High to Low</option>
                   <option value="name">Name: A to Z</option>
                   <option value="-name">Name: Z to A</option>
                   <option value="-created_at">Newest First</option>
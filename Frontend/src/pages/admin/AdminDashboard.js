@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { getDashboardStats, getSalesReport } from '../../services/adminApi';
+import { getDashboardStats, getSalesReport, subscribeToDashboard } from '../../services/adminApi';
 import { toast } from 'react-toastify';
 import Loading from '../../components/layout/Loading';
 import './AdminDashboard.css';
@@ -11,14 +11,21 @@ const AdminDashboard = () => {
   const [reportLoading, setReportLoading] = useState(false);
 
   useEffect(() => {
-    fetchStats();
+    let source;
+    fetchStats().then((lastEventId) => {
+      if (lastEventId !== undefined) {
+        source = subscribeToDashboard(lastEventId, applyDashboardEvent);
+      }
+    });
     fetchSalesReport();
+    return () => source && source.close();
   }, []);
 
   const fetchStats = async () => {
     try {
       const response = await getDashboardStats();
       setStats(response.data);
+      return response.data.last_event_id;
     } catch (error) {
       console.error('Error fetching stats:', error);
       toast.error('Failed to load dashboard statistics');
@@ -27,6 +34,22 @@ const AdminDashboard = () => {
     }
   };
 
+  // The server sends each change once as deltas, so the stats are never reloaded
+  const applyDashboardEvent = (event) => {
+    setStats((current) => {
+      const next = { ...current };
+      Object.entries(event.deltas).forEach(([name, delta]) => {
+        if (name in next) {
+          next[name] = parseFloat(next[name] || 0) + parseFloat(delta);
+        }
+      });
+      return next;
+    });
+    (event.low_stock || []).forEach((product) => {
+      toast.warning(`Low stock: ${product.name} (${product.stock} left)`);
+    });
+  };
+
   const fetchSalesReport = async () => {
     try {
       setReportLoading(true);
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { getOrders, updateOrderStatus, deleteOrder } from '../../services/adminApi';
+import { getOrders, getOrder, updateOrderStatus, deleteOrder, isEditConflict } from '../../services/adminApi';
 import { toast } from 'react-toastify';
 import Loading from '../../components/layout/Loading';
 import './AdminOrders.css';
@@ -31,13 +31,29 @@ const AdminOrders = () => {
     }
   };
 
-  const handleStatusUpdate = async (orderId, newStatus) => {
+  const reloadAfterConflict = () => {
+    toast.error('This order was changed by someone else. The list has been reloaded; please try again.');
+    fetchOrders();
+  };
+
+  const handleStatusUpdate = async (order, newStatus) => {
     try {
-      await updateOrderStatus(orderId, newStatus);
+      // The list carries no ETags: read the order's, and only go ahead if
+      // the status is still the one shown
+      const current = await getOrder(order.id);
+      if (current.data.status !== order.status) {
+        reloadAfterConflict();
+        return;
+      }
+      await updateOrderStatus(order.id, newStatus, current.headers.etag);
       toast.success('Order status updated successfully');
       fetchOrders();
       setSelectedOrder(null);
     } catch (error) {
+      if (isEditConflict(error)) {
+        reloadAfterConflict();
+        return;
+      }
       console.error('Error updating order status:', error);
       toast.error('Failed to update order status');
     }
@@ -120,7 +136,7 @@ const AdminOrders = () => {
                     <select
                       className={`status-select ${order.status}`}
                       value={order.status}
-                      onChange={(e) => handleStatusUpdate(order.id, e.target.value)}
+                      onChange={(e) => handleStatusUpdate(order, e.target.value)}
                     >
                       {statusOptions.map((option) => (
                         <option key={option.value} value={option.value}>
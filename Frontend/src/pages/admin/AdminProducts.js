@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { getProducts, deleteProduct, updateProductStock, getCategories } from '../../services/adminApi';
+import { getProducts, getProduct, deleteProduct, updateProductStock, getCategories, isEditConflict } from '../../services/adminApi';
 import { toast } from 'react-toastify';
 import { Link } from 'react-router-dom';
 import Loading from '../../components/layout/Loading';
@@ -60,14 +60,28 @@ const AdminProducts = () => {
     }
   };
 
-  const handleStockUpdate = async (productId, currentStock) => {
-    const newStock = prompt('Enter new stock quantity:', currentStock);
+  const handleStockUpdate = async (productId) => {
+    let current;
+    try {
+      // Read the current stock and its ETag rather than trusting the list
+      current = await getProduct(productId);
+    } catch (error) {
+      console.error('Error fetching product:', error);
+      toast.error('Failed to load product');
+      return;
+    }
+    const newStock = prompt('Enter new stock quantity:', current.data.stock);
     if (newStock !== null && !isNaN(newStock)) {
       try {
-        await updateProductStock(productId, parseInt(newStock));
+        await updateProductStock(productId, parseInt(newStock), current.headers.etag);
         toast.success('Stock updated successfully');
         fetchProducts();
       } catch (error) {
+        if (isEditConflict(error)) {
+          toast.error('The stock was changed by someone else in the meantime. Please try again.');
+          fetchProducts();
+          return;
+        }
         console.error('Error updating stock:', error);
         toast.error('Failed to update stock');
       }
@@ -156,7 +170,7 @@ const AdminProducts = () => {
               <div className="product-actions">
                 <button
                   className="btn-edit"
-                  onClick={() => handleStockUpdate(product.id, product.stock)}
+                  onClick={() => handleStockUpdate(product.id)}
                   title="Update Stock"
                 >
                   <i className="fas fa-boxes"></i>
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate, useParams } from 'react-router-dom';
-import { getProduct, createProduct, updateProduct, getCategories } from '../../services/adminApi';
+import { getProduct, createProduct, updateProduct, getCategories, isEditConflict } from '../../services/adminApi';
 import { toast } from 'react-toastify';
 import Loading from '../../components/layout/Loading';
 import './ProductForm.css';
@@ -14,6 +14,7 @@ const ProductForm = () => {
   const [submitting, setSubmitting] = useState(false);
   const [categories, setCategories] = useState([]);
   const [imagePreview, setImagePreview] = useState(null);
+  const [etag, setEtag] = useState(null);
   
   const [formData, setFormData] = useState({
     name: '',
@@ -46,6 +47,7 @@ const ProductForm = () => {
     try {
       const response = await getProduct(id);
       const product = response.data;
+      setEtag(response.headers.etag);
       setFormData({
         name: product.name,
         description: product.description,
@@ -122,7 +124,7 @@ const ProductForm = () => {
       }
 
       if (isEditMode) {
-        await updateProduct(id, submitData);
+        await updateProduct(id, submitData, etag);
         toast.success('Product updated successfully');
       } else {
         await createProduct(submitData);
@@ -131,6 +133,11 @@ const ProductForm = () => {
       
       navigate('/dashboard/products');
     } catch (error) {
+      if (isEditConflict(error)) {
+        toast.error('This product was changed by someone else. The latest version has been loaded; please redo your changes.');
+        fetchProduct();
+        return;
+      }
       console.error('Error saving product:', error);
       toast.error(error.response?.data?.message || 'Failed to save product');
     } finally {
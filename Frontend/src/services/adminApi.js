@@ -21,9 +21,23 @@ adminApi.interceptors.request.use(
   }
 );
 
+// Product and order reads return an ETag; send it back with a change so the
+// change fails with 412 if someone else saved the row in between
+const ifMatch = (etag) => (etag ? { 'If-Match': etag } : {});
+export const isEditConflict = (error) => error.response?.status === 412;
+
 // Dashboard Stats
 export const getDashboardStats = () => adminApi.get('/stats/');
 
+// Live deltas to the dashboard stats, resuming after the stats' last_event_id. Call close() when done
+export const subscribeToDashboard = (lastEventId, onEvent) => {
+  const token = localStorage.getItem('token');
+  const params = new URLSearchParams({ token, last_event_id: lastEventId });
+  const source = new EventSource(`${API_URL}/admin/stats/events/?${params}`);
+  source.onmessage = (event) => onEvent(JSON.parse(event.data));
+  return source;
+};
+
 // Sales Report
 export const getSalesReport = (params) => adminApi.get('/sales-report/', { params });
 
@@ -77,7 +91,7 @@ export const createProduct = (data) => {
     headers: { 'Content-Type': 'multipart/form-data' }
   });
 };
-export const updateProduct = (id, data) => {
+export const updateProduct = (id, data, etag) => {
   const formData = new FormData();
   Object.keys(data).forEach(key => {
     if (data[key] !== null && data[key] !== undefined) {
@@ -85,19 +99,24 @@ export const updateProduct = (id, data) => {
     }
   });
   return adminApi.put(`/products/${id}/`, formData, {
-    headers: { 'Content-Type': 'multipart/form-data' }
+    headers: { 'Content-Type': 'multipart/form-data', ...ifMatch(etag) }
   });
 };
 export const deleteProduct = (id) => adminApi.delete(`/products/${id}/`);
-export const updateProductStock = (id, stock) => 
-  adminApi.post(`/products/${id}/update_stock/`, { stock });
+export const updateProductStock = (id, stock, etag) => 
+  adminApi.post(`/products/${id}/update_stock/`, { stock }, { headers: ifMatch(etag) });
+// data: { ids } or { filter }, plus stock, stock_delta and/or discount_percent
+export const bulkUpdateProducts = (data) => adminApi.post('/products/bulk_update/', data);
 
 // Order Management
 export const getOrders = (params) => adminApi.get('/orders/', { params });
 export const getOrder = (id) => adminApi.get(`/orders/${id}/`);
-export const updateOrder = (id, data) => adminApi.put(`/orders/${id}/`, data);
+export const updateOrder = (id, data, etag) =>
+  adminApi.put(`/orders/${id}/`, data, { headers: ifMatch(etag) });
 export const deleteOrder = (id) => adminApi.delete(`/orders/${id}/`);
-export const updateOrderStatus = (id, status) => 
-  adminApi.post(`/orders/${id}/update_status/`, { status });
+export const updateOrderStatus = (id, status, etag) => 
+  adminApi.post(`/orders/${id}/update_status/`, { status }, { headers: ifMatch(etag) });
+// data: { ids } or { filter }, plus status and/or tracking_number
+export const bulkUpdateOrders = (data) => adminApi.post('/orders/bulk_update/', data);
 
 export default adminApi;
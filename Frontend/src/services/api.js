@@ -89,10 +89,20 @@ export const productService = {
     return response.data;
   },
 
+  getRelatedProducts: async (id) => {
+    const response = await api.get(`/products/${id}/related/`);
+    return response.data;
+  },
+
   getCategories: async () => {
     const response = await api.get('/categories/');
     return response.data;
   },
+
+  getFacets: async (params = {}) => {
+    const response = await api.get('/products/facets/', { params });
+    return response.data;
+  },
 };
 
 // Cart Services
@@ -133,15 +143,28 @@ export const orderService = {
     return response.data;
   },
 
-  createOrder: async (orderData) => {
-    const response = await api.post('/orders/create/', orderData);
+  // Pass the same idempotencyKey when retrying so the order is only placed once
+  createOrder: async (orderData, idempotencyKey) => {
+    const response = await api.post('/orders/create/', orderData, {
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {},
+    });
     return response.data;
   },
 
-  processPayment: async (orderId, paymentData) => {
-    const response = await api.post(`/orders/${orderId}/payment/`, paymentData);
+  processPayment: async (orderId, paymentData, idempotencyKey) => {
+    const response = await api.post(`/orders/${orderId}/payment/`, paymentData, {
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {},
+    });
     return response.data;
   },
+
+  // Live order updates; EventSource reconnects and resumes by itself. Call close() when done
+  subscribeToOrders: (onUpdate) => {
+    const token = localStorage.getItem('token');
+    const source = new EventSource(`${API_BASE_URL}/orders/events/?token=${encodeURIComponent(token)}`);
+    source.onmessage = (event) => onUpdate(JSON.parse(event.data));
+    return source;
+  },
 };
 
 export default api;